@@ -1,8 +1,33 @@
 import streamlit as st
-import subprocess
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import json
+import os
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Optional, Generator
+from typing import Dict, Optional
+from ollama_client import OllamaError, DEFAULT_OLLAMA_URL
+from backend_pool import BackendPool
+from context_builder import build_context, describe_stats, CHARS_PER_TOKEN, DEFAULT_CONTEXT_LENGTH
+from code_index import CodeIndex, select_context
+from file_store import FileStore, IngestError
+from conversation_store import ConversationStore, PAGE_SIZE
+from response_cache import ResponseCache, cache_key, CACHE_MAX_TEMPERATURE
+from stream_renderer import StreamRenderer
+from generation_registry import GenerationRegistry
+from generation_engine import GenerationEngine, GenerationJob
+from scheduler import RequestScheduler, QueueFull, MAX_CONCURRENT_PER_MODEL
+from batch_review import BatchReview, unit_label, DEFAULT_WORKERS
+from cli_worker import CliWorker
+from model_manager import ModelManager
+from metrics import MetricsRecorder, METRICS
+from prefetch import Prefetcher
+from request_coalescer import RequestCoalescer
+from model_router import ModelRouter
+from memory_manager import SessionMemory, deep_size
+from static_analysis import StaticAnalyzer, format_hints, format_report, is_blocking
+from file_revisions import revision_content, revision_notes_key, review_notes, review_targets, MAX_VERSIONS
+from response_pipeline import stream_ollama_response, QUEUE_POLL_INTERVAL
 
 # Page configuration
 st.set_page_config(
@@ -91,6 +116,27 @@ st.markdown("""
 
 # Constants
 MODEL_NAME = "qwen2.5-coder:3b"
+# Comma-separated list of Ollama servers to spread requests over
+OLLAMA_HOSTS = [url.strip() for url in os.environ.get("OLLAMA_HOSTS", DEFAULT_OLLAMA_URL).split(",") if url.strip()]
+RESUME_MESSAGES = 40  # Tail of a stored conversation loaded on resume
+MAX_LOADED_MESSAGES = 200  # Older messages stay in the conversation store only
+BATCH_PRIORITY = 1  # Batch reviews yield the model to interactive chat requests
+ANALYZE_PROMPT = "Analyze the uploaded code: explain what it does, point out bugs and suggest improvements."
+WHOLE_FILE_PROMPTS = {ANALYZE_PROMPT}  # About all of the code, never answered from retrieved chunks
+CONTINUE_PROMPT = "Please continue."
+STATS_REFRESH = 5  # Seconds between refreshes of the sidebar stats panel
+PREVIEW_CHARS = 500
+UPLOAD_TYPES = [
+    "txt", "py", "js", "java", "cpp", "c", "cs",
+    "html", "css", "md", "json", "xml", "yaml",
+    "yml", "go", "rs", "rb", "php", "sql", "ts"
+]
+LANGUAGES = {
+    'py': 'python', 'js': 'javascript', 'java': 'java',
+    'cpp': 'cpp', 'c': 'c', 'html': 'html', 'css': 'css',
+    'md': 'markdown', 'json': 'json', 'xml': 'xml',
+    'yaml': 'yaml', 'yml': 'yaml', 'txt': 'text'
+}
 DEFAULT_SYSTEM_PROMPT = """You are an AI programming tutor for beginners. Follow these guidelines:
 
 1. **Clarity**: Explain concepts in simple, easy-to-understand language
@@ -108,12 +154,26 @@ if "system_prompt" not in st.session_state:
     st.session_state.system_prompt = DEFAULT_SYSTEM_PROMPT
 if "model_name" not in st.session_state:
     st.session_state.model_name = MODEL_NAME
+if "model_pinned" not in st.session_state:
+    # Unpinned, the router picks a model per request and model_name is only the fallback
+    st.session_state.model_pinned = False
 if "uploaded_files" not in st.session_state:
+    # References into the shared file store, bodies are loaded on demand
     st.session_state.uploaded_files = []
+if "ingested_uploads" not in st.session_state:
+    st.session_state.ingested_uploads = set()
+if "file_versions" not in st.session_state:
+    # File name -> content hashes of its uploads, oldest first
+    st.session_state.file_versions = {}
+if "review_notes" not in st.session_state:
+    # Content hash -> key of the notes of the last review of that revision in the session memory
+    st.session_state.review_notes = {}
 if "temperature" not in st.session_state:
     st.session_state.temperature = 0.7
 if "max_tokens" not in st.session_state:
     st.session_state.max_tokens = 2048
+if "context_length" not in st.session_state:
+    st.session_state.context_length = DEFAULT_CONTEXT_LENGTH
 if "response_in_progress" not in st.session_state:
     st.session_state.response_in_progress = False
 if "file_history" not in st.session_state:
@@ -122,68 +182,233 @@ if "connection_checked" not in st.session_state:
     st.session_state.connection_checked = False
 if "ollama_status" not in st.session_state:
     st.session_state.ollama_status = {}
+if "last_response_stats" not in st.session_state:
+    st.session_state.last_response_stats = {}
+if "last_context_stats" not in st.session_state:
+    st.session_state.last_context_stats = {}
+if "use_cache" not in st.session_state:
+    st.session_state.use_cache = True
 
-def check_ollama_status() -> Dict:
-    """Check if Ollama is running and models are available"""
-    status = {
-        "installed": False, 
-        "running": False, 
-        "model_available": False,
-        "available_models": []
-    }
+@st.cache_resource
+def get_backend_pool() -> BackendPool:
+    """Ollama servers with keep-alive pools and health monitors, shared by all sessions"""
+    return BackendPool(OLLAMA_HOSTS)
+
+@st.cache_resource
+def get_file_store() -> FileStore:
+    """Content-addressed store of uploaded file bodies, shared by all sessions"""
+    return FileStore()
+
+def load_file(file_ref: Dict) -> str:
+    """Body of an attached file, read lazily from the file store"""
+    return get_file_store().load(file_ref["sha256"])
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def file_preview(sha256: str) -> str:
+    """Head of a stored file for display, read once per content for all sessions"""
+    content = get_file_store().load(sha256)
+    return content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
+
+def new_code_index() -> CodeIndex:
+    return CodeIndex(loader=get_file_store().load)
+
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Persistent chat history of all sessions"""
+    return ConversationStore()
+
+def get_session_id() -> str:
+    """Id of the browser session running this script"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+def is_session_active(session_id: str) -> bool:
+    """Whether a browser session is still connected to this server"""
+    from streamlit.runtime import Runtime
+    return Runtime.instance().is_active_session(session_id)
+
+@st.cache_resource
+def get_session_memory() -> SessionMemory:
+    """Compact message bodies, code indexes and memory accounting of all sessions"""
+    return SessionMemory(is_session_active=is_session_active)
+
+def store_text(text: str) -> str:
+    """Keep a body in the shared compressed payload store, returning its key"""
+    return get_session_memory().put(get_session_id(), text)
+
+def load_text(key: str) -> str:
+    return get_session_memory().get(key)
+
+def compact_message(message: Dict) -> Dict:
+    """Chat message whose body lives in the payload store"""
+    return {"seq": message["seq"], "role": message["role"], "ref": store_text(message["content"])}
+
+def get_code_index() -> CodeIndex:
+    """This session's retrieval index, built again if the memory manager dropped it"""
+    return get_session_memory().index(get_session_id(), build_code_index)
+
+def build_code_index() -> CodeIndex:
+    index = new_code_index()
+    for file_ref in st.session_state.uploaded_files:
+        index.add_file(file_ref["name"], load_file(file_ref), ref=file_ref["sha256"])
+    return index
+
+def track_session_memory():
+    """Measure this session and let the memory manager spill idle ones"""
+    keys = [m["ref"] for m in st.session_state.messages] + list(st.session_state.review_notes.values())
+    state = {key: st.session_state[key] for key in st.session_state.keys()}
+    get_session_memory().touch(get_session_id(), keys, deep_size(state))
+
+def resume_conversation(conversation_id: Optional[str]):
+    """Load the tail of a stored conversation, e.g. after a reload or server restart"""
+    store = get_conversation_store()
+    if conversation_id and store.exists(conversation_id):
+        st.session_state.conversation_id = conversation_id
+        st.session_state.messages = [compact_message(m) for m in store.page(conversation_id, limit=RESUME_MESSAGES)]
+
+def add_message(role: str, content: str):
+    """Append a message to the chat history and the conversation store"""
+    store = get_conversation_store()
+    if st.session_state.conversation_id is None:
+        # Conversations are only stored once they have a message
+        st.session_state.conversation_id = store.create(st.session_state.model_name)
+        st.query_params["c"] = st.session_state.conversation_id
     
-    try:
-        # Check if ollama command exists
-        result = subprocess.run(["ollama", "--version"], capture_output=True, text=True)
-        status["installed"] = result.returncode == 0
-        if status["installed"]:
-            status["version"] = result.stdout.strip()
-        else:
-            status["error"] = "Ollama not found. Please install from https://ollama.com"
-            return status
-        
-        # Check if ollama is running
-        list_result = subprocess.run(
-            ["ollama", "list"], 
-            capture_output=True, 
-            text=True, 
-            timeout=10
+    seq = store.append(st.session_state.conversation_id, role, content)
+    st.session_state.messages.append(compact_message({"seq": seq, "role": role, "content": content}))
+    if len(st.session_state.messages) > MAX_LOADED_MESSAGES:
+        del st.session_state.messages[:-MAX_LOADED_MESSAGES]
+
+def load_older_messages():
+    """Show one more page of history, reading it from the store if needed"""
+    st.session_state.visible_messages += PAGE_SIZE
+    messages = st.session_state.messages
+    missing = st.session_state.visible_messages - len(messages)
+    if missing > 0 and messages and st.session_state.conversation_id:
+        older = get_conversation_store().page(
+            st.session_state.conversation_id, before_seq=messages[0]["seq"], limit=missing
         )
-        status["running"] = list_result.returncode == 0
-        
-        if status["running"]:
-            # Parse available models
-            lines = list_result.stdout.strip().split('\n')
-            models = []
-            for line in lines[1:]:  # Skip header
-                if line.strip():
-                    parts = line.split()
-                    if parts:
-                        models.append(parts[0])
-            
-            status["available_models"] = models
-            
-            # Check if current model is available
-            if st.session_state.model_name in models:
-                status["model_available"] = True
-            elif models:
-                # If current model not available, switch to first available model
-                st.session_state.model_name = models[0]
-                status["model_available"] = True
-                status["model_switched"] = f"Switched to {models[0]}"
-            else:
-                status["model_available"] = False
-                status["warning"] = "No models found. Run: `ollama pull llama2`"
+        st.session_state.messages = [compact_message(m) for m in older] + messages
+
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = None
+    st.session_state.visible_messages = PAGE_SIZE
+    resume_conversation(st.query_params.get("c"))
+track_session_memory()
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """On-disk cache of completed answers, shared by all sessions"""
+    return ResponseCache()
+
+@st.cache_resource
+def get_generation_registry() -> GenerationRegistry:
+    """Active generations of all sessions, torn down on cancel or disconnect"""
+    return GenerationRegistry(is_session_active)
+
+@st.cache_resource
+def get_generation_engine() -> GenerationEngine:
+    """Background generations of all sessions, outliving the script runs that show them"""
+    return GenerationEngine(get_generation_registry(), get_metrics())
+
+@st.cache_resource
+def get_scheduler() -> RequestScheduler:
+    """Concurrency gate and fair queue in front of Ollama, shared by all sessions"""
+    return RequestScheduler(max_concurrent=MAX_CONCURRENT_PER_MODEL, backends=get_backend_pool().serving)
+
+@st.cache_resource
+def get_model_manager() -> ModelManager:
+    """Preloading and keep-alive of models on the backends"""
+    return ModelManager(get_backend_pool())
+
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    """Per-request model choice and the model speeds it learned, shared by all sessions"""
+    return ModelRouter()
+
+@st.cache_resource
+def get_metrics() -> MetricsRecorder:
+    """Per-request timings of all sessions"""
+    return MetricsRecorder()
+
+@st.cache_resource
+def get_coalescer() -> RequestCoalescer:
+    """Generations in flight that identical deterministic requests of other sessions can join"""
+    return RequestCoalescer()
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    """Answers generated ahead of time while the backends are idle"""
+    return Prefetcher(get_backend_pool())
+
+@st.cache_resource
+def get_static_analyzer() -> StaticAnalyzer:
+    """Deterministic checks of uploads in worker processes, shared by all sessions"""
+    return StaticAnalyzer()
+
+def static_findings() -> list:
+    """Static analysis findings of the attached files, by file name"""
+    analyzer = get_static_analyzer()
+    results = []
+    for file_ref in st.session_state.uploaded_files:
+        # Files attached before a restart are analyzed on first use
+        findings = analyzer.findings(file_ref["name"], file_ref["sha256"], lambda f=file_ref: load_file(f))
+        if findings:
+            results.append((file_ref["name"], findings))
+    return results
+
+def backend_idle() -> bool:
+    """True when no session is generating, waiting for a slot or prefetching"""
+    queue_stats = get_scheduler().stats()
+    return (not queue_stats["running"] and not queue_stats["queue_depth"]
+            and not get_generation_registry().stats()["active"]
+            and not get_prefetcher().stats()["active"])
+
+@st.cache_resource
+def get_cli_worker() -> CliWorker:
+    """Warm ollama run processes for the CLI fallback"""
+    return CliWorker()
+
+@contextmanager
+def scheduled_slot(scheduler: RequestScheduler, session_id: str, model: str, priority: int):
+    """Hold a generation slot of the shared scheduler, waiting while the queue is full"""
+    while True:
+        try:
+            ticket = scheduler.submit(session_id, model, priority=priority)
+            break
+        except QueueFull:
+            time.sleep(QUEUE_POLL_INTERVAL)
+    try:
+        scheduler.wait(ticket)
+        yield
+    finally:
+        scheduler.release(ticket)
+
+def cancel_generation():
+    """Tear down the in-flight generation of this conversation"""
+    get_generation_engine().cancel(st.session_state.conversation_id, "user")
+
+def check_ollama_status(force: bool = False) -> Dict:
+    """Check if Ollama is running and models are available"""
+    # Shared cached status, probed over HTTP by the background monitors
+    status = get_backend_pool().status(force)
+    status["model_available"] = False
+    
+    if status.get("running"):
+        models = status["available_models"]
         
+        # Check if current model is available
+        if st.session_state.model_name in models:
+            status["model_available"] = True
+        elif models:
+            # If current model not available, switch to one that is already loaded if possible
+            resident = [m for m in status.get("loaded_models", []) if m in models]
+            fallback = resident[0] if resident else models[0]
+            st.session_state.model_name = fallback
+            status["model_available"] = True
+            status["model_switched"] = f"Switched to {fallback}"
         else:
-            status["error"] = "Ollama service not running. Start with: `ollama serve`"
-    
-    except subprocess.TimeoutExpired:
-        status["error"] = "Ollama connection timeout. Make sure Ollama is running."
-    except FileNotFoundError:
-        status["error"] = "Ollama not installed. Download from https://ollama.com"
-    except Exception as e:
-        status["error"] = f"Unexpected error: {str(e)}"
+            status["warning"] = "No models found. Run: `ollama pull llama2`"
     
     # Store in session state
     st.session_state.ollama_status = status
@@ -191,179 +416,279 @@ def check_ollama_status() -> Dict:
     
     return status
 
-def generate_ollama_response_api(prompt: str, system_prompt: str = None) -> Generator[str, None, None]:
-    """Generate response from Ollama using HTTP API"""
+@st.cache_data(ttl=600, show_spinner=False)
+def get_model_context_length(model_name: str) -> Optional[int]:
+    """Trained context length of a model as reported by /api/show"""
     try:
-        # Build the messages in Ollama format
-        messages = []
-        
-        # Add system prompt if provided
-        if system_prompt and system_prompt.strip():
-            messages.append({"role": "system", "content": system_prompt})
-        
-        # Add recent conversation history (last 3 exchanges)
-        history_messages = st.session_state.messages[-6:] if len(st.session_state.messages) > 6 else st.session_state.messages
-        for msg in history_messages:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add current user prompt
-        messages.append({"role": "user", "content": prompt})
-        
-        # Create the request payload
-        request_data = {
-            "model": st.session_state.model_name,
-            "messages": messages,
-            "stream": True,
-            "options": {
-                "temperature": st.session_state.temperature,
-                "num_predict": st.session_state.max_tokens
-            }
-        }
-        
-        # Use curl to call Ollama's API endpoint
-        curl_command = [
-            "curl", "-s", "-N",  # -N for no buffering
-            "-X", "POST", 
-            "http://localhost:11434/api/chat",
-            "-H", "Content-Type: application/json",
-            "-d", json.dumps(request_data)
-        ]
-        
-        # Start the subprocess
-        process = subprocess.Popen(
-            curl_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Read and parse the streaming response
-        buffer = ""
-        while True:
-            char = process.stdout.read(1)
-            if not char:
-                break
-                
-            buffer += char
-            
-            # Try to parse complete JSON lines
-            if char == '\n' and buffer.strip():
-                try:
-                    line = buffer.strip()
-                    if line:
-                        response_chunk = json.loads(line)
-                        if "message" in response_chunk and "content" in response_chunk["message"]:
-                            yield response_chunk["message"]["content"]
-                        elif "response" in response_chunk:
-                            yield response_chunk["response"]
-                except json.JSONDecodeError:
-                    # Sometimes we get partial JSON, continue buffering
-                    continue
-                finally:
-                    buffer = ""
-        
-        # Check for errors
-        if process.poll() is not None and process.returncode != 0:
-            error = process.stderr.read()
-            if error:
-                yield f"\n\n**Error in API call:** {error}"
+        info = get_backend_pool().client_for(model_name).request_json("POST", "/api/show", {"model": model_name}, timeout=5)
+    except OllamaError:
+        return None
+    for key, value in info.get("model_info", {}).items():
+        if key.endswith(".context_length"):
+            return int(value)
+    return None
+
+def effective_context_length(model: Optional[str] = None) -> int:
+    """Configured context window, capped by what the model supports"""
+    model_limit = get_model_context_length(model or st.session_state.model_name)
+    if model_limit:
+        return min(st.session_state.context_length, model_limit)
+    return st.session_state.context_length
+
+def file_revision(file_ref: Dict) -> Optional[str]:
+    """Changed hunks and review notes of a re-uploaded file whose previous revision was reviewed
+
+    Only until the new revision has notes of its own, after that the file is
+    sent whole or as chunks like any other.
+    """
+    notes_key = revision_notes_key(file_ref, st.session_state.review_notes)
+    if not notes_key:
+        return None
+    previous = get_file_store().load(file_ref["previous"])
+    return revision_content(previous, load_file(file_ref), file_ref["revision"], load_text(notes_key))
+
+def record_review(answer: str, prompt: str):
+    """Keep an answer as the review notes of the attached revisions"""
+    # Analyze Code answers are reviews, other answers only stand in until there is one
+    targets = review_targets(st.session_state.uploaded_files, st.session_state.review_notes,
+                             review=prompt == ANALYZE_PROMPT)
+    if targets:
+        notes_key = store_text(review_notes(answer))
+        for file_ref in targets:
+            st.session_state.review_notes[file_ref["sha256"]] = notes_key
+
+def select_attachments(prompt: str, history: list):
+    """Whole files when they are small or the prompt is about all of them, otherwise relevant chunks"""
+    files = st.session_state.uploaded_files
+    revisions = [file_revision(f) for f in files]
+    attachments = [{"name": f["name"], "content": revision or load_file(f)} for f, revision in zip(files, revisions)]
     
-    except Exception as e:
-        yield f"**Error in API method:** {str(e)}"
+    # Follow-up questions often lean on the previous question for their subject
+    query = prompt
+    previous = [m["content"] for m in history if m["role"] == "user"]
+    if previous:
+        query += "\n" + previous[-1]
+    
+    chunks, retrieval = select_context(get_code_index(), attachments, query,
+                                       whole_files=prompt in WHOLE_FILE_PROMPTS)
+    if retrieval:
+        # What changed in a reviewed file matters whatever the question
+        for file_ref, revision in zip(files, revisions):
+            if revision:
+                chunks.insert(0, {"name": f"{file_ref['name']} (changes)", "content": revision})
+        retrieval["chunks"] = len(chunks)
+    return chunks, retrieval
 
-def generate_ollama_response_cli(prompt: str, system_prompt: str = None) -> Generator[str, None, None]:
-    """Generate response using direct ollama run command"""
-    try:
-        # Build the full prompt
-        if system_prompt and system_prompt.strip():
-            full_prompt = f"System: {system_prompt}\n\nUser: {prompt}\n\nAssistant:"
-        else:
-            full_prompt = f"User: {prompt}\n\nAssistant:"
-        
-        # Run ollama with timeout
-        cmd = ["ollama", "run", st.session_state.model_name]
-        
-        process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Write prompt and close stdin
-        process.stdin.write(full_prompt)
-        process.stdin.flush()
-        process.stdin.close()
-        
-        # Read output in real-time
-        while True:
-            output = process.stdout.read(1024)
-            if output:
-                yield output
-            
-            # Check if process has ended
-            if process.poll() is not None:
-                # Read any remaining output
-                remaining = process.stdout.read()
-                if remaining:
-                    yield remaining
-                break
-        
-        # Check for errors
-        if process.returncode != 0:
-            error = process.stderr.read()
-            if error:
-                yield f"\n\n**Error in CLI call:** {error}"
-                
-    except Exception as e:
-        yield f"**Error in CLI method:** {str(e)}"
+def build_chat_messages(prompt: str, system_prompt: str = None, model: Optional[str] = None) -> list:
+    """Pack system prompt, history and attachments into the context window of the model that answers"""
+    history = [dict(m, content=load_text(m["ref"])) for m in st.session_state.messages]
+    # The current prompt is already in the history for display, don't send it twice
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == prompt:
+        history = history[:-1]
+    
+    # Findings depend only on the files, so they join the stable leading message
+    findings = static_findings()
+    hints = format_hints(findings)
+    if hints:
+        system_prompt = ((system_prompt or "") + hints).lstrip()
+    
+    # Whole files sit in the leading message, which stays the same across turns,
+    # retrieved chunks change with every question and go with the question
+    files, retrieval = select_attachments(prompt, history)
+    messages, context_stats = build_context(
+        system_prompt,
+        history,
+        prompt,
+        [] if retrieval else files,
+        context_length=effective_context_length(model),
+        max_tokens=st.session_state.max_tokens,
+        excerpts=files if retrieval else []
+    )
+    context_stats["retrieval"] = retrieval
+    context_stats["static_findings"] = sum(len(f) for _, f in findings)
+    st.session_state.last_context_stats = context_stats
+    return messages
 
-def stream_ollama_response(prompt: str, system_prompt: str = None) -> Generator[str, None, None]:
-    """Unified streaming response handler - tries API first, then CLI"""
-    # First check Ollama status
-    status = check_ollama_status()
+def build_request_data(prompt: str, system_prompt: str = None, model: Optional[str] = None) -> Dict:
+    """Ollama /api/chat payload for a prompt in the current session"""
+    model = model or st.session_state.model_name
+    # Build the messages in Ollama format within the context budget
+    messages = build_chat_messages(prompt, system_prompt, model)
     
-    if not status.get("running", False):
-        yield "**Error:** Ollama is not running. Please start Ollama with `ollama serve` in your terminal."
+    return {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "options": {
+            "temperature": st.session_state.temperature,
+            "num_predict": st.session_state.max_tokens,
+            "num_ctx": effective_context_length(model)
+        },
+        # Sized to how often the model is used, so it stays loaded between turns
+        "keep_alive": get_model_manager().keep_alive(model)
+    }
+
+def route_model(prompt: str) -> Dict:
+    """Routing decision for a prompt, the selected model if the user pinned it"""
+    files = st.session_state.uploaded_files
+    status = get_backend_pool().status()
+    return get_model_router().route(
+        prompt, len(files), sum(f["size"] for f in files) // CHARS_PER_TOKEN,
+        status.get("available_models", []), status.get("loaded_models", []), st.session_state.max_tokens,
+        pinned=st.session_state.model_name if st.session_state.model_pinned else None,
+        fallback=st.session_state.model_name, models=status.get("models")
+    )
+
+def prefetch_analysis():
+    """Start generating the Analyze Code answer while nobody else needs the model"""
+    if not st.session_state.uploaded_files or not backend_idle():
         return
+    if any(is_blocking(findings) for _, findings in static_findings()):
+        return  # Answered by static analysis without the model
+    # Same route as the click would take, or the prefetched answer would not match
+    model = route_model(ANALYZE_PROMPT)["model"]
+    request_data = build_request_data(ANALYZE_PROMPT, st.session_state.system_prompt, model)
+    get_prefetcher().start(get_session_id(), cache_key(request_data), request_data)
+
+def generation_request(prompt: str, system_prompt: str = None, model: Optional[str] = None) -> Dict:
+    """Settings and shared resources of a generation, read while the script runs
+
+    The generation itself runs on a background thread, which has no session state.
+    """
+    return {
+        "prompt": prompt,
+        "system_prompt": system_prompt,
+        "session_id": get_session_id(),
+        "model": model or st.session_state.model_name,
+        "cacheable": st.session_state.use_cache and st.session_state.temperature <= CACHE_MAX_TEMPERATURE,
+        # Only greedy sampling gives every session the same answer for the same request
+        "deterministic": st.session_state.temperature == 0,
+        "pool": get_backend_pool(),
+        "cache": get_response_cache(),
+        "prefetcher": get_prefetcher(),
+        "coalescer": get_coalescer(),
+        "scheduler": get_scheduler(),
+        "model_manager": get_model_manager(),
+        "cli_worker": get_cli_worker()
+    }
+
+def start_generation(prompt: str, system_prompt: str = None) -> GenerationJob:
+    """Hand a prompt to the background engine, which stores the answer once it is complete"""
+    route = route_model(prompt)
+    trace = get_metrics().start_trace(route["model"])
+    request = generation_request(prompt, system_prompt, route["model"])
+    with trace.span("payload_build"):
+        request["request_data"] = build_request_data(prompt, system_prompt, route["model"])
+        if prompt == ANALYZE_PROMPT:
+            findings = static_findings()
+            if any(is_blocking(f) for _, f in findings):
+                request["static_answer"] = format_report(findings)
+    request["context_stats"] = dict(st.session_state.last_context_stats, route=route)
     
-    if not status.get("model_available", False):
-        yield "**Error:** No models available. Please pull a model with `ollama pull qwen2.5-coder:3b`"
-        return
+    store = get_conversation_store()
+    router = get_model_router()
+    conversation_id = st.session_state.conversation_id
     
-    # Try API method first
-    try:
-        st.session_state.response_in_progress = True
-        for chunk in generate_ollama_response_api(prompt, system_prompt):
-            yield chunk
-    except Exception as api_error:
-        # Fallback to CLI method
-        try:
-            for chunk in generate_ollama_response_cli(prompt, system_prompt):
-                yield chunk
-        except Exception as cli_error:
-            yield f"**Both methods failed:**\n- API error: {str(api_error)}\n- CLI error: {str(cli_error)}"
-    finally:
-        st.session_state.response_in_progress = False
+    def store_answer(job: GenerationJob):
+        # Runs on the engine thread, so the answer is saved even if no browser is watching
+        text = job.text()
+        if text.strip() and not job.handle.cancelled:
+            job.seq = store.append(conversation_id, "assistant", text)
+        router.record(route, job.trace)
+    
+    return get_generation_engine().submit(
+        conversation_id, request["session_id"], request["model"], prompt, trace,
+        lambda job: stream_ollama_response(request, job), store_answer
+    )
 
-def process_file_upload(uploaded_file) -> Optional[str]:
-    """Process uploaded file and return its content"""
+def show_generation(job: GenerationJob):
+    """Render a background generation as it streams, then add the answer to the chat"""
+    engine = get_generation_engine()
+    # After a reconnect the job still belongs to the old browser session
+    engine.adopt(job, get_session_id())
+    
+    with st.chat_message("assistant"):
+        cancel_placeholder = st.empty()
+        cancel_placeholder.button("🛑 Cancel Response", key="cancel_response", type="secondary",
+                                  on_click=cancel_generation)
+        queue_placeholder = st.empty()
+        message_placeholder = st.empty()
+        renderer = StreamRenderer(message_placeholder.container())
+        
+        # Replay what is buffered, then follow the generation, a rerun just starts over here
+        # Chunks are coalesced and only the unfinished trailing block is re-rendered
+        position = 0
+        done = False
+        while not done:
+            parts, done = job.read(position)
+            position += len(parts)
+            if job.queue_position:
+                queue_placeholder.info(f"⏳ Waiting for the model: position {job.queue_position} in queue, "
+                                       f"about {job.queue_wait:.0f}s")
+            else:
+                queue_placeholder.empty()
+            with job.trace.span("render"):
+                for part in parts:
+                    renderer.write(part)
+        
+        # Final message without cursor
+        with job.trace.span("render"):
+            full_response = renderer.finish()
+        cancel_placeholder.empty()
+        
+        stats = st.session_state.last_response_stats = job.stats
+        st.session_state.last_context_stats = job.context_stats
+        ttft = stats.get("ttft")
+        if job.handle.cancelled:
+            st.caption("🛑 Cancelled")
+        elif stats.get("static"):
+            st.caption("🔎 Answered by static analysis, the model was not called")
+        elif stats.get("cached"):
+            st.caption("⚡ Served from response cache")
+        elif stats.get("coalesced"):
+            st.caption(f"🤝 Shared the answer to an identical request of another session, first token in {ttft:.2f}s")
+        elif stats.get("prefetched"):
+            st.caption(f"⚡ Prepared in advance, first token in {ttft:.2f}s")
+        elif ttft is not None:
+            st.caption(f"⏱️ First token in {ttft:.2f}s")
+        if job.context_stats:
+            st.caption(f"📊 Context: {describe_stats(job.context_stats)}")
+        route = job.context_stats.get("route")
+        if route and "routed_tier" in route and not (stats.get("static") or stats.get("cached")):
+            st.caption(f"🧭 Routed to {route['model']} ({route['kind']}, {route['routed_tier']} tier"
+                       + (f", {route['reason']}" if route["reason"] != "tier" else "")
+                       + (f", ~{route['estimate']:.0f}s expected)" if route.get("estimate") else ")"))
+        if stats.get("prompt_eval_count") is not None:
+            reuse = stats.get("prompt_reuse") or 0.0
+            st.caption(f"🧠 Prompt: {stats['prompt_eval_count']:,} tokens evaluated, ~{reuse:.0%} reused from cache")
+        if not full_response.strip():
+            st.warning("Received empty response from model")
+    
+    if full_response.strip() and not job.handle.cancelled:
+        record_review(full_response, job.prompt)
+    
+    # The engine already stored the answer, show it in the history unless a resume loaded it
+    messages = st.session_state.messages
+    if job.seq is not None and (not messages or messages[-1]["seq"] < job.seq):
+        messages.append(compact_message({"seq": job.seq, "role": "assistant", "content": full_response}))
+        if len(messages) > MAX_LOADED_MESSAGES:
+            del messages[:-MAX_LOADED_MESSAGES]
+    engine.release(job)
+    st.session_state.response_in_progress = False
+
+def process_file_upload(uploaded_file) -> Optional[Dict]:
+    """Process uploaded file and return a reference to its stored content"""
     try:
-        # Read file content
-        content = uploaded_file.getvalue().decode('utf-8')
+        # Stream, validate, hash and store the content once for all sessions
+        file_ref = get_file_store().ingest(uploaded_file.name, uploaded_file, size=uploaded_file.size)
         
-        # Store file info in session state
+        # Store file info in session state, the body stays in the file store
         file_info = {
             "name": uploaded_file.name,
-            "size": len(content),
+            "size": file_ref["size"],
             "type": uploaded_file.type,
             "timestamp": datetime.now().isoformat(),
-            "content_preview": content[:500] + "..." if len(content) > 500 else content
+            "sha256": file_ref["sha256"]
         }
         
         st.session_state.file_history.append(file_info)
@@ -372,21 +697,23 @@ def process_file_upload(uploaded_file) -> Optional[str]:
         if len(st.session_state.file_history) > 10:
             st.session_state.file_history = st.session_state.file_history[-10:]
         
-        return content
+        return file_ref
     
+    except IngestError as e:
+        st.warning(f"Skipped {uploaded_file.name}: {e}")
+        return None
     except Exception as e:
         st.error(f"Error reading file: {e}")
         return None
 
 def export_conversation():
     """Export conversation to JSON file"""
-    conversation_data = {
+    header = {
         "model": st.session_state.model_name,
         "timestamp": datetime.now().isoformat(),
         "system_prompt": st.session_state.system_prompt,
         "temperature": st.session_state.temperature,
         "max_tokens": st.session_state.max_tokens,
-        "messages": st.session_state.messages,
         "uploaded_files": [
             {"name": f["name"], "size": f["size"], "type": f["type"]} 
             for f in st.session_state.file_history[-5:]
@@ -395,33 +722,45 @@ def export_conversation():
     
     filename = f"conversation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
     
+    # Messages are streamed from the store instead of building one big dict
     with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(conversation_data, f, indent=2, ensure_ascii=False)
+        if st.session_state.conversation_id:
+            get_conversation_store().export(st.session_state.conversation_id, f, header)
+        else:
+            json.dump(dict(header, messages=[]), f, indent=2, ensure_ascii=False)
     
     return filename
 
 def clear_chat():
     """Clear chat history"""
+    # The stored conversation is kept, the chat continues in a new one
+    cancel_generation()
     st.session_state.messages = []
+    st.session_state.conversation_id = None
+    st.session_state.visible_messages = PAGE_SIZE
+    st.query_params.pop("c", None)
     st.session_state.uploaded_files = []
+    get_session_memory().set_index(get_session_id(), new_code_index())
     st.rerun()
 
-# Sidebar configuration
-with st.sidebar:
-    st.title("⚙️ Settings")
-    
+# Generations run in the background, a rerun or reconnect picks the current one up again
+current_job = get_generation_engine().get(st.session_state.conversation_id)
+st.session_state.response_in_progress = current_job is not None
+
+@st.fragment
+def connection_panel():
+    """Ollama status and model selection, reruns on its own"""
     # Connection status
     st.subheader("Connection Status")
     
-    # Check connection on first load or manually
-    if not st.session_state.connection_checked:
-        check_ollama_status()
-    
-    status = st.session_state.ollama_status
+    # Cached status is cheap to read on every rerun
+    status = check_ollama_status()
     
     if status.get("installed", False):
         if status.get("running", False):
             st.markdown('<p class="status-success">✅ Ollama is running</p>', unsafe_allow_html=True)
+            if status.get("version"):
+                st.caption(f"Version {status['version']}")
             
             # Model selector
             if status.get("available_models"):
@@ -431,10 +770,42 @@ with st.sidebar:
                     index=status["available_models"].index(st.session_state.model_name) 
                     if st.session_state.model_name in status["available_models"] else 0
                 )
-                st.session_state.model_name = selected_model
+                # Start loading a newly selected model before the first prompt needs it
+                model_manager = get_model_manager()
+                if selected_model != st.session_state.model_name:
+                    model_manager.preload(selected_model)
+                    st.session_state.model_name = selected_model
+                    # Picking a model by hand means the user wants that one
+                    st.session_state.model_pinned = True
+                    # The page header names the model, so this change needs the whole page
+                    st.rerun()
+                model_manager.ensure_loaded(selected_model)
+                pinned = st.checkbox(
+                    "📌 Always use this model", value=st.session_state.model_pinned,
+                    help="Unchecked, each request goes to a fast or a larger model depending on its size and kind"
+                )
+                if pinned != st.session_state.model_pinned:
+                    st.session_state.model_pinned = pinned
+                    st.rerun()
                 
                 if status.get("model_switched"):
                     st.info(status["model_switched"])
+                
+                model_state = model_manager.state(selected_model)
+                if model_state["state"] == "loaded":
+                    expires = model_state.get("expires_in")
+                    st.caption("🟢 Model loaded" + (f" • unloads in {expires / 60:.0f} min" if expires else ""))
+                elif model_state["state"] == "loading":
+                    st.caption(f"🟡 Loading model... {model_state['loading_for']:.0f}s")
+                elif model_state["state"] == "error":
+                    st.caption(f"🔴 Preload failed: {model_state['error']}")
+                else:
+                    st.caption("⚪ Model not loaded")
+                resident = model_manager.resident()
+                if resident:
+                    st.caption("**In memory:** " + ", ".join(
+                        f"{m['model']} ({m['size_vram'] / 1024 ** 3:.1f} GB)" for m in resident
+                    ))
             else:
                 st.markdown('<p class="status-warning">⚠️ No models found</p>', unsafe_allow_html=True)
                 st.code("ollama pull qwen2.5-coder:3b", language="bash")
@@ -445,11 +816,23 @@ with st.sidebar:
         st.markdown('<p class="status-error">❌ Ollama not installed</p>', unsafe_allow_html=True)
         st.markdown("[Download Ollama](https://ollama.com)")
     
+    # Per-backend routing stats
+    for backend in get_backend_pool().stats():
+        icon = "🟢" if backend["running"] else "🔴"
+        ttft = f"{backend['ttft']:.2f}s" if backend["ttft"] is not None else "n/a"
+        st.caption(
+            f"{icon} {backend['url']} • {backend['outstanding']} active • "
+            f"{backend['requests']} requests, {backend['errors']} errors • first token {ttft}"
+        )
+    
     # Refresh connection button
     if st.button("🔄 Refresh Connection", use_container_width=True):
-        st.session_state.connection_checked = False
+        check_ollama_status(force=True)
         st.rerun()
-    
+
+@st.fragment
+def settings_panel():
+    """System prompt and model parameters, only read when a prompt is sent"""
     # System prompt editor
     st.subheader("System Prompt")
     st.session_state.system_prompt = st.text_area(
@@ -461,7 +844,7 @@ with st.sidebar:
     
     if st.button("🔄 Reset to Default", use_container_width=True):
         st.session_state.system_prompt = DEFAULT_SYSTEM_PROMPT
-        st.rerun()
+        st.rerun(scope="fragment")
     
     # Model parameters
     st.subheader("Model Parameters")
@@ -487,57 +870,24 @@ with st.sidebar:
             help="Maximum response length"
         )
     
-    # File upload section
-    st.divider()
-    st.subheader("📁 Upload Files")
-    
-    uploaded_files = st.file_uploader(
-        "Upload code/text files",
-        type=[
-            "txt", "py", "js", "java", "cpp", "c", "cs", 
-            "html", "css", "md", "json", "xml", "yaml", 
-            "yml", "go", "rs", "rb", "php", "sql", "ts"
-        ],
-        accept_multiple_files=True,
-        key="file_uploader"
+    st.session_state.context_length = st.slider(
+        "Context Window",
+        min_value=2048,
+        max_value=32768,
+        value=st.session_state.context_length,
+        step=1024,
+        help="Tokens the model sees per turn (prompt + answer). Older turns and large files are shortened to fit."
     )
     
-    # Process newly uploaded files
-    new_uploads = []
-    if uploaded_files:
-        for uploaded_file in uploaded_files:
-            # Check if this file was already uploaded
-            if not any(f["name"] == uploaded_file.name for f in st.session_state.file_history[-10:]):
-                content = process_file_upload(uploaded_file)
-                if content:
-                    new_uploads.append({
-                        "name": uploaded_file.name,
-                        "content": content
-                    })
-    
-    # Add new uploads to session state
-    if new_uploads:
-        st.session_state.uploaded_files.extend(new_uploads)
-        for upload in new_uploads:
-            st.success(f"✅ {upload['name']}")
-    
-    # Display recent files
-    if st.session_state.file_history:
-        st.subheader("📋 Recent Files")
-        for file_info in st.session_state.file_history[-3:]:  # Show last 3 files
-            with st.expander(f"📄 {file_info['name']} ({file_info['size']} chars)"):
-                # Try to guess language for syntax highlighting
-                extension = file_info['name'].split('.')[-1].lower()
-                languages = {
-                    'py': 'python', 'js': 'javascript', 'java': 'java',
-                    'cpp': 'cpp', 'c': 'c', 'html': 'html', 'css': 'css',
-                    'md': 'markdown', 'json': 'json', 'xml': 'xml',
-                    'yaml': 'yaml', 'yml': 'yaml', 'txt': 'text'
-                }
-                language = languages.get(extension, 'text')
-                st.code(file_info["content_preview"], language=language)
-    
-    # Conversation management
+    st.session_state.use_cache = st.checkbox(
+        "Reuse cached answers",
+        value=st.session_state.use_cache,
+        help=f"Replay stored answers to identical requests. Only used at temperature {CACHE_MAX_TEMPERATURE:g}."
+    )
+
+@st.fragment
+def conversation_panel():
+    """Clearing and exporting the conversation"""
     st.divider()
     st.subheader("Conversation")
     
@@ -563,15 +913,192 @@ with st.sidebar:
                     )
             except Exception as e:
                 st.error(f"Error exporting: {str(e)}")
-    
+
+@st.fragment(run_every=STATS_REFRESH)
+def stats_panel():
+    """Shared server stats, refreshed on a timer instead of by full reruns"""
     # Current model info
     st.divider()
-    st.caption(f"**Current Model:** {st.session_state.model_name}")
-    st.caption(f"**Messages in chat:** {len(st.session_state.messages)}")
+    st.caption(f"**Current Model:** {st.session_state.model_name}"
+               + ("" if st.session_state.model_pinned else " (routed per request)"))
+    message_count = (get_conversation_store().count(st.session_state.conversation_id)
+                     if st.session_state.conversation_id else 0)
+    st.caption(f"**Messages in chat:** {message_count}")
+    queue_stats = get_scheduler().stats()
+    st.caption(
+        f"**Queue:** {queue_stats['queue_depth']} waiting, {sum(queue_stats['running'].values())} running • "
+        f"wait p50 {queue_stats['wait_p50']:.1f}s, p95 {queue_stats['wait_p95']:.1f}s • "
+        f"{queue_stats['rejected']} turned away"
+    )
+    generation_stats = get_generation_registry().stats()
+    st.caption(
+        f"**Generations:** {generation_stats['active']} active, {generation_stats['completed']} completed, "
+        f"{generation_stats['cancelled']} cancelled ({generation_stats['cancelled_tokens']} tokens discarded) • "
+        f"{get_generation_engine().stats()['unclaimed']} answers never shown"
+    )
+    prefetch_stats = get_prefetcher().stats()
+    st.caption(
+        f"**Prefetch:** {prefetch_stats['hit_rate']:.0%} hit rate, {prefetch_stats['waste_rate']:.0%} wasted "
+        f"({prefetch_stats['hits']} hits, {prefetch_stats['partial_hits']} while generating, "
+        f"{prefetch_stats['wasted_tokens']} tokens discarded)"
+    )
+    analysis_stats = get_static_analyzer().stats()
+    st.caption(
+        f"**Static analysis:** {analysis_stats['analyzed']} files analyzed, {analysis_stats['hits']} cache hits, "
+        f"{analysis_stats['pending']} running"
+    )
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"**Response cache:** {cache_stats['hit_rate']:.0%} hit rate "
+        f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['bypassed']} bypassed) • "
+        f"{cache_stats['entries']} answers, {cache_stats['bytes'] / 1024:.0f} KB"
+    )
+    coalescer_stats = get_coalescer().stats()
+    st.caption(
+        f"**Coalescing:** {coalescer_stats['joined']} requests joined a generation of another session • "
+        f"{coalescer_stats['in_flight']} in flight to {coalescer_stats['subscribers']} sessions, "
+        f"{coalescer_stats['saved_tokens']} chunks not generated again"
+    )
+    routing_stats = get_model_router().stats()
+    st.caption(
+        f"**Routing:** {routing_stats['routed']} routed, {routing_stats['pinned']} pinned"
+        + "".join(f" • {model} {speeds['tokens_per_second']:.0f} tok/s"
+                  for model, speeds in sorted(routing_stats["speeds"].items()) if speeds.get("tokens_per_second"))
+    )
+    memory = get_session_memory()
+    footprint = memory.footprint(get_session_id())
+    memory_stats = memory.stats()
+    st.caption(
+        f"**Memory:** this session {footprint['total'] / 1024:.0f} KB (messages {footprint['payloads'] / 1024:.0f} KB "
+        f"compressed from {footprint['raw'] / 1024:.0f} KB, index {footprint['index'] / 1024:.0f} KB, "
+        f"state {footprint['state'] / 1024:.0f} KB) • all sessions {memory_stats['bytes'] / 1024 ** 2:.1f} "
+        f"of {memory_stats['cap'] / 1024 ** 2:.0f} MB, {memory_stats['spilled_sessions']} spilled to disk"
+    )
+    
+    # Rolling latency and throughput percentiles of recent requests
+    with st.expander("📈 Performance", expanded=False):
+        metrics = get_metrics()
+        percentiles = metrics.percentiles()
+        if percentiles:
+            rows = []
+            for name, stats in percentiles.items():
+                unit = METRICS[name][0]
+                scale, suffix = {"seconds": (1000, " ms"), "ratio": (100, "%")}.get(unit, (1, ""))
+                rows.append({
+                    "metric": name,
+                    "p50": f"{stats['p50'] * scale:.0f}{suffix}",
+                    "p95": f"{stats['p95'] * scale:.0f}{suffix}",
+                    "p99": f"{stats['p99'] * scale:.0f}{suffix}",
+                    "n": stats["count"]
+                })
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            st.caption(" • ".join(f"{outcome}: {count}" for outcome, count in sorted(metrics.outcomes.items())))
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("📥 JSONL", metrics.export_jsonl(), file_name="metrics.jsonl",
+                                   mime="application/x-ndjson", use_container_width=True)
+            with col2:
+                st.download_button("📥 Prometheus", metrics.export_prometheus(), file_name="metrics.prom",
+                                   mime="text/plain", use_container_width=True)
+        else:
+            st.caption("No requests timed yet")
+        decisions = get_model_router().recent()
+        if decisions:
+            st.caption("**Recent routing decisions**")
+            st.dataframe([{
+                "model": d["model"],
+                "kind": d["kind"],
+                "tier": d.get("routed_tier", d["reason"]),
+                "expected": f"{d['estimate']:.1f}s" if d.get("estimate") is not None else "",
+                "took": f"{d['last_token']:.1f}s" if d.get("last_token") is not None else d["outcome"]
+            } for d in reversed(decisions)], hide_index=True, use_container_width=True)
+
+# Sidebar configuration, each panel reruns on its own when its widgets change
+with st.sidebar:
+    st.title("⚙️ Settings")
+    
+    connection_panel()
+    settings_panel()
+    
+    # New uploads change the attachments shown in the chat, so this part runs with the whole page
+    st.divider()
+    st.subheader("📁 Upload Files")
+    
+    uploaded_files = st.file_uploader(
+        "Upload code/text files",
+        type=UPLOAD_TYPES,
+        accept_multiple_files=True,
+        key="file_uploader"
+    )
+    
+    # Process newly uploaded files
+    new_uploads = []
+    if uploaded_files:
+        for uploaded_file in uploaded_files:
+            # The uploader returns every file on each rerun, only ingest new ones
+            upload_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+            if upload_id in st.session_state.ingested_uploads:
+                continue
+            st.session_state.ingested_uploads.add(upload_id)
+            
+            file_ref = process_file_upload(uploaded_file)
+            if not file_ref:
+                continue
+            
+            # Dedup by content, so renamed copies are not attached twice
+            duplicate = next((f for f in st.session_state.uploaded_files if f["sha256"] == file_ref["sha256"]), None)
+            if duplicate:
+                st.info(f"{file_ref['name']} has the same content as {duplicate['name']}")
+                continue
+            
+            # A new upload under an attached name replaces the older version,
+            # later prompts only carry what changed since it was reviewed
+            versions = st.session_state.file_versions.setdefault(file_ref["name"], [])
+            if versions and versions[-1] != file_ref["sha256"]:
+                file_ref["previous"] = versions[-1]
+            if file_ref["sha256"] not in versions:
+                versions.append(file_ref["sha256"])
+                del versions[:-MAX_VERSIONS]
+            file_ref["revision"] = versions.index(file_ref["sha256"]) + 1
+            st.session_state.uploaded_files = [
+                f for f in st.session_state.uploaded_files if f["name"] != file_ref["name"]
+            ]
+            new_uploads.append(file_ref)
+    
+    # Add new uploads to session state
+    if new_uploads:
+        st.session_state.uploaded_files.extend(new_uploads)
+        # Chunk, index and analyze at ingest time so prompts only pull relevant parts
+        code_index = get_code_index()
+        for upload in new_uploads:
+            content = load_file(upload)
+            code_index.add_file(upload["name"], content, ref=upload["sha256"])
+            get_static_analyzer().submit(upload["name"], upload["sha256"], content)
+        get_session_memory().set_index(get_session_id(), code_index)
+        for upload in new_uploads:
+            if upload.get("previous") in st.session_state.review_notes:
+                st.success(f"✅ {upload['name']} (revision {upload['revision']}, only the changes are re-reviewed)")
+            else:
+                st.success(f"✅ {upload['name']}")
+        # Likely next step, so start on it while the backend is idle
+        prefetch_analysis()
+    
+    # Display recent files
+    if st.session_state.file_history:
+        st.subheader("📋 Recent Files")
+        for file_info in st.session_state.file_history[-3:]:  # Show last 3 files
+            with st.expander(f"📄 {file_info['name']} ({file_info['size']} chars)"):
+                # Try to guess language for syntax highlighting
+                extension = file_info['name'].split('.')[-1].lower()
+                st.code(file_preview(file_info["sha256"]), language=LANGUAGES.get(extension, 'text'))
+    
+    conversation_panel()
+    stats_panel()
 
 # Main chat interface
 st.title("🤖 AI Programming Tutor")
-st.caption(f"Powered by Ollama • Model: {st.session_state.model_name}")
+st.caption(f"Powered by Ollama • Model: {st.session_state.model_name}"
+           + ("" if st.session_state.model_pinned else " and others, routed per request"))
 
 # Display connection warnings
 status = st.session_state.ollama_status
@@ -580,8 +1107,11 @@ if status.get("error"):
 elif not status.get("running", False):
     st.warning("⚠️ Ollama is not running. Please start it with `ollama serve`")
 
-# Display uploaded files context
-if st.session_state.uploaded_files:
+@st.fragment
+def attached_files_panel():
+    """Attached files with previews, removing one only reruns this panel"""
+    if not st.session_state.uploaded_files:
+        return
     with st.expander(f"📎 Attached Files ({len(st.session_state.uploaded_files)})", expanded=False):
         for i, file_data in enumerate(st.session_state.uploaded_files):
             col1, col2 = st.columns([4, 1])
@@ -589,25 +1119,92 @@ if st.session_state.uploaded_files:
                 st.markdown(f"**{file_data['name']}**")
             with col2:
                 if st.button("🗑️", key=f"remove_{i}", help="Remove this file"):
-                    st.session_state.uploaded_files.pop(i)
-                    st.rerun()
+                    removed = st.session_state.uploaded_files.pop(i)
+                    code_index = get_code_index()
+                    code_index.remove_file(removed["name"])
+                    get_session_memory().set_index(get_session_id(), code_index)
+                    st.rerun(scope="fragment")
             
             # Show preview
-            preview = file_data['content'][:500] + ("..." if len(file_data['content']) > 500 else "")
-            st.code(preview, language="text")
+            st.code(file_preview(file_data["sha256"]), language="text")
             st.divider()
 
-# Display chat messages
-for i, message in enumerate(st.session_state.messages):
+@st.fragment
+def batch_review_panel():
+    """Batch review of a whole directory or archive"""
+    status = st.session_state.ollama_status
+    with st.expander("📦 Batch Review", expanded=False):
+        st.caption("Review every source file of a directory or zip archive. "
+                   "Interrupted runs resume where they stopped. Also available as `python batch_review.py <path>`.")
+        batch_path = st.text_input("Directory or .zip path on this machine", key="batch_path")
+        batch_archive = st.file_uploader("...or upload a zip archive", type=["zip"], key="batch_archive")
+        batch_workers = st.slider("Parallel requests", 1, 8, DEFAULT_WORKERS, key="batch_workers")
+    
+        if st.button("▶️ Start Batch Review", disabled=st.session_state.response_in_progress):
+            source = batch_archive or batch_path.strip()
+            if not status.get("running", False):
+                st.error("Ollama is not running. Please start it first.")
+            elif not source or (isinstance(source, str) and not os.path.exists(source)):
+                st.error("Enter an existing directory or zip path, or upload an archive")
+            else:
+                scheduler = get_scheduler()
+                session_id = get_session_id()
+                model = st.session_state.model_name
+                get_prefetcher().preempt()
+                review = BatchReview(
+                    get_backend_pool(), source, model=model, workers=batch_workers,
+                    context_length=effective_context_length(model), max_tokens=st.session_state.max_tokens,
+                    slot=lambda: scheduled_slot(scheduler, session_id, model, BATCH_PRIORITY)
+                )
+                progress_bar = st.progress(0.0)
+                progress_text = st.empty()
+                latest = st.empty()
+            
+                def show_batch_progress(result: Dict, stats: Dict):
+                    # A click elsewhere stops the run here, finished reviews stay saved
+                    progress_bar.progress(stats["units_done"] / max(stats["units_total"], 1))
+                    progress_text.caption(
+                        f"{stats['units_done']}/{stats['units_total']} parts • "
+                        f"{stats['files_done']}/{stats['files_total']} files • "
+                        f"{stats['files_per_minute']:.1f} files/min • {stats['tokens_per_second']:.1f} tokens/s"
+                    )
+                    if result.get("error"):
+                        latest.warning(f"{unit_label(result)}: {result['error']}")
+                    else:
+                        latest.markdown(f"**{unit_label(result)}**\n\n{result['review']}")
+            
+                batch_stats = review.run(show_batch_progress)
+                latest.empty()
+                st.session_state.batch_report = review.report_path
+                st.success(f"Reviewed {batch_stats['files_done']} of {batch_stats['files_total']} files in "
+                           f"{batch_stats['elapsed']:.0f}s ({batch_stats['resumed']} parts from an earlier run)")
+    
+        if st.session_state.get("batch_report") and os.path.exists(st.session_state.batch_report):
+            with open(st.session_state.batch_report, "r", encoding="utf-8") as f:
+                st.download_button("📥 Download Review Report", f.read(), file_name="code_review.md",
+                                   mime="text/markdown")
+
+attached_files_panel()
+batch_review_panel()
+
+# Display chat messages, only the newest pages are rendered
+messages = st.session_state.messages
+has_older = len(messages) > st.session_state.visible_messages or (messages and messages[0]["seq"] > 1)
+if has_older:
+    st.button("⬆️ Load older messages", on_click=load_older_messages)
+
+for message in messages[-st.session_state.visible_messages:]:
     with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+        st.markdown(load_text(message["ref"]))
         
         # Add copy button for assistant messages
         if message["role"] == "assistant":
-            st.caption(f"Message {i//2 + 1}")
+            st.caption(f"Message {message['seq'] // 2}")
 
-# Chat input
-if prompt := st.chat_input("Ask a programming question...", disabled=st.session_state.response_in_progress):
+# Chat input, quick actions queue their prompt for this run
+prompt = st.chat_input("Ask a programming question...", disabled=st.session_state.response_in_progress)
+prompt = prompt or st.session_state.pop("pending_prompt", None)
+if prompt:
     # Check if Ollama is ready
     if not status.get("running", False):
         st.error("Ollama is not running. Please start it first.")
@@ -617,19 +1214,8 @@ if prompt := st.chat_input("Ask a programming question...", disabled=st.session_
         st.error("No models available. Please pull a model first.")
         st.stop()
     
-    # Prepare user message with file context
-    user_message_content = prompt
-    
-    # Include uploaded files in context if any
-    if st.session_state.uploaded_files:
-        file_context = "\n\n**Attached files:**\n"
-        for file_data in st.session_state.uploaded_files:
-            file_context += f"\n--- File: {file_data['name']} ---\n"
-            file_context += file_data['content'] + "\n"
-        user_message_content += file_context
-    
     # Add user message to chat history (store original prompt for display)
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     
     # Display user message
     with st.chat_message("user"):
@@ -637,59 +1223,34 @@ if prompt := st.chat_input("Ask a programming question...", disabled=st.session_
         if st.session_state.uploaded_files:
             st.caption(f"📎 {len(st.session_state.uploaded_files)} file(s) attached")
     
-    # Generate assistant response with streaming
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        full_response = ""
-        
-        try:
-            # Stream the response
-            for chunk in stream_ollama_response(user_message_content, st.session_state.system_prompt):
-                full_response += chunk
-                message_placeholder.markdown(full_response + "▌")
-            
-            # Final message without cursor
-            message_placeholder.markdown(full_response)
-            
-            # Add assistant response to history
-            if full_response.strip():
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
-            else:
-                st.warning("Received empty response from model")
-            
-        except Exception as e:
-            error_msg = f"**Error generating response:** {str(e)}"
-            message_placeholder.markdown(error_msg)
-            st.session_state.messages.append({"role": "assistant", "content": error_msg})
-        
-        finally:
-            st.session_state.response_in_progress = False
-    
-    # Clear uploaded files after use (optional)
-    # st.session_state.uploaded_files = []
+    # Generate the answer in the background, shown below while it streams
+    current_job = start_generation(prompt, st.session_state.system_prompt)
+    st.session_state.response_in_progress = True
 
-# Cancel button if response is stuck
-if st.session_state.response_in_progress:
-    st.warning("Generating response...")
-    if st.button("🛑 Cancel Response", type="secondary"):
-        st.session_state.response_in_progress = False
+if current_job is not None:
+    show_generation(current_job)
+    if not prompt:
+        # The job was picked up from an earlier run, which rendered the inputs disabled
         st.rerun()
 
 # Quick action buttons
-if not st.session_state.response_in_progress and len(st.session_state.messages) > 0:
+def queue_prompt(prompt: str):
+    st.session_state.pending_prompt = prompt
+
+if not st.session_state.response_in_progress and (st.session_state.messages or st.session_state.uploaded_files):
     st.divider()
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("📝 Continue Conversation", use_container_width=True):
-            if st.session_state.messages:
-                last_message = st.session_state.messages[-1]["content"]
-                st.chat_input(f"Respond to: {last_message[:50]}...")
+        st.button("📝 Continue Conversation", use_container_width=True,
+                  disabled=not st.session_state.messages, on_click=queue_prompt, args=(CONTINUE_PROMPT,))
     
     with col2:
+        # The answer is usually prefetched right after the upload
         if st.button("🔍 Analyze Code", use_container_width=True):
             if st.session_state.uploaded_files:
-                st.chat_input("Analyze the uploaded code...")
+                queue_prompt(ANALYZE_PROMPT)
+                st.rerun()
             else:
                 st.info("Upload a code file first")
     
@@ -0,0 +1,202 @@
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from ollama_client import OllamaClient, OllamaError
+from ollama_health import HealthMonitor
+
+# Constants
+EWMA_ALPHA = 0.2
+ERROR_COOLDOWN = 10.0  # Seconds a backend is routed to last after a failed request
+
+
+class Backend:
+    """One Ollama server with its client, health monitor and request stats"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.client = OllamaClient(self.url)
+        self.monitor = HealthMonitor(self.client)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ttft: Optional[float] = None  # Moving average, seconds
+        self.last_error: Optional[str] = None
+        self.last_error_at = 0.0
+
+    def status(self) -> Dict:
+        return self.monitor.get_status()
+
+    def healthy(self) -> bool:
+        return bool(self.status().get("running"))
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() - self.last_error_at < ERROR_COOLDOWN
+
+    def record_ttft(self, ttft: float):
+        self.ttft = ttft if self.ttft is None else self.ttft + EWMA_ALPHA * (ttft - self.ttft)
+
+    def record_error(self, error: Exception):
+        self.errors += 1
+        self.last_error = str(error)
+        self.last_error_at = time.monotonic()
+        # Re-probe soon so a dead server drops out of routing
+        self.monitor.request_refresh()
+
+    def stats(self) -> Dict:
+        status = self.status()
+        return {
+            "url": self.url,
+            "running": bool(status.get("running")),
+            "models": status.get("available_models", []),
+            "loaded_models": status.get("loaded_models", []),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ttft": self.ttft,
+            "last_error": self.last_error
+        }
+
+
+class PooledStream:
+    """Chat stream that fails over to another backend until the first token arrives"""
+
+    def __init__(self, pool: "BackendPool", payload: Dict):
+        self._pool = pool
+        self._payload = payload
+        self._stream = None
+        self.backend: Optional[Backend] = None
+        self.started = time.perf_counter()
+        self.connected: Optional[float] = None  # perf_counter time the response headers arrived
+        self.ttft: Optional[float] = None
+        self.final: Dict = {}
+        self.closed = False
+
+    def _connect(self):
+        """Open the stream on the best backend and read up to its first chunk"""
+        model = self._payload.get("model")
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+
+        while not self.closed:
+            backend = self._pool.pick(model, exclude=tried)
+            if backend is None:
+                raise last_error or OllamaError(f"No healthy Ollama backend serves {model}")
+            tried.append(backend)
+
+            with self._pool.lock:
+                backend.outstanding += 1
+                backend.requests += 1
+            try:
+                stream = backend.client.chat_stream(self._payload)
+                self._stream = stream
+                self.connected = time.perf_counter()
+                chunks = iter(stream)
+                first = next(chunks, None)
+            except Exception as e:
+                # Whatever went wrong, the request no longer counts against this backend
+                with self._pool.lock:
+                    backend.outstanding -= 1
+                if self.closed:
+                    return None, None, None
+                if not isinstance(e, OllamaError):
+                    e = OllamaError(f"Request to {backend.url} failed: {e}")
+                backend.record_error(e)
+                self._pool.failovers += 1
+                last_error = e
+                continue
+
+            if self.closed:
+                with self._pool.lock:
+                    backend.outstanding -= 1
+                return None, None, None
+            return backend, chunks, first
+        return None, None, None
+
+    def __iter__(self) -> Iterator[str]:
+        backend, chunks, first = self._connect()
+        if backend is None:
+            return
+        self.backend = backend
+        try:
+            if first is not None:
+                self.ttft = time.perf_counter() - self.started
+                backend.record_ttft(self.ttft)
+                yield first
+            for chunk in chunks:
+                yield chunk
+            self.final = self._stream.final
+        except OllamaError as e:
+            if not self.closed:
+                backend.record_error(e)
+            raise
+        finally:
+            with self._pool.lock:
+                backend.outstanding -= 1
+
+    def close(self):
+        self.closed = True
+        if self._stream is not None:
+            self._stream.close()
+
+
+class BackendPool:
+    """Routes requests across Ollama servers by health, model affinity and load"""
+
+    def __init__(self, urls: List[str]):
+        self.backends = [Backend(url) for url in urls]
+        self.lock = threading.Lock()
+        self.failovers = 0  # Requests retried on another backend before their first token
+
+    def serving(self, model: str) -> int:
+        """Number of healthy backends that have a model"""
+        return sum(1 for b in self.backends if b.healthy() and model in b.status().get("available_models", []))
+
+    def pick(self, model: Optional[str], exclude: List[Backend] = ()) -> Optional[Backend]:
+        """Healthy backend with the model, preferring ones that already have it loaded"""
+        candidates = [b for b in self.backends if b not in exclude and b.healthy()
+                      and (model is None or model in b.status().get("available_models", []))]
+        if not candidates:
+            return None
+
+        def score(backend: Backend) -> tuple:
+            # A cold model load costs more than waiting behind a request or two
+            cold = model not in backend.status().get("loaded_models", [])
+            return (backend.cooling_down(), cold, backend.outstanding, backend.ttft or 0.0)
+
+        with self.lock:
+            return min(candidates, key=score)
+
+    def chat_stream(self, payload: Dict) -> PooledStream:
+        return PooledStream(self, payload)
+
+    def client_for(self, model: Optional[str] = None) -> OllamaClient:
+        """Client of the backend a request for model would go to"""
+        backend = self.pick(model) or self.pick(None) or self.backends[0]
+        return backend.client
+
+    def status(self, force: bool = False) -> Dict:
+        """Merged status of all backends in the shape check_ollama_status expects"""
+        statuses = [b.monitor.refresh() if force else b.status() for b in self.backends]
+        running = [s for s in statuses if s.get("running")]
+        merged = {
+            "installed": any(s.get("installed") for s in statuses),
+            "running": bool(running),
+            "available_models": list(dict.fromkeys(m for s in running for m in s.get("available_models", []))),
+            "loaded_models": list(dict.fromkeys(m for s in running for m in s.get("loaded_models", []))),
+            # /api/tags entries by name, the first backend listing a model wins
+            "models": {name: entry for s in reversed(running) for name, entry in s.get("models", {}).items()},
+            "backends_up": len(running),
+            "backends_total": len(statuses)
+        }
+        if running:
+            merged["version"] = running[0].get("version")
+        else:
+            # Report why the primary backend is down
+            for key in ("error", "detail"):
+                if key in statuses[0]:
+                    merged[key] = statuses[0][key]
+        return merged
+
+    def stats(self) -> List[Dict]:
+        return [b.stats() for b in self.backends]
@@ -0,0 +1,435 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend_pool import BackendPool
+from code_index import chunk_file
+from context_builder import estimate_tokens, prompt_budget, truncate_middle, MESSAGE_OVERHEAD
+from file_store import IngestError, read_text
+from ollama_client import OllamaError, DEFAULT_OLLAMA_URL
+
+# Constants
+MODEL_NAME = "qwen2.5-coder:3b"
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "batch")
+DEFAULT_WORKERS = 2
+REVIEW_CONTEXT_LENGTH = 8192
+REVIEW_MAX_TOKENS = 1024
+REVIEW_TEMPERATURE = 0.2
+SOURCE_EXTENSIONS = {
+    ".txt", ".py", ".js", ".java", ".cpp", ".c", ".cs", ".html", ".css", ".md", ".json",
+    ".xml", ".yaml", ".yml", ".go", ".rs", ".rb", ".php", ".sql", ".ts"
+}
+SKIP_DIRS = {".git", ".hg", ".svn", ".cache", ".venv", "venv", "node_modules", "__pycache__", "dist", "build"}
+REVIEW_SYSTEM_PROMPT = """You are a senior software engineer doing a code review. For the code you are given:
+- List concrete bugs, security issues and error handling gaps, citing line numbers
+- Point out readability or performance problems worth fixing
+- Skip praise and generic advice, say "No issues found" if there is nothing to report
+- Keep each finding to one or two sentences"""
+OMITTED_LINE = re.compile(r"^\.\.\. \[\d+ lines omitted to fit the context window\] \.\.\.$")
+
+
+def source_id(path: str) -> str:
+    """Stable id of a review source, used to find the state of an earlier run"""
+    hasher = hashlib.sha256()
+    if os.path.isdir(path):
+        hasher.update(os.path.realpath(path).encode("utf-8"))
+    else:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+    return hasher.hexdigest()[:16]
+
+
+def iter_sources(path) -> Iterator[Tuple[str, Callable, Optional[int]]]:
+    """Reviewable files of a directory or zip archive as (name, opener, size)
+
+    path may also be an open zip file object, e.g. an upload from the UI.
+    """
+    def reviewable(name: str) -> bool:
+        parts = name.replace("\\", "/").split("/")
+        return (os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+                and not any(part in SKIP_DIRS for part in parts[:-1]))
+
+    if isinstance(path, str) and os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+            for filename in sorted(files):
+                full = os.path.join(root, filename)
+                name = os.path.relpath(full, path).replace(os.sep, "/")
+                if reviewable(name):
+                    try:
+                        size = os.path.getsize(full)
+                    except OSError:
+                        size = None  # E.g. a broken link, opening it reports why
+                    yield name, (lambda full=full: open(full, "rb")), size
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        for info in sorted(archive.infolist(), key=lambda i: i.filename):
+            if not info.is_dir() and reviewable(info.filename):
+                yield info.filename, (lambda info=info: archive.open(info)), info.file_size
+
+
+def cap_unit(unit: Dict, budget: int) -> Dict:
+    """Cut the middle out of a unit that alone is over the budget, e.g. one huge function"""
+    if estimate_tokens(unit["text"]) > budget:
+        unit["text"] = truncate_middle(unit["text"], budget)
+        lines = unit["text"].splitlines()
+        # The tail is the shorter part, look for the marker from the end
+        unit["cut"] = next(i for i in range(len(lines) - 1, -1, -1) if OMITTED_LINE.match(lines[i]))
+    return unit
+
+
+def review_units(name: str, text: str, budget: int) -> List[Dict]:
+    """Split a file into prompts that fit the budget, along symbol boundaries"""
+    lines = text.splitlines()
+    if estimate_tokens(text) <= budget:
+        return [{"file": name, "start": 1, "end": len(lines), "symbol": None, "text": text}]
+
+    units = []
+    current = None
+    for chunk in chunk_file(name, text):
+        # Chunks overlap by a few lines, start where the previous unit ended
+        start = max(chunk["start"], current["end"] + 1) if current else chunk["start"]
+        if start > chunk["end"]:
+            continue
+        piece = "\n".join(lines[start - 1:chunk["end"]])
+        if current and estimate_tokens(current["text"] + "\n" + piece) <= budget:
+            current["text"] += "\n" + piece
+            current["end"] = chunk["end"]
+            current["symbol"] = None
+            continue
+        current = cap_unit({"file": name, "start": start, "end": chunk["end"], "symbol": chunk["symbol"],
+                            "text": piece}, budget)
+        units.append(current)
+    return units
+
+
+def unit_key(sha256: str, unit: Dict) -> str:
+    """Identifies a review across runs, changes when the file content does"""
+    return f"{unit['file']}@{sha256[:16]}:{unit['start']}-{unit['end']}"
+
+
+def unit_label(unit: Dict) -> str:
+    label = f"{unit['file']} (lines {unit['start']}-{unit['end']}"
+    if unit.get("symbol"):
+        label += f", {unit['symbol']}"
+    return label + ")"
+
+
+def review_prompt(unit: Dict) -> str:
+    """Review request for one file or part of a file, with line numbers"""
+    lines = unit["text"].splitlines()
+    numbers = list(range(unit["start"], unit["start"] + len(lines)))
+    cut = unit.get("cut")
+    if cut is not None:
+        # Lines after the omission marker keep their numbers in the file
+        tail = len(lines) - cut - 1
+        numbers = numbers[:cut] + [None] + list(range(unit["end"] - tail + 1, unit["end"] + 1))
+    numbered = "\n".join(f"{number:5d}  {line}" if number else f"{'':5}  {line}"
+                         for number, line in zip(numbers, lines))
+    return f"Review {unit_label(unit)}:\n\n```\n{numbered}\n```"
+
+
+class BatchReview:
+    """Reviews every file of a directory or archive through a bounded worker pool
+
+    Finished reviews are appended to a JSONL state file as they come in, so an
+    interrupted run picks up where it stopped, and to a Markdown report that is
+    rewritten in file order once the run completes.
+    """
+
+    def __init__(self, pool: BackendPool, source, model: str = MODEL_NAME,
+                 state_path: Optional[str] = None, report_path: Optional[str] = None,
+                 workers: int = DEFAULT_WORKERS, context_length: int = REVIEW_CONTEXT_LENGTH,
+                 max_tokens: int = REVIEW_MAX_TOKENS, temperature: float = REVIEW_TEMPERATURE,
+                 system_prompt: str = REVIEW_SYSTEM_PROMPT, slot: Optional[Callable] = None):
+        self.pool = pool
+        self.source = source
+        self.model = model
+        self.workers = workers
+        self.context_length = context_length
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.system_prompt = system_prompt
+        # Context manager factory held around each request, e.g. a scheduler slot
+        self.slot = slot or nullcontext
+        if state_path is None:
+            os.makedirs(BATCH_DIR, exist_ok=True)
+            run_id = source_id(source) if isinstance(source, str) else hashlib.sha256(source.getvalue()).hexdigest()[:16]
+            state_path = os.path.join(BATCH_DIR, f"{run_id}.jsonl")
+        self.state_path = state_path
+        self.report_path = report_path or os.path.splitext(state_path)[0] + ".md"
+        self.results: Dict[str, Dict] = {}
+        self.skipped_files: List[Dict] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._streams = set()
+        self._stats: Dict = {}
+        self._file_units: Dict[str, int] = {}
+        self._file_done: Dict[str, int] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._load_state()
+
+    def _load_state(self):
+        """Read the reviews of an earlier, possibly interrupted, run"""
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when the run was killed
+                if not result.get("error"):
+                    self.results[result["key"]] = result
+
+    def reset(self):
+        """Forget earlier results and start from scratch"""
+        self.results = {}
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def stop(self):
+        """Stop handing out work and close the requests in flight"""
+        self._stop.set()
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.close()
+
+    def _plan(self) -> List[Tuple[str, Dict]]:
+        """Decode every source file and cut it into review units"""
+        budget = (prompt_budget(self.context_length, self.max_tokens)
+                  - estimate_tokens(self.system_prompt) - 2 * MESSAGE_OVERHEAD - 50)
+        planned = []
+        for name, opener, size in iter_sources(self.source):
+            try:
+                with opener() as f:
+                    text, sha256, _ = read_text(name, f, size)
+            except (IngestError, OSError, zipfile.BadZipFile) as e:
+                self.skipped_files.append({"file": name, "reason": str(e)})
+                continue
+            if not text.strip():
+                continue
+            units = review_units(name, text, budget)
+            self._file_units[name] = len(units)
+            self._file_done[name] = 0
+            for unit in units:
+                planned.append((unit_key(sha256, unit), unit))
+        return planned
+
+    def _review(self, key: str, unit: Dict) -> Dict:
+        """Run one review request and collect the whole answer"""
+        result = {"key": key, "file": unit["file"], "start": unit["start"], "end": unit["end"],
+                  "symbol": unit["symbol"]}
+        request_data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": review_prompt(unit)}
+            ],
+            "stream": True,
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens,
+                "num_ctx": self.context_length
+            }
+        }
+        with self.slot():
+            if self._stop.is_set():
+                result["error"] = "stopped"
+                return result
+            stream = self.pool.chat_stream(request_data)
+            with self._lock:
+                self._streams.add(stream)
+            try:
+                result["review"] = "".join(stream).strip()
+                if not stream.final.get("done"):
+                    result["error"] = "stopped" if self._stop.is_set() else "stream ended early"
+            except OllamaError as e:
+                result["error"] = str(e)
+            finally:
+                stream.close()
+                with self._lock:
+                    self._streams.discard(stream)
+        result["eval_count"] = stream.final.get("eval_count", 0)
+        result["eval_duration"] = stream.final.get("eval_duration", 0) / 1e9
+        result["ttft"] = stream.ttft
+        result["backend"] = stream.backend.url if stream.backend else None
+        return result
+
+    def _record(self, result: Dict):
+        """Persist a finished review and update the counters"""
+        with self._lock:
+            if result.get("error") != "stopped":
+                with open(self.state_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if result.get("error"):
+                self._stats["errors"] += int(result["error"] != "stopped")
+                return
+            self.results[result["key"]] = result
+            self._stats["units_done"] += 1
+            self._stats["eval_tokens"] += result.get("eval_count", 0)
+            self._stats["eval_seconds"] += result.get("eval_duration", 0.0)
+            self._file_done[result["file"]] += 1
+            if self._file_done[result["file"]] == self._file_units[result["file"]]:
+                self._stats["files_done"] += 1
+                self._stats["files_this_run"] += 1
+            with open(self.report_path, "a", encoding="utf-8") as f:
+                f.write(format_result(result))
+
+    def run(self, on_result: Optional[Callable[[Dict, Dict], None]] = None) -> Dict:
+        """Review all pending units, calling on_result(result, stats) as each one finishes"""
+        self._stop.clear()
+        self.started = time.monotonic()
+        self.finished = None
+        self.skipped_files = []
+        self._file_units = {}
+        self._file_done = {}
+        planned = self._plan()
+        self._stats = {
+            "files_total": len(self._file_units), "files_done": 0, "files_this_run": 0,
+            "units_total": len(planned), "units_done": 0, "resumed": 0, "errors": 0,
+            "eval_tokens": 0, "eval_seconds": 0.0
+        }
+
+        pending = []
+        for key, unit in planned:
+            if key in self.results:
+                self._stats["resumed"] += 1
+                self._file_done[unit["file"]] += 1
+            else:
+                pending.append((key, unit))
+        self._stats["files_done"] = sum(1 for name, done in self._file_done.items()
+                                        if done == self._file_units[name])
+        self._stats["units_done"] = self._stats["resumed"]
+
+        # Start the report with what earlier runs already found
+        keys = {key for key, _ in planned}
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            for result in self.results.values():
+                if result["key"] in keys:
+                    f.write(format_result(result))
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-review")
+        try:
+            futures = {executor.submit(self._review, key, unit): (key, unit) for key, unit in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A bug or an odd backend answer fails its unit, not the whole run
+                    key, unit = futures[future]
+                    result = {"key": key, "file": unit["file"], "start": unit["start"], "end": unit["end"],
+                              "symbol": unit["symbol"], "error": f"{type(e).__name__}: {e}"}
+                self._record(result)
+                if on_result:
+                    on_result(result, self.stats())
+        finally:
+            # Also reached on KeyboardInterrupt, finished reviews are already saved
+            self.stop()
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.finished = time.monotonic()
+
+        self.write_report(keys)
+        return self.stats()
+
+    def stats(self) -> Dict:
+        """Progress and throughput of the current run"""
+        with self._lock:
+            stats = dict(self._stats)
+        if not stats:
+            return {}
+        elapsed = ((self.finished or time.monotonic()) - self.started) if self.started else 0.0
+        stats["elapsed"] = elapsed
+        # Files finished by an earlier run don't count towards throughput
+        stats["files_per_minute"] = stats["files_this_run"] / elapsed * 60 if elapsed else 0.0
+        stats["tokens_per_second"] = stats["eval_tokens"] / elapsed if elapsed else 0.0
+        stats["model_tokens_per_second"] = (stats["eval_tokens"] / stats["eval_seconds"]
+                                            if stats["eval_seconds"] else 0.0)
+        stats["skipped_files"] = len(self.skipped_files)
+        return stats
+
+    def write_report(self, keys: Optional[set] = None) -> str:
+        """Rewrite the Markdown report in file and line order with a summary"""
+        stats = self.stats()
+        results = sorted((r for r in self.results.values() if keys is None or r["key"] in keys),
+                         key=lambda r: (r["file"], r["start"]))
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            f.write("# Code Review Report\n\n")
+            f.write(f"- **Model:** {self.model}\n")
+            f.write(f"- **Files reviewed:** {stats['files_done']} of {stats['files_total']}\n")
+            f.write(f"- **Throughput:** {stats['files_per_minute']:.1f} files/min, "
+                    f"{stats['tokens_per_second']:.1f} tokens/s\n")
+            if stats["errors"]:
+                f.write(f"- **Failed requests:** {stats['errors']} (rerun to retry them)\n")
+            for skipped in self.skipped_files:
+                f.write(f"- **Skipped:** {skipped['file']}: {skipped['reason']}\n")
+            f.write("\n")
+            for result in results:
+                f.write(format_result(result))
+        return self.report_path
+
+
+def format_result(result: Dict) -> str:
+    """Report section for one reviewed unit"""
+    return f"## {unit_label(result)}\n\n{result['review']}\n\n"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Review every source file of a directory or zip archive")
+    parser.add_argument("source", help="Directory or .zip archive to review")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--hosts", default=os.environ.get("OLLAMA_HOSTS", DEFAULT_OLLAMA_URL),
+                        help="Comma-separated Ollama servers")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent review requests")
+    parser.add_argument("--report", help="Markdown report path (default next to the run state)")
+    parser.add_argument("--state", help="Resume state path (default .cache/batch/<source id>.jsonl)")
+    parser.add_argument("--context-length", type=int, default=REVIEW_CONTEXT_LENGTH)
+    parser.add_argument("--max-tokens", type=int, default=REVIEW_MAX_TOKENS)
+    parser.add_argument("--fresh", action="store_true", help="Ignore results of an earlier run")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+
+    pool = BackendPool([url.strip() for url in args.hosts.split(",") if url.strip()])
+    review = BatchReview(pool, args.source, model=args.model, state_path=args.state,
+                         report_path=args.report, workers=args.workers,
+                         context_length=args.context_length, max_tokens=args.max_tokens)
+    if args.fresh:
+        review.reset()
+
+    def progress(result: Dict, stats: Dict):
+        status = f"failed: {result['error']}" if result.get("error") else f"{result['eval_count']} tokens"
+        print(f"[{stats['units_done']}/{stats['units_total']}] {unit_label(result)} {status} | "
+              f"{stats['files_per_minute']:.1f} files/min, {stats['tokens_per_second']:.1f} tokens/s",
+              flush=True)
+
+    try:
+        stats = review.run(progress)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted, rerun the same command to resume ({review.state_path})", file=sys.stderr)
+        return 130
+
+    print(f"\nReviewed {stats['files_done']}/{stats['files_total']} files in {stats['elapsed']:.0f}s "
+          f"({stats['resumed']} parts resumed, {stats['errors']} failed)")
+    print(f"Throughput: {stats['files_per_minute']:.1f} files/min, {stats['tokens_per_second']:.1f} tokens/s "
+          f"({stats['model_tokens_per_second']:.1f} tokens/s per request)")
+    print(f"Report: {review.report_path}")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Constants
+FAKE_VERSION = "0.0.0-fake"
+DEFAULT_MODELS = ["qwen2.5-coder:3b", "qwen2.5-coder:7b"]
+DEFAULT_NUM_PREDICT = 128
+CONTEXT_LENGTH = 32768
+CHARS_PER_TOKEN = 4
+
+# Answer the fake model streams, token by token and on repeat, with code fences
+# so the render path sees realistic markdown
+ANSWER_TOKENS = (
+    "Here is what the code does . \n\n"
+    "1 . It reads the input and splits it into words . \n"
+    "2 . It counts each word in a dictionary . \n\n"
+    "```python\n"
+    "def count_words ( text ) :\n"
+    "    counts = { }\n"
+    "    for word in text . split ( ) :\n"
+    "        counts [ word ] = counts . get ( word , 0 ) + 1\n"
+    "    return counts\n"
+    "```\n\n"
+    "The loop runs once per word , so it is linear in the input size . \n\n"
+).split(" ")
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Deterministic stand-in for an Ollama server
+
+    Token rate, chunk size, first-token latency, jitter and failures are
+    plain attributes and can be changed while the server runs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, models: Optional[List[str]] = None, tokens_per_second: float = 0.0,
+                 chunk_tokens: int = 1, first_token_latency: float = 0.0, prompt_tokens_per_second: float = 0.0,
+                 jitter: float = 0.0, fail_rate: float = 0.0, drop_rate: float = 0.0, seed: int = 0):
+        super().__init__(("127.0.0.1", port), FakeOllamaHandler)
+        self.models = models or list(DEFAULT_MODELS)
+        self.tokens_per_second = tokens_per_second  # 0 streams as fast as possible
+        self.chunk_tokens = chunk_tokens
+        self.first_token_latency = first_token_latency
+        self.prompt_tokens_per_second = prompt_tokens_per_second  # 0 makes prompt processing free
+        self.jitter = jitter  # Relative spread of every delay
+        self.fail_rate = fail_rate  # Share of chat requests answered with HTTP 500
+        self.drop_rate = drop_rate  # Share of chat requests whose connection drops mid-answer
+        self.seed = seed
+        self.requests = 0
+        self.last_chat: Optional[Dict] = None  # Body of the latest chat request, for tests
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def next_random(self) -> random.Random:
+        """Random source of the next request, the same sequence for the same seed"""
+        with self._lock:
+            self.requests += 1
+            return random.Random(self.seed * 1_000_003 + self.requests)
+
+    def start(self) -> "FakeOllama":
+        threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True).start()
+        return self
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOllama
+
+    def setup(self):
+        super().setup()
+        # Ollama's Go server disables Nagle, without this small chunks stall on delayed ACKs
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body: Dict, status: int = 200):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": FAKE_VERSION})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": name, "size": 0} for name in self.server.models]})
+        elif self.path == "/api/ps":
+            expires = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+            self._send_json({"models": [{"name": name, "size_vram": 0, "expires_at": expires}
+                                        for name in self.server.models[:1]]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if request.get("model") and request["model"] not in self.server.models:
+            self._send_json({"error": f"model '{request['model']}' not found"}, 404)
+        elif self.path == "/api/chat":
+            try:
+                self._chat(request)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # The client cancelled the request
+        elif self.path == "/api/show":
+            self._send_json({"model_info": {"fake.context_length": CONTEXT_LENGTH}})
+        elif self.path == "/api/generate":
+            # Only preloads are emulated: no prompt, non-streaming
+            self._send_json({"model": request.get("model"), "done": True, "done_reason": "load"})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _write_chunk(self, body: Dict):
+        raw = (json.dumps(body) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+        self.wfile.flush()
+
+    def _chat(self, request: Dict):
+        server = self.server
+        server.last_chat = request
+        rng = server.next_random()
+        if rng.random() < server.fail_rate:
+            self._send_json({"error": "injected failure"}, 500)
+            return
+
+        def jittered(delay: float) -> float:
+            return max(delay * (1 + rng.uniform(-server.jitter, server.jitter)), 0.0)
+
+        options = request.get("options") or {}
+        num_predict = options.get("num_predict") or DEFAULT_NUM_PREDICT
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // CHARS_PER_TOKEN
+        drop_at = rng.randrange(1, num_predict + 1) if rng.random() < server.drop_rate else None
+
+        started = time.perf_counter()
+        prompt_seconds = prompt_tokens / server.prompt_tokens_per_second if server.prompt_tokens_per_second else 0.0
+        time.sleep(jittered(server.first_token_latency + prompt_seconds))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        eval_started = time.perf_counter()
+        token_interval = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+        due = eval_started
+        sent = 0
+        while sent < num_predict:
+            count = min(server.chunk_tokens, num_predict - sent)
+            text = "".join(ANSWER_TOKENS[(sent + i) % len(ANSWER_TOKENS)] + " " for i in range(count))
+            if token_interval:
+                due += jittered(token_interval * count)
+                time.sleep(max(due - time.perf_counter(), 0.0))
+            if drop_at is not None and sent + count >= drop_at:
+                # Cut the connection without the chunked terminator
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            self._write_chunk({"model": request.get("model"), "message": {"role": "assistant", "content": text},
+                               "done": False})
+            sent += count
+
+        finished = time.perf_counter()
+        self._write_chunk({
+            "model": request.get("model"),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "length",
+            "total_duration": int((finished - started) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int((eval_started - started) * 1e9),
+            "eval_count": sent,
+            "eval_duration": int((finished - eval_started) * 1e9)
+        })
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server, e.g. to try the app without a model")
+    parser.add_argument("--port", type=int, default=11434, help="0 picks a free port")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="0 streams without pacing")
+    parser.add_argument("--chunk-tokens", type=int, default=1)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOllama(args.port, tokens_per_second=args.tokens_per_second, chunk_tokens=args.chunk_tokens,
+                        first_token_latency=args.first_token_latency,
+                        prompt_tokens_per_second=args.prompt_tokens_per_second, jitter=args.jitter,
+                        fail_rate=args.fail_rate, drop_rate=args.drop_rate, seed=args.seed)
+    # The benchmark runner reads the URL from the first line
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
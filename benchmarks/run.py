@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend_pool import BackendPool  # noqa: E402
+from code_index import CodeIndex, retrieve_context  # noqa: E402
+from context_builder import build_context, estimate_tokens  # noqa: E402
+from fake_ollama import ANSWER_TOKENS  # noqa: E402
+from ollama_client import OllamaError  # noqa: E402
+from scheduler import RequestScheduler  # noqa: E402
+from stream_renderer import StreamRenderer  # noqa: E402
+
+# Constants
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ollama.py")
+MODEL = "qwen2.5-coder:3b"
+SCHEMA_VERSION = 1
+SYSTEM_PROMPT = "You are an AI programming tutor for beginners. Explain concepts simply, with examples."
+HISTORY_LIMIT = 200  # Same as MAX_LOADED_MESSAGES in app.py
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(int(p * len(values)), len(values) - 1)]
+
+
+def ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+@contextmanager
+def fake_server(**options):
+    """Run the fake Ollama server in its own process, so its CPU time is not measured"""
+    command = [sys.executable, FAKE_SERVER, "--port", "0"]
+    for key, value in options.items():
+        command += [f"--{key.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        url = process.stdout.readline().strip()
+        if not url:
+            raise RuntimeError("Fake Ollama server did not start")
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def chat_payload(messages: List[Dict], num_predict: int) -> Dict:
+    return {"model": MODEL, "messages": messages, "stream": True,
+            "options": {"temperature": 0, "num_predict": num_predict, "num_ctx": 8192}}
+
+
+def run_request(pool: BackendPool, messages: List[Dict], num_predict: int) -> Dict:
+    """Stream one answer through the same pooled path the app uses"""
+    started = time.perf_counter()
+    stream = pool.chat_stream(chat_payload(messages, num_predict))
+    chunks = 0
+    try:
+        for _ in stream:
+            chunks += 1
+    finally:
+        stream.close()
+    return {"ttft": stream.ttft, "total": time.perf_counter() - started, "chunks": chunks,
+            "tokens": stream.final.get("eval_count", 0)}
+
+
+class NullContainer:
+    """Stands in for a Streamlit container and counts what would be sent to the browser"""
+
+    def __init__(self):
+        self.markdown_calls = 0
+        self.markdown_chars = 0
+
+    def empty(self) -> "NullContainer":
+        return self
+
+    def markdown(self, text: str):
+        self.markdown_calls += 1
+        self.markdown_chars += len(text)
+
+
+def scenario_first_token(quick: bool) -> Dict:
+    """Client overhead on top of the server's first-token latency"""
+    latency = 0.05
+    runs = 10 if quick else 50
+    with fake_server(first_token_latency=latency, tokens_per_second=500) as url:
+        pool = BackendPool([url])
+        results = [run_request(pool, [{"role": "user", "content": "Explain loops"}], 16) for _ in range(runs)]
+    ttfts = [r["ttft"] for r in results]
+    return {
+        "requests": runs,
+        "ttft_p50_ms": ms(percentile(ttfts, 0.5)),
+        "ttft_p95_ms": ms(percentile(ttfts, 0.95)),
+        "overhead_p50_ms": ms(percentile(ttfts, 0.5) - latency)
+    }
+
+
+def scenario_throughput(quick: bool) -> Dict:
+    """Client-side tokens per second and CPU per token against an unthrottled server"""
+    num_predict = 2000 if quick else 8000
+    runs = 2 if quick else 5
+    with fake_server(tokens_per_second=0) as url:
+        pool = BackendPool([url])
+        run_request(pool, [{"role": "user", "content": "warm up"}], 16)
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        tokens = sum(run_request(pool, [{"role": "user", "content": "Explain loops"}], num_predict)["tokens"]
+                     for _ in range(runs))
+        cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    return {
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / wall, 1),
+        "cpu_us_per_token": round(cpu / tokens * 1e6, 2)
+    }
+
+
+def scenario_render(quick: bool) -> Dict:
+    """CPU per token of the chat render loop and the markdown it pushes to the browser"""
+    tokens = 4000 if quick else 20000
+    container = NullContainer()
+    renderer = StreamRenderer(container)
+    cpu_started = time.process_time()
+    for i in range(tokens):
+        renderer.write(ANSWER_TOKENS[i % len(ANSWER_TOKENS)] + " ")
+    text = renderer.finish()
+    cpu = time.process_time() - cpu_started
+    return {
+        "tokens": tokens,
+        "cpu_us_per_token": round(cpu / tokens * 1e6, 2),
+        "renders": renderer.renders,
+        "markdown_chars_per_answer_char": round(container.markdown_chars / len(text), 2)
+    }
+
+
+def scenario_long_conversation(quick: bool) -> Dict:
+    """Payload build time and memory growth over a long chat"""
+    turns = 100 if quick else 400
+    history: List[Dict] = []
+    build_times = []
+    memory = {}
+    with fake_server(tokens_per_second=0) as url:
+        pool = BackendPool([url])
+        tracemalloc.start()
+        for turn in range(1, turns + 1):
+            prompt = f"Question {turn}: why does my loop over item_{turn} never stop?"
+            started = time.perf_counter()
+            messages, _ = build_context(SYSTEM_PROMPT, history, prompt, [], 8192, 1024)
+            build_times.append(time.perf_counter() - started)
+
+            stream = pool.chat_stream(chat_payload(messages, 96))
+            answer = "".join(stream)
+            history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": answer}]
+            del history[:-HISTORY_LIMIT]
+            if turn in (turns // 4, turns):
+                memory[turn] = tracemalloc.get_traced_memory()[0]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    first, last = sorted(memory)
+    return {
+        "turns": turns,
+        "payload_build_p50_ms": ms(percentile(build_times[-50:], 0.5)),
+        "payload_build_p95_ms": ms(percentile(build_times[-50:], 0.95)),
+        "memory_growth_bytes_per_turn": round((memory[last] - memory[first]) / (last - first), 1),
+        "memory_peak_kb": round(peak / 1024, 1)
+    }
+
+
+def scenario_concurrent_sessions(quick: bool) -> Dict:
+    """Latency and aggregate throughput with sessions sharing two generation slots"""
+    sessions = 8
+    per_session = 3 if quick else 10
+    scheduler = RequestScheduler(max_concurrent=2, max_queue=sessions)
+    ttfts: List[float] = []
+    tokens = []
+    lock = threading.Lock()
+
+    with fake_server(first_token_latency=0.05, tokens_per_second=200, jitter=0.2) as url:
+        pool = BackendPool([url])
+
+        def session(index: int):
+            for _ in range(per_session):
+                started = time.perf_counter()
+                ticket = scheduler.submit(f"session-{index}", MODEL)
+                scheduler.wait(ticket)
+                waited = time.perf_counter() - started
+                try:
+                    result = run_request(pool, [{"role": "user", "content": f"Question from {index}"}], 32)
+                finally:
+                    scheduler.release(ticket)
+                with lock:
+                    # First token as the user sees it, queue wait included
+                    ttfts.append(waited + result["ttft"])
+                    tokens.append(result["tokens"])
+
+        wall_started = time.perf_counter()
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+
+    stats = scheduler.stats()
+    return {
+        "sessions": sessions,
+        "requests": len(ttfts),
+        "ttft_p50_ms": ms(percentile(ttfts, 0.5)),
+        "ttft_p95_ms": ms(percentile(ttfts, 0.95)),
+        "queue_wait_p95_ms": ms(stats["wait_p95"]),
+        "aggregate_tokens_per_second": round(sum(tokens) / wall, 1)
+    }
+
+
+def synthetic_source(target_bytes: int) -> str:
+    """Python file of many small, distinct functions"""
+    parts = []
+    size = 0
+    index = 0
+    while size < target_bytes:
+        part = (f"def handler_{index}(request, retries={index % 5}):\n"
+                f"    \"\"\"Handle request type {index}\"\"\"\n"
+                f"    payload = request.get('field_{index}')\n"
+                f"    for attempt in range(retries):\n"
+                f"        if payload is not None:\n"
+                f"            return process_{index % 17}(payload, attempt)\n"
+                f"    return None\n\n\n")
+        parts.append(part)
+        size += len(part)
+        index += 1
+    return "".join(parts)
+
+
+def scenario_large_attachments(quick: bool) -> Dict:
+    """Indexing, retrieval and prompt processing for a large uploaded file"""
+    content = synthetic_source(256 * 1024 if quick else 1024 * 1024)
+    index = CodeIndex()
+    started = time.perf_counter()
+    index.add_file("handlers.py", content)
+    index_time = time.perf_counter() - started
+
+    prompt = "Why does handler_4242 return None when field_4242 is missing?"
+    started = time.perf_counter()
+    chunks = retrieve_context(index, prompt)
+    retrieval_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    messages, stats = build_context(SYSTEM_PROMPT, [], prompt, [], 8192, 1024, excerpts=chunks)
+    build_time = time.perf_counter() - started
+
+    with fake_server(tokens_per_second=200, prompt_tokens_per_second=4000) as url:
+        result = run_request(BackendPool([url]), messages, 32)
+    return {
+        "file_kb": len(content) // 1024,
+        "chunks_indexed": len(index),
+        "index_ms": ms(index_time),
+        "retrieval_ms": ms(retrieval_time),
+        "payload_build_ms": ms(build_time),
+        "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+        "ttft_ms": ms(result["ttft"])
+    }
+
+
+def scenario_failover(quick: bool) -> Dict:
+    """Success rate with one backend failing half its requests and both dropping some streams"""
+    runs = 20 if quick else 100
+    ok = 0
+    dropped = 0
+    ttfts = []
+    with fake_server(fail_rate=0.5, drop_rate=0.05, tokens_per_second=500, seed=1) as flaky, \
+            fake_server(drop_rate=0.05, tokens_per_second=500, seed=2) as healthy:
+        pool = BackendPool([flaky, healthy])
+        for _ in range(runs):
+            try:
+                result = run_request(pool, [{"role": "user", "content": "Explain recursion"}], 32)
+            except OllamaError:
+                dropped += 1
+                continue
+            ok += 1
+            ttfts.append(result["ttft"])
+    return {
+        "requests": runs,
+        "success_rate": round(ok / runs, 3),
+        "failovers": pool.failovers,
+        "mid_stream_failures": dropped,
+        "ttft_p95_ms": ms(percentile(ttfts, 0.95))
+    }
+
+
+SCENARIOS: Dict[str, Callable[[bool], Dict]] = {
+    "first_token": scenario_first_token,
+    "throughput": scenario_throughput,
+    "render": scenario_render,
+    "long_conversation": scenario_long_conversation,
+    "concurrent_sessions": scenario_concurrent_sessions,
+    "large_attachments": scenario_large_attachments,
+    "failover": scenario_failover
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, current: Dict):
+    """Print the relative change of every numeric metric against an earlier run"""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for name, metrics in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name, {})
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+                print(f"  {name}.{metric}: {old} -> {value} ({(value - old) / old:+.1%})")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the streaming path against a fake Ollama server")
+    parser.add_argument("scenarios", nargs="*", help=f"Any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations, for a smoke run")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario: {', '.join(unknown)}")
+
+    results = {
+        "schema": SCHEMA_VERSION,
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "scenarios": {}
+    }
+    for name in args.scenarios or list(SCENARIOS):
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        results["scenarios"][name] = SCENARIOS[name](args.quick)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
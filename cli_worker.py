@@ -0,0 +1,216 @@
+import argparse
+import atexit
+import codecs
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Constants
+OLLAMA_EXECUTABLE = "ollama"
+KEEPALIVE = "30m"  # How long the server keeps the model loaded after a CLI request
+READ_SIZE = 4096
+MAX_ERROR_BYTES = 4096  # Tail of stderr shown when ollama run fails
+
+
+class CliError(Exception):
+    """Raised when the ollama CLI cannot be started or fails"""
+
+
+def format_transcript(messages: List[Dict]) -> str:
+    """Flatten chat messages into one prompt, ending on the assistant's turn
+
+    `ollama run` reads a single prompt from a pipe, so the history window
+    built for the API goes in as a plain transcript.
+    """
+    labels = {"system": "System", "user": "User", "assistant": "Assistant"}
+    parts = [f"{labels.get(m['role'], m['role'].title())}: {m['content']}" for m in messages]
+    parts.append("Assistant:")
+    return "\n\n".join(parts)
+
+
+class CliStream:
+    """Output of one `ollama run` process, read with blocking reads as it arrives"""
+
+    def __init__(self, process: subprocess.Popen, prompt: str):
+        self.process = process
+        self.prompt = prompt
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self.error = ""
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            # With stdin closed, `ollama run` treats everything written as one prompt
+            self.process.stdin.write(self.prompt.encode("utf-8"))
+            self.process.stdin.close()
+        except OSError as e:
+            if self.closed:
+                return
+            raise CliError(f"ollama run exited before reading the prompt: {e}")
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            # Blocks until the process writes something or exits
+            block = self.process.stdout.read1(READ_SIZE)
+            if not block:
+                break
+            text = decoder.decode(block)
+            if text:
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.started
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+        self.returncode = self.process.wait()
+        if self.returncode != 0 and not self.closed:
+            self.error = self._read_errors()
+        self.process.error_log.close()
+
+    def _read_errors(self) -> str:
+        log = self.process.error_log
+        log.seek(max(log.seek(0, 2) - MAX_ERROR_BYTES, 0))
+        return log.read().decode("utf-8", errors="replace").strip()
+
+    def close(self):
+        self.closed = True
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.error_log.close()
+
+
+class CliWorker:
+    """Keeps a spawned `ollama run` per model waiting on stdin
+
+    Each request takes the waiting process, which has already started up and
+    looked up its model, and a replacement is spawned in the background. The
+    server keeps the model loaded between requests through --keepalive.
+    """
+
+    def __init__(self, executable: str = OLLAMA_EXECUTABLE, keepalive: str = KEEPALIVE):
+        self.executable = executable
+        self.keepalive = keepalive
+        self._spares: Dict[str, subprocess.Popen] = {}
+        self._lock = threading.Lock()
+        self.spawned = 0
+        self.warm_starts = 0
+        self.cold_starts = 0
+        atexit.register(self.shutdown)
+
+    def _spawn(self, model: str) -> subprocess.Popen:
+        # A file, not a pipe: nobody reads stderr while the answer streams, and a
+        # chatty process would block once a pipe buffer filled up
+        error_log = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(
+                [self.executable, "run", model, "--keepalive", self.keepalive],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=error_log
+            )
+        except OSError as e:
+            error_log.close()
+            raise CliError(f"Could not start {self.executable}: {e}")
+        process.error_log = error_log
+        self.spawned += 1
+        return process
+
+    def _replenish(self, model: str):
+        """Spawn the next waiting process for a model, unless one exists"""
+        with self._lock:
+            if model in self._spares:
+                return
+        try:
+            process = self._spawn(model)
+        except CliError:
+            return
+        with self._lock:
+            if model in self._spares:
+                process.kill()
+                return
+            self._spares[model] = process
+
+    def warm(self, model: str):
+        """Start a waiting process for a model ahead of its first request"""
+        threading.Thread(target=self._replenish, args=(model,), daemon=True).start()
+
+    def stream(self, model: str, prompt: str) -> CliStream:
+        """Run a prompt on the waiting process of a model, spawning one if there is none"""
+        with self._lock:
+            process = self._spares.pop(model, None)
+        if process is not None and process.poll() is None:
+            self.warm_starts += 1
+        else:
+            # The spare died, e.g. the model was removed or the server restarted
+            process = self._spawn(model)
+            self.cold_starts += 1
+        self.warm(model)
+        return CliStream(process, prompt)
+
+    def shutdown(self):
+        with self._lock:
+            spares, self._spares = list(self._spares.values()), {}
+        for process in spares:
+            if process.poll() is None:
+                process.kill()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waiting = sorted(self._spares)
+        return {
+            "waiting": waiting,
+            "spawned": self.spawned,
+            "warm_starts": self.warm_starts,
+            "cold_starts": self.cold_starts
+        }
+
+
+def benchmark_first_token(model: str, runs: int = 5, prompt: str = "Say hello.",
+                          host: Optional[str] = None) -> Dict:
+    """Median first-token latency of the API path, a fresh CLI process and the warm CLI worker"""
+    from ollama_client import OllamaClient, DEFAULT_OLLAMA_URL
+
+    client = OllamaClient(host or DEFAULT_OLLAMA_URL)
+    worker = CliWorker()
+    worker.warm(model)
+    messages = [{"role": "user", "content": prompt}]
+    payload = {"model": model, "messages": messages, "stream": True,
+               "options": {"num_predict": 8, "temperature": 0}}
+    timings: Dict[str, List[float]] = {"api": [], "cli_cold": [], "cli_warm": []}
+
+    def first_token(stream) -> Optional[float]:
+        try:
+            for _ in stream:
+                break
+            return stream.ttft
+        finally:
+            stream.close()
+
+    for _ in range(runs):
+        timings["api"].append(first_token(client.chat_stream(payload)))
+        timings["cli_cold"].append(first_token(CliStream(worker._spawn(model), format_transcript(messages))))
+        # Give the background spawn time to finish, as it would between chat turns
+        time.sleep(1.0)
+        timings["cli_warm"].append(first_token(worker.stream(model, format_transcript(messages))))
+    worker.shutdown()
+
+    def median(values: List[Optional[float]]) -> Optional[float]:
+        values = sorted(v for v in values if v is not None)
+        return values[len(values) // 2] if values else None
+
+    return {path: median(values) for path, values in timings.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare first-token latency of the API and CLI paths")
+    parser.add_argument("--model", default="qwen2.5-coder:3b")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--host", help="Ollama server for the API path")
+    args = parser.parse_args()
+    for path, ttft in benchmark_first_token(args.model, args.runs, host=args.host).items():
+        print(f"{path:9s} {ttft * 1000:8.1f} ms" if ttft is not None else f"{path:9s}   failed")
@@ -0,0 +1,252 @@
+import ast
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from context_builder import estimate_tokens
+
+# Constants
+WINDOW_LINES = 60  # Fallback chunk size for non-Python files
+WINDOW_OVERLAP = 10
+MAX_SYMBOL_LINES = 120  # Larger classes are split into their methods
+TOP_K = 6
+RETRIEVAL_MIN_TOKENS = 1500  # Smaller attachments are sent whole, retrieval sends at least this much code
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "is", "it", "this", "that",
+    "what", "how", "why", "does", "do", "my", "me", "i", "can", "you", "for",
+    "with", "on", "be", "are", "explain", "please", "code", "file"
+}
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, breaking snake_case and camelCase apart"""
+    terms = []
+    for word in IDENTIFIER.findall(text):
+        lowered = word.lower()
+        if lowered not in STOPWORDS:
+            terms.append(lowered)
+        parts = [p.lower() for piece in word.split("_") for p in CAMEL_PART.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+def _window_chunks(lines: List[str], start: int, end: int, symbol: Optional[str] = None) -> List[Dict]:
+    """Cut lines[start:end] into overlapping windows, line numbers are 1-based"""
+    chunks = []
+    step = WINDOW_LINES - WINDOW_OVERLAP
+    pos = start
+    while pos < end:
+        stop = min(pos + WINDOW_LINES, end)
+        text = "\n".join(lines[pos:stop])
+        if text.strip():
+            chunks.append({"start": pos + 1, "end": stop, "symbol": symbol, "text": text})
+        if stop == end:
+            break
+        pos += step
+    return chunks
+
+
+def _symbol_chunks(lines: List[str], start: int, end: int, symbol: str) -> List[Dict]:
+    """One chunk for a symbol, or windows over it when it is too long"""
+    if end - start > MAX_SYMBOL_LINES:
+        return _window_chunks(lines, start, end, symbol)
+    return [{"start": start + 1, "end": end, "symbol": symbol, "text": "\n".join(lines[start:end])}]
+
+
+def _python_chunks(content: str, lines: List[str]) -> Optional[List[Dict]]:
+    """Chunk Python source along top-level functions and classes"""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+
+    chunks = []
+    covered = 0  # Index of the first line not yet assigned to a chunk
+
+    def symbol_span(node) -> tuple:
+        first = min([d.lineno for d in getattr(node, "decorator_list", [])] + [node.lineno])
+        return first - 1, node.end_lineno
+
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start, end = symbol_span(node)
+
+        # Module-level code between symbols (imports, constants, scripts)
+        if start > covered:
+            chunks.extend(_window_chunks(lines, covered, start, "module"))
+
+        kind = "class" if isinstance(node, ast.ClassDef) else "def"
+        if kind == "class" and end - start > MAX_SYMBOL_LINES:
+            # Split a large class into its header and one chunk per method
+            methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            cursor = start
+            for method in methods:
+                m_start, m_end = symbol_span(method)
+                if m_start > cursor:
+                    chunks.extend(_window_chunks(lines, cursor, m_start, f"class {node.name}"))
+                chunks.extend(_symbol_chunks(lines, m_start, m_end, f"def {node.name}.{method.name}"))
+                cursor = m_end
+            if end > cursor:
+                chunks.extend(_window_chunks(lines, cursor, end, f"class {node.name}"))
+        else:
+            chunks.extend(_symbol_chunks(lines, start, end, f"{kind} {node.name}"))
+        covered = end
+
+    if covered < len(lines):
+        chunks.extend(_window_chunks(lines, covered, len(lines), "module"))
+    return chunks
+
+
+def chunk_file(name: str, content: str) -> List[Dict]:
+    """Split a file into symbol-aware chunks, falling back to line windows"""
+    lines = content.splitlines()
+    chunks = None
+    if name.lower().endswith(".py"):
+        chunks = _python_chunks(content, lines)
+    if chunks is None:
+        chunks = _window_chunks(lines, 0, len(lines))
+    for chunk in chunks:
+        chunk["file"] = name
+    return chunks
+
+
+class CodeIndex:
+    """In-memory BM25 index over the chunks of uploaded files
+
+    With a loader, chunk text is dropped after indexing and sliced back out
+    of the file body on retrieval, so the index holds only terms and ranges.
+    """
+
+    def __init__(self, loader: Optional[Callable[[str], str]] = None):
+        self.loader = loader
+        self.chunks: List[Dict] = []
+        self._term_freqs: List[Counter] = []
+        self._doc_freq: Counter = Counter()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def files(self) -> List[str]:
+        return list(dict.fromkeys(chunk["file"] for chunk in self.chunks))
+
+    def add_file(self, name: str, content: str, ref: Optional[str] = None):
+        """Index a file, replacing any earlier version with the same name
+
+        ref is the key the loader fetches the body with, e.g. its content hash.
+        """
+        self.remove_file(name)
+        for chunk in chunk_file(name, content):
+            # Symbol and file names are searchable alongside the body
+            terms = Counter(tokenize(f"{name} {chunk['symbol'] or ''} {chunk['text']}"))
+            if self.loader is not None and ref is not None:
+                chunk["ref"] = ref
+                del chunk["text"]
+            self.chunks.append(chunk)
+            self._term_freqs.append(terms)
+            self._doc_freq.update(terms.keys())
+            self._total_length += sum(terms.values())
+
+    def remove_file(self, name: str):
+        keep = [i for i, chunk in enumerate(self.chunks) if chunk["file"] != name]
+        if len(keep) == len(self.chunks):
+            return
+        for i, terms in enumerate(self._term_freqs):
+            if self.chunks[i]["file"] == name:
+                self._doc_freq.subtract(terms.keys())
+                self._total_length -= sum(terms.values())
+        self._doc_freq += Counter()  # Drop terms whose count reached zero
+        self.chunks = [self.chunks[i] for i in keep]
+        self._term_freqs = [self._term_freqs[i] for i in keep]
+
+    def chunk_text(self, chunk: Dict) -> str:
+        if "text" in chunk:
+            return chunk["text"]
+        lines = self.loader(chunk["ref"]).splitlines()
+        return "\n".join(lines[chunk["start"] - 1:chunk["end"]])
+
+    def search(self, query: str, k: int = TOP_K) -> List[Dict]:
+        """Return the k best matching chunks with their BM25 score"""
+        if not self.chunks:
+            return []
+        n = len(self.chunks)
+        avg_length = self._total_length / n or 1.0
+        query_terms = set(tokenize(query))
+
+        scored = []
+        for i, terms in enumerate(self._term_freqs):
+            length = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term)
+                if not tf:
+                    continue
+                df = self._doc_freq[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+            # A chunk sharing no term with the query is not relevant, however few chunks match
+            if score > 0:
+                scored.append((score, i))
+
+        # Stable sort, so on ties earlier chunks of earlier files win
+        scored.sort(key=lambda item: -item[0])
+        return [dict(self.chunks[i], score=score) for score, i in scored[:k]]
+
+
+def retrieve_context(index: CodeIndex, query: str, k: int = TOP_K, min_tokens: int = 0) -> List[Dict]:
+    """Top-k chunks as attachment entries, in file and line order
+
+    Hits worth fewer than min_tokens are topped up with the leading chunks
+    of each file, so a question that shares few terms with the code, like
+    "what does this do?", still shows the model some code.
+    """
+    hits = [(chunk, index.chunk_text(chunk)) for chunk in index.search(query, k)]
+    tokens = sum(estimate_tokens(text) for _, text in hits)
+    if tokens < min_tokens:
+        taken = {(chunk["file"], chunk["start"]) for chunk, _ in hits}
+        rank = Counter()
+        leading = []
+        for chunk in index.chunks:
+            leading.append((rank[chunk["file"]], chunk))
+            rank[chunk["file"]] += 1
+        # Round robin over the files, each shows its opening before any shows more
+        for _, chunk in sorted(leading, key=lambda item: item[0]):
+            if tokens >= min_tokens:
+                break
+            if (chunk["file"], chunk["start"]) not in taken:
+                text = index.chunk_text(chunk)
+                hits.append((chunk, text))
+                tokens += estimate_tokens(text)
+
+    file_order = {name: i for i, name in enumerate(index.files())}
+    attachments = []
+    for chunk, text in sorted(hits, key=lambda hit: (file_order[hit[0]["file"]], hit[0]["start"])):
+        label = f"{chunk['file']} (lines {chunk['start']}-{chunk['end']}"
+        label += f", {chunk['symbol']})" if chunk["symbol"] and chunk["symbol"] != "module" else ")"
+        attachments.append({"name": label, "content": text})
+    return attachments
+
+
+def select_context(index: CodeIndex, files: List[Dict], query: str, whole_files: bool = False,
+                   min_tokens: int = RETRIEVAL_MIN_TOKENS) -> Tuple[List[Dict], Optional[Dict]]:
+    """Whole files when they are small or the prompt is about all of them, otherwise relevant chunks
+
+    files are attachment entries with name and content. Returns what to
+    attach and, when it is retrieved chunks, the retrieval stats.
+    """
+    total_tokens = sum(estimate_tokens(f["content"]) for f in files)
+    if whole_files or total_tokens <= min_tokens:
+        return files, None
+    chunks = retrieve_context(index, query, min_tokens=min_tokens)
+    if not chunks:
+        return files, None  # Nothing indexed, e.g. right after a restart
+    return chunks, {"chunks": len(chunks), "indexed_chunks": len(index), "file_tokens": total_tokens}
@@ -0,0 +1,222 @@
+import hashlib
+import math
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+CHARS_PER_TOKEN = 4  # Rough average for code and English prose
+MESSAGE_OVERHEAD = 4  # Role markers and separators per chat message
+DEFAULT_CONTEXT_LENGTH = 8192
+MIN_PROMPT_BUDGET = 512
+ATTACHMENT_SHARE = 0.6  # Part of the remaining budget files may take before history
+VERBATIM_TURNS = 2  # Most recent history messages that are never summarized
+HISTORY_STRIDE = 8  # Old history is cut on multiples of this, keeping the prompt prefix stable
+SUMMARY_CHARS = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def prompt_budget(context_length: int, max_tokens: int) -> int:
+    """Tokens left for the prompt once room for the answer is reserved"""
+    return max(context_length - max_tokens, MIN_PROMPT_BUDGET)
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of text within max_tokens, marking the cut"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    keep = max(max_chars - 80, 0)
+    head = text[:keep * 2 // 3]
+    tail = text[len(text) - keep // 3:] if keep // 3 else ""
+    omitted = text[len(head):len(text) - len(tail)].count("\n") + 1
+    return f"{head}\n... [{omitted} lines omitted to fit the context window] ...\n{tail}"
+
+
+def summarize_turn(content: str, limit: int = SUMMARY_CHARS) -> str:
+    """Shorten an older chat turn to its opening, dropping code blocks"""
+    kept = []
+    in_code = False
+    for line in content.splitlines():
+        if line.strip().startswith("```"):
+            in_code = not in_code
+            continue
+        if not in_code and line.strip():
+            kept.append(line.strip())
+    summary = " ".join(kept)
+    if len(summary) > limit:
+        summary = summary[:limit].rsplit(" ", 1)[0] + " …"
+    return f"[Earlier message, summarized] {summary}"
+
+
+def format_attachments(files: List[Dict]) -> str:
+    """Render attachments the way they are shown to the model"""
+    if not files:
+        return ""
+    file_context = "\n\n**Attached files:**\n"
+    for file_data in files:
+        file_context += f"\n--- File: {file_data['name']} ---\n"
+        file_context += file_data["content"] + "\n"
+    return file_context
+
+
+def fit_attachments(files: List[Dict], budget: int) -> Tuple[List[Dict], List[Dict]]:
+    """Fit files into budget, smallest first, truncating the ones that overflow"""
+    fitted = []
+    stats = []
+    remaining = budget
+    order = sorted(range(len(files)), key=lambda i: len(files[i]["content"]))
+
+    for position, index in enumerate(order):
+        file_data = files[index]
+        cost = estimate_tokens(file_data["content"]) + MESSAGE_OVERHEAD
+        # Share what is left evenly between this file and the larger ones after it
+        share = remaining // (len(order) - position)
+
+        if cost <= share:
+            fitted.append((index, file_data))
+            stats.append({"name": file_data["name"], "tokens": cost, "mode": "full"})
+            remaining -= cost
+        elif share > MESSAGE_OVERHEAD * 16:
+            content = truncate_middle(file_data["content"], share - MESSAGE_OVERHEAD)
+            used = estimate_tokens(content) + MESSAGE_OVERHEAD
+            fitted.append((index, {"name": file_data["name"], "content": content}))
+            stats.append({"name": file_data["name"], "tokens": used, "mode": "truncated",
+                          "original_tokens": cost})
+            remaining -= used
+        else:
+            stats.append({"name": file_data["name"], "tokens": 0, "mode": "dropped",
+                          "original_tokens": cost})
+
+    # Keep the upload order in the prompt
+    fitted.sort(key=lambda item: item[0])
+    return [file_data for _, file_data in fitted], stats
+
+
+def fit_history(history: List[Dict], budget: int) -> Tuple[List[Dict], List[Dict]]:
+    """Pack history newest first, summarizing older turns and dropping what is left
+
+    Summarizing and dropping both stop on a stride boundary (by message seq
+    where known), so messages already sent stay byte-identical and the cut
+    only moves every few turns instead of on every turn.
+    """
+    packed = []
+    stats = []
+    remaining = budget
+
+    def position(index: int) -> int:
+        return history[index].get("seq", index + 1) - 1
+
+    # Older messages are summarized, the verbatim tail grows until the next stride boundary
+    verbatim_from = 0
+    if history:
+        verbatim_from = (position(len(history) - 1) + 1 - VERBATIM_TURNS) // HISTORY_STRIDE * HISTORY_STRIDE
+
+    for age, msg in enumerate(reversed(history)):
+        content = msg["content"]
+        mode = "full"
+        cost = estimate_tokens(content) + MESSAGE_OVERHEAD
+
+        if position(len(history) - 1 - age) < verbatim_from or cost > remaining:
+            summary = summarize_turn(content)
+            summary_cost = estimate_tokens(summary) + MESSAGE_OVERHEAD
+            if summary_cost < cost:
+                content, cost, mode = summary, summary_cost, "summarized"
+
+        if cost > remaining:
+            break
+
+        packed.append({"role": msg["role"], "content": content})
+        stats.append({"role": msg["role"], "tokens": cost, "mode": mode})
+        remaining -= cost
+
+    packed.reverse()
+    stats.reverse()
+
+    start = len(history) - len(packed)
+    if start:
+        aligned = start
+        while aligned < len(history) - VERBATIM_TURNS and position(aligned) % HISTORY_STRIDE:
+            aligned += 1
+        packed, stats = packed[aligned - start:], stats[aligned - start:]
+    return packed, stats
+
+
+def build_context(system_prompt: Optional[str], history: List[Dict], prompt: str,
+                  files: List[Dict], context_length: int = DEFAULT_CONTEXT_LENGTH,
+                  max_tokens: int = 2048, excerpts: List[Dict] = ()) -> Tuple[List[Dict], Dict]:
+    """Assemble chat messages within the token budget and report what it cost
+
+    Whole files go into the leading system message with a budget that does
+    not depend on the question, so the prefix stays byte-identical across
+    turns and the server can reuse its prompt cache. Excerpts retrieved for
+    this question go with the question itself. Then as much recent history
+    as still fits.
+    """
+    budget = prompt_budget(context_length, max_tokens)
+    messages = []
+
+    system_tokens = 0
+    if system_prompt and system_prompt.strip():
+        system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD
+
+    fitted_files, file_stats = fit_attachments(files, int(max(budget - system_tokens, 0) * ATTACHMENT_SHARE))
+    pinned_tokens = sum(f["tokens"] for f in file_stats)
+    leading = (system_prompt if system_tokens else "") + format_attachments(fitted_files)
+    if leading:
+        messages.append({"role": "system", "content": leading if system_tokens else leading.lstrip()})
+
+    prompt_tokens = estimate_tokens(prompt) + MESSAGE_OVERHEAD
+    remaining = max(budget - system_tokens - pinned_tokens - prompt_tokens, 0)
+
+    fitted_excerpts, excerpt_stats = fit_attachments(list(excerpts), int(remaining * ATTACHMENT_SHARE))
+    excerpt_tokens = sum(f["tokens"] for f in excerpt_stats)
+    remaining -= excerpt_tokens
+    file_tokens = pinned_tokens + excerpt_tokens
+
+    packed_history, history_stats = fit_history(history, remaining)
+    history_tokens = sum(h["tokens"] for h in history_stats)
+
+    messages.extend(packed_history)
+    messages.append({"role": "user", "content": prompt + format_attachments(fitted_excerpts)})
+
+    stats = {
+        "budget": budget,
+        "context_length": context_length,
+        "used": system_tokens + prompt_tokens + file_tokens + history_tokens,
+        "system_tokens": system_tokens,
+        "prompt_tokens": prompt_tokens,
+        "file_tokens": file_tokens,
+        "history_tokens": history_tokens,
+        "files": file_stats + excerpt_stats,
+        "history": history_stats,
+        "history_dropped": len(history) - len(history_stats),
+        # Tokens of the leading message and its hash, unchanged hashes mean prefix cache hits
+        "prefix_tokens": system_tokens + pinned_tokens,
+        "prefix_hash": hashlib.sha256(leading.encode("utf-8")).hexdigest()[:12]
+    }
+    return messages, stats
+
+
+def describe_stats(stats: Dict) -> str:
+    """One-line summary of a context build for the chat caption"""
+    summarized = sum(1 for h in stats["history"] if h["mode"] == "summarized")
+    parts = [f"{stats['used']:,} / {stats['budget']:,} prompt tokens"]
+    parts.append(f"{len(stats['history'])} history msgs"
+                 + (f" ({summarized} summarized)" if summarized else "")
+                 + (f", {stats['history_dropped']} dropped" if stats["history_dropped"] else ""))
+    retrieval = stats.get("retrieval")
+    if retrieval:
+        parts.append(f"{retrieval['chunks']} of {retrieval['indexed_chunks']} file chunks retrieved "
+                     f"(files total {retrieval['file_tokens']:,} tokens)")
+    elif stats["files"]:
+        shortened = sum(1 for f in stats["files"] if f["mode"] != "full")
+        parts.append(f"{len(stats['files'])} file(s)"
+                     + (f" ({shortened} truncated or dropped)" if shortened else ""))
+    if stats.get("static_findings"):
+        parts.append(f"{stats['static_findings']} static analysis hints")
+    return " • ".join(parts)
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+# Constants
+CONVERSATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "conversations.sqlite3")
+PAGE_SIZE = 20
+EXPORT_BATCH = 200
+
+
+class ConversationStore:
+    """Append-only SQLite store of chat messages, indexed by conversation"""
+
+    def __init__(self, path: str = CONVERSATIONS_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id TEXT PRIMARY KEY, created REAL NOT NULL, updated REAL NOT NULL, model TEXT);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+            " content TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (conversation_id, seq));"
+        )
+        self._db.commit()
+
+    def create(self, model: Optional[str] = None) -> str:
+        """Start a new conversation and return its id"""
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO conversations (id, created, updated, model) VALUES (?, ?, ?, ?)",
+                             (conversation_id, now, now, model))
+            self._db.commit()
+        return conversation_id
+
+    def exists(self, conversation_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id: str, role: str, content: str) -> int:
+        """Append a message and return its sequence number"""
+        now = time.time()
+        with self._lock:
+            seq = self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO messages (conversation_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, seq, role, content, now)
+            )
+            self._db.execute("UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation_id))
+            self._db.commit()
+        return seq
+
+    def count(self, conversation_id: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+
+    def page(self, conversation_id: str, before_seq: Optional[int] = None, limit: int = PAGE_SIZE) -> List[Dict]:
+        """Up to limit messages preceding before_seq (or the newest ones), oldest first"""
+        query = "SELECT seq, role, content FROM messages WHERE conversation_id = ?"
+        params: list = [conversation_id]
+        if before_seq is not None:
+            query += " AND seq < ?"
+            params.append(before_seq)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [{"seq": seq, "role": role, "content": content} for seq, role, content in reversed(rows)]
+
+    def iter_messages(self, conversation_id: str) -> Iterator[Dict]:
+        """All messages of a conversation in order, read in batches"""
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT seq, role, content, created FROM messages"
+                    " WHERE conversation_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (conversation_id, last_seq, EXPORT_BATCH)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, role, content, created in rows:
+                yield {"role": role, "content": content, "timestamp": created}
+            last_seq = rows[-1][0]
+
+    def export(self, conversation_id: str, fileobj, header: Dict):
+        """Write a conversation as JSON, streaming the messages row by row"""
+        fileobj.write("{\n")
+        for key, value in header.items():
+            fileobj.write(f"  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+        fileobj.write('  "messages": [')
+        for i, message in enumerate(self.iter_messages(conversation_id)):
+            fileobj.write(("," if i else "") + "\n    " + json.dumps(message, ensure_ascii=False))
+        fileobj.write("\n  ]\n}\n")
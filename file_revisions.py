@@ -0,0 +1,58 @@
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+DIFF_CONTEXT = 3  # Unchanged lines kept around each changed hunk
+MAX_DIFF_SHARE = 0.5  # Above this share of the new file, the whole file is sent instead
+REVIEW_NOTES_CHARS = 2000  # Head of the prior review kept as notes for the next revision
+MAX_VERSIONS = 10  # Revisions remembered per file name
+
+
+def diff_hunks(old: str, new: str, context: int = DIFF_CONTEXT) -> Tuple[str, Dict]:
+    """Unified diff of two revisions with a little context, and what it changed"""
+    lines = list(difflib.unified_diff(old.splitlines(), new.splitlines(), "previous", "current",
+                                      n=context, lineterm=""))
+    stats = {
+        "hunks": sum(1 for line in lines if line.startswith("@@")),
+        "added": sum(1 for line in lines if line.startswith("+") and not line.startswith("+++")),
+        "removed": sum(1 for line in lines if line.startswith("-") and not line.startswith("---"))
+    }
+    return "\n".join(lines[2:]), stats
+
+
+def review_notes(answer: str, limit: int = REVIEW_NOTES_CHARS) -> str:
+    """Notes of a review to carry over to the next revision of the file"""
+    answer = answer.strip()
+    if len(answer) <= limit:
+        return answer
+    cut = answer.rfind("\n", 0, limit)
+    return answer[:cut if cut > limit // 2 else limit].rstrip() + "\n[...]"
+
+
+def revision_notes_key(file_ref: Dict, notes: Dict[str, str]) -> Optional[str]:
+    """Notes of the reviewed previous revision of a file, None once the file has notes of its own"""
+    if file_ref["sha256"] in notes:
+        return None
+    return notes.get(file_ref.get("previous"))
+
+
+def review_targets(file_refs: List[Dict], notes: Dict[str, str], review: bool) -> List[Dict]:
+    """Attached revisions an answer becomes the notes of, a review replaces the notes of other answers"""
+    return [file_ref for file_ref in file_refs if review or file_ref["sha256"] not in notes]
+
+
+def revision_content(old: str, new: str, revision: int, notes: Optional[str] = None,
+                     max_share: float = MAX_DIFF_SHARE) -> Optional[str]:
+    """What the model needs to re-review a revised file, None if the whole file is cheaper
+
+    Only the changed hunks go in, with the notes of the review of the previous
+    revision, so an iterative fix-and-upload loop is not reviewed from scratch.
+    """
+    diff, stats = diff_hunks(old, new)
+    if not stats["hunks"] or len(diff) > max_share * len(new):
+        return None
+    content = (f"[Revision {revision}: {stats['hunks']} changed hunk(s), +{stats['added']} -{stats['removed']} "
+               f"lines since the previous upload, unchanged code is omitted]\n{diff}")
+    if notes:
+        content += f"\n\n[Notes from the review of the previous revision]\n{notes}"
+    return content
@@ -0,0 +1,200 @@
+import codecs
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Constants
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "files")
+MAX_FILE_BYTES = 2 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+SNIFF_BYTES = 8192
+MAX_CONTROL_RATIO = 0.05  # Share of control bytes above which a file counts as binary
+MEMORY_ITEMS = 32  # File bodies kept decoded in memory
+MAX_DISK_BYTES = int(os.environ.get("FILE_STORE_CAP_MB", 256)) * 1024 * 1024  # Least recently used go first
+# Tried in order when a file is not UTF-8. cp1252 leaves a few bytes undefined,
+# so binary data that got past the sniffing is still rejected.
+FALLBACK_ENCODINGS = ["cp1252"]
+MISSING_TEXT = "[This file is no longer stored on the server, please upload it again]"
+
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+TEXT_CONTROL_BYTES = {0x09, 0x0A, 0x0C, 0x0D, 0x1B}
+
+
+class IngestError(Exception):
+    """Raised when an upload is rejected before it is stored"""
+
+
+def detect_encoding(head: bytes) -> Optional[str]:
+    """Encoding named by a byte order mark, if the file starts with one"""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+
+def looks_binary(head: bytes) -> bool:
+    """Guess from the first bytes whether a file is binary rather than text"""
+    if not head:
+        return False
+    if b"\x00" in head:
+        return True
+    control = sum(1 for byte in head if byte < 0x20 and byte not in TEXT_CONTROL_BYTES)
+    return control / len(head) > MAX_CONTROL_RATIO
+
+
+def _decode_stream(fileobj, encoding: str, hasher, max_bytes: int) -> str:
+    """Decode a file block by block with an incremental decoder"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    parts = []
+    total = 0
+    while True:
+        block = fileobj.read(BLOCK_SIZE)
+        if not block:
+            break
+        total += len(block)
+        if total > max_bytes:
+            raise IngestError(f"File is larger than {max_bytes / 1024 / 1024:.0f} MB")
+        hasher.update(block)
+        parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def read_text(name: str, fileobj, size: Optional[int] = None,
+              max_bytes: int = MAX_FILE_BYTES) -> Tuple[str, str, str]:
+    """Validate and decode a text file, returning its text, SHA-256 and encoding"""
+    if size is not None and size > max_bytes:
+        raise IngestError(f"{name} is {size / 1024 / 1024:.1f} MB, the limit is "
+                          f"{max_bytes / 1024 / 1024:.0f} MB")
+
+    head = fileobj.read(SNIFF_BYTES)
+    encoding = detect_encoding(head)
+    if encoding is None and looks_binary(head):
+        raise IngestError(f"{name} looks like a binary file")
+
+    for candidate in ([encoding] if encoding else ["utf-8"] + FALLBACK_ENCODINGS):
+        fileobj.seek(0)
+        hasher = hashlib.sha256()
+        try:
+            text = _decode_stream(fileobj, candidate, hasher, max_bytes)
+        except UnicodeDecodeError:
+            continue
+        return text, hasher.hexdigest(), candidate
+    raise IngestError(f"{name} is not valid text")
+
+
+class FileStore:
+    """Content-addressed store of decoded file bodies, shared across sessions
+
+    Bodies live on disk under their SHA-256 with a small in-memory LRU in
+    front, so sessions only need to keep the hash. The disk is capped too:
+    reads refresh a file's mtime and the least recently used go first.
+    """
+
+    def __init__(self, root: str = FILES_DIR, memory_items: int = MEMORY_ITEMS, max_disk_bytes: int = MAX_DISK_BYTES):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(root) if entry.name.endswith(".txt"))
+        self.evicted = 0
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, f"{sha256}.txt")
+
+    def has(self, sha256: str) -> bool:
+        with self._lock:
+            if sha256 in self._memory:
+                return True
+        return os.path.exists(self._path(sha256))
+
+    def _remember(self, sha256: str, text: str):
+        with self._lock:
+            self._memory[sha256] = text
+            self._memory.move_to_end(sha256)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _touch(self, sha256: str):
+        try:
+            os.utime(self._path(sha256))
+        except OSError:
+            pass
+
+    def put(self, sha256: str, text: str):
+        if not os.path.exists(self._path(sha256)):
+            tmp = f"{self._path(sha256)}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            os.replace(tmp, self._path(sha256))
+            with self._lock:
+                self._disk_bytes += os.path.getsize(self._path(sha256))
+            self._enforce_cap(keep=sha256)
+        self._remember(sha256, text)
+
+    def _enforce_cap(self, keep: str):
+        """Delete the least recently used bodies until the store fits its disk cap"""
+        with self._lock:
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            entries = sorted((e for e in os.scandir(self.root) if e.name.endswith(".txt")),
+                             key=lambda e: e.stat().st_mtime)
+            for entry in entries:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                sha256 = entry.name[:-len(".txt")]
+                if sha256 == keep:
+                    continue
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+                self._memory.pop(sha256, None)
+                self.evicted += 1
+
+    def load(self, sha256: str) -> str:
+        """Body of a stored file, read from disk on a memory miss"""
+        with self._lock:
+            text = self._memory.get(sha256)
+            if text is not None:
+                self._memory.move_to_end(sha256)
+        if text is not None:
+            self._touch(sha256)
+            return text
+        try:
+            with open(self._path(sha256), "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+        except FileNotFoundError:
+            # Evicted under the disk cap while a session still refers to it
+            return MISSING_TEXT
+        self._touch(sha256)
+        self._remember(sha256, text)
+        return text
+
+    def ingest(self, name: str, fileobj, size: Optional[int] = None,
+               max_bytes: int = MAX_FILE_BYTES) -> Dict:
+        """Validate, decode, hash and store an upload, returning its reference"""
+        text, sha256, encoding = read_text(name, fileobj, size, max_bytes)
+        if not self.has(sha256):
+            self.put(sha256, text)
+        else:
+            self._touch(sha256)
+            self._remember(sha256, text)
+
+        return {
+            "name": name,
+            "sha256": sha256,
+            "size": len(text),
+            "lines": len(text.splitlines()),
+            "encoding": encoding
+        }
@@ -0,0 +1,174 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from generation_registry import GenerationHandle, GenerationRegistry
+from metrics import MetricsRecorder, RequestTrace
+
+# Constants
+JOB_TTL = 600.0  # Seconds a finished answer waits for a script run to show it
+READ_TIMEOUT = 0.5
+
+
+class GenerationJob:
+    """A chat answer generated in the background, buffered for the script runs that show it
+
+    The whole answer is kept, it is bounded by num_predict, so a script run that
+    starts after a rerun or a browser reconnect can replay it from the start and
+    follow the rest live.
+    """
+
+    def __init__(self, key: str, session_id: str, model: str, prompt: str,
+                 handle: GenerationHandle, trace: RequestTrace):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.session_id = session_id
+        self.model = model
+        self.prompt = prompt
+        self.handle = handle
+        self.trace = trace
+        self.created = time.monotonic()
+        self.finished: Optional[float] = None
+        self.parts: List[str] = []
+        self.stats: Dict = {}  # Shown under the answer, e.g. ttft and token counts
+        self.context_stats: Dict = {}
+        self.queue_position = 0
+        self.queue_wait = 0.0
+        self.seq: Optional[int] = None  # Sequence number of the stored answer
+        self.released = False
+        self._cond = threading.Condition()
+
+    @property
+    def running(self) -> bool:
+        return self.finished is None
+
+    def text(self) -> str:
+        with self._cond:
+            return "".join(self.parts)
+
+    def write(self, chunk: str):
+        with self._cond:
+            self.parts.append(chunk)
+            self._cond.notify_all()
+
+    def set_queue(self, position: int, wait: float):
+        with self._cond:
+            self.queue_position, self.queue_wait = position, wait
+            self._cond.notify_all()
+
+    def read(self, position: int, timeout: float = READ_TIMEOUT) -> Tuple[List[str], bool]:
+        """Chunks after position, waiting up to timeout for some, and whether the answer is over"""
+        with self._cond:
+            self._cond.wait_for(lambda: position < len(self.parts) or not self.running, timeout)
+            return self.parts[position:], not self.running
+
+    def _finish(self):
+        with self._cond:
+            self.finished = time.monotonic()
+            self._cond.notify_all()
+
+
+class GenerationEngine:
+    """Runs chat generations on background threads, one current job per conversation
+
+    Script runs only poll a job and render what it buffered, so reruns and
+    disconnects no longer interrupt the request behind it.
+    """
+
+    def __init__(self, registry: GenerationRegistry, metrics: Optional[MetricsRecorder] = None,
+                 ttl: float = JOB_TTL):
+        self.registry = registry
+        self.metrics = metrics
+        self.ttl = ttl
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.unclaimed = 0  # Finished answers no script run picked up in time
+
+    def submit(self, key: str, session_id: str, model: str, prompt: str, trace: RequestTrace,
+               generate: Callable[[GenerationJob], Iterator[str]],
+               on_complete: Optional[Callable[[GenerationJob], None]] = None) -> GenerationJob:
+        """Start a generation for a conversation, superseding the one it already has"""
+        self._expire()
+        previous = self.get(key)
+        if previous is not None and previous.running:
+            self.registry.cancel(previous.session_id, "superseded")
+        handle = self.registry.start(session_id, model)
+        job = GenerationJob(key, session_id, model, prompt, handle, trace)
+        with self._lock:
+            self._jobs[key] = job
+            self.started += 1
+        threading.Thread(target=self._run, args=(job, generate, on_complete), name="generation",
+                         daemon=True).start()
+        return job
+
+    def _run(self, job: GenerationJob, generate: Callable[[GenerationJob], Iterator[str]],
+             on_complete: Optional[Callable[[GenerationJob], None]]):
+        try:
+            for chunk in generate(job):
+                job.write(chunk)
+            job.handle.complete()
+        except Exception as e:
+            job.trace.outcome = "error"
+            job.write(f"**Error generating response:** {str(e)}")
+        finally:
+            self.registry.finish(job.handle)
+            if job.handle.cancelled:
+                job.trace.outcome = "cancelled"
+            try:
+                if on_complete:
+                    on_complete(job)
+            finally:
+                job._finish()
+
+    def get(self, key: Optional[str]) -> Optional[GenerationJob]:
+        """Current job of a conversation, running or finished but not yet shown"""
+        if key is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(key)
+        return None if job is None or job.released else job
+
+    def adopt(self, job: GenerationJob, session_id: str):
+        """Hand a job to the browser session now showing it, e.g. after a reconnect"""
+        if job.session_id != session_id:
+            self.registry.adopt(job.handle, session_id)
+            job.session_id = session_id
+
+    def cancel(self, key: Optional[str], reason: str = "user") -> bool:
+        job = self.get(key)
+        if job is None or not job.running:
+            return False
+        return self.registry.cancel(job.session_id, reason)
+
+    def release(self, job: GenerationJob):
+        """Drop a finished job once its answer was shown, recording its trace"""
+        with self._lock:
+            if job.released:
+                return
+            job.released = True
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+        if self.metrics is not None:
+            self.metrics.record(job.trace)
+
+    def _expire(self):
+        """Release finished jobs nobody came back for"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [job for job in self._jobs.values() if not job.running and now - job.finished > self.ttl]
+        for job in stale:
+            self.unclaimed += 1
+            self.release(job)
+
+    def stats(self) -> Dict:
+        self._expire()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "started": self.started,
+            "running": sum(1 for job in jobs if job.running),
+            "waiting": sum(1 for job in jobs if not job.running),
+            "unclaimed": self.unclaimed
+        }
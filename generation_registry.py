@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# Constants
+REAP_INTERVAL = 2.0  # Seconds between checks for disconnected sessions
+RECONNECT_GRACE = 30.0  # Seconds a disconnected session has to come back before its generation is cancelled
+
+
+class GenerationHandle:
+    """One in-flight generation and the teardown hooks of its process or socket"""
+
+    def __init__(self, session_id: str, model: Optional[str] = None):
+        self.session_id = session_id
+        self.model = model
+        self.started = time.time()
+        self.tokens = 0
+        self.completed = False
+        self.cancelled = False
+        self.recorded = False  # Counted in the registry totals
+        self.cancel_reason: Optional[str] = None
+        self._closers: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def attach(self, closer: Callable[[], None]):
+        """Register how to tear down the underlying stream, e.g. stream.close or process.kill"""
+        with self._lock:
+            if not self.cancelled:
+                self._closers.append(closer)
+                return
+        # Cancelled before the stream started, tear it down right away
+        closer()
+
+    def complete(self):
+        """Mark the generation as finished normally"""
+        with self._lock:
+            if not self.cancelled:
+                self.completed = True
+                self._closers = []
+
+    def count(self, chunk: str):
+        """Count a streamed chunk, Ollama sends roughly one token per chunk"""
+        if chunk:
+            self.tokens += 1
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Close the process or socket behind this generation, returns False if already over"""
+        with self._lock:
+            if self.cancelled or self.completed:
+                return False
+            self.cancelled = True
+            self.cancel_reason = reason
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception:
+                pass
+        return True
+
+
+class GenerationRegistry:
+    """Tracks active generations per session so they can be torn down on demand"""
+
+    def __init__(self, is_session_active: Optional[Callable[[str], bool]] = None,
+                 reconnect_grace: float = RECONNECT_GRACE):
+        self._lock = threading.Lock()
+        self._active: Dict[str, GenerationHandle] = {}
+        self._is_session_active = is_session_active
+        self.reconnect_grace = reconnect_grace
+        self._inactive_since: Dict[str, float] = {}
+        self.completed = 0
+        self.cancelled = 0
+        self.cancelled_tokens = 0
+        self.cancel_reasons: Dict[str, int] = {}
+        if is_session_active is not None:
+            threading.Thread(target=self._reap_loop, name="generation-reaper", daemon=True).start()
+
+    def start(self, session_id: str, model: Optional[str] = None) -> GenerationHandle:
+        """Register a new generation, cancelling one the session left behind"""
+        self.cancel(session_id, "superseded")
+        handle = GenerationHandle(session_id, model)
+        with self._lock:
+            self._active[session_id] = handle
+        return handle
+
+    def finish(self, handle: GenerationHandle):
+        """Record the end of a generation, cancelling it if it did not complete"""
+        if not handle.completed and not handle.cancelled:
+            handle.cancel("interrupted")
+        with self._lock:
+            if self._active.get(handle.session_id) is handle:
+                del self._active[handle.session_id]
+            if handle.recorded:
+                return
+            handle.recorded = True
+            if handle.cancelled:
+                self.cancelled += 1
+                self.cancelled_tokens += handle.tokens
+                self.cancel_reasons[handle.cancel_reason] = self.cancel_reasons.get(handle.cancel_reason, 0) + 1
+            else:
+                self.completed += 1
+
+    def cancel(self, session_id: str, reason: str = "cancelled") -> bool:
+        """Cancel the active generation of a session, if any"""
+        with self._lock:
+            handle = self._active.get(session_id)
+        if handle is None:
+            return False
+        cancelled = handle.cancel(reason)
+        self.finish(handle)
+        return cancelled
+
+    def get(self, session_id: str) -> Optional[GenerationHandle]:
+        with self._lock:
+            return self._active.get(session_id)
+
+    def adopt(self, handle: GenerationHandle, session_id: str):
+        """Move a generation to another browser session, e.g. the one that reconnected"""
+        with self._lock:
+            if self._active.get(handle.session_id) is handle:
+                del self._active[handle.session_id]
+            self._inactive_since.pop(handle.session_id, None)
+            handle.session_id = session_id
+            if not handle.recorded:
+                self._active[session_id] = handle
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(REAP_INTERVAL)
+            with self._lock:
+                session_ids = list(self._active)
+            now = time.monotonic()
+            for session_id in set(self._inactive_since) - set(session_ids):
+                self._inactive_since.pop(session_id, None)
+            for session_id in session_ids:
+                try:
+                    active = self._is_session_active(session_id)
+                except Exception:
+                    continue
+                if active:
+                    self._inactive_since.pop(session_id, None)
+                elif now - self._inactive_since.setdefault(session_id, now) >= self.reconnect_grace:
+                    # Nobody reconnected to pick the answer up
+                    self._inactive_since.pop(session_id, None)
+                    self.cancel(session_id, "disconnected")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = len(self._active)
+        return {
+            "active": active,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "cancelled_tokens": self.cancelled_tokens,
+            "cancel_reasons": dict(self.cancel_reasons)
+        }
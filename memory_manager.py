@@ -0,0 +1,260 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Optional
+
+# Constants
+MEMORY_CAP = int(os.environ.get("SESSION_MEMORY_CAP_MB", 512)) * 1024 * 1024  # All sessions together
+IDLE_SPILL = 300.0  # Seconds without a script run before a session may be spilled
+COMPRESS_MIN = 256  # Shorter payloads are kept as plain UTF-8
+SPILL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "spill")
+MISSING_TEXT = "[content no longer available]"
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Approximate memory held by an object and everything it references"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def _encode(text: str) -> bytes:
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN:
+        return b"t" + raw
+    return b"z" + zlib.compress(raw)
+
+
+def _decode(data: bytes) -> str:
+    body = zlib.decompress(data[1:]) if data[:1] == b"z" else data[1:]
+    return body.decode("utf-8")
+
+
+class SessionMemory:
+    """Compact payload storage, per-session memory accounting and spilling of idle sessions
+
+    Message and note bodies are interned by hash and zlib-compressed, sessions
+    only hold their keys. Once all sessions together go over the cap, the
+    payloads of the longest idle sessions move to disk and their code indexes
+    are dropped. Both come back on the next access.
+    """
+
+    def __init__(self, cap: int = MEMORY_CAP, idle: float = IDLE_SPILL, spill_path: str = SPILL_PATH,
+                 is_session_active: Optional[Callable[[str], bool]] = None):
+        self.cap = cap
+        self.idle = idle
+        self.spill_path = spill_path
+        os.makedirs(spill_path, exist_ok=True)
+        # Spilled payloads belong to sessions of an earlier server process
+        for name in os.listdir(spill_path):
+            try:
+                os.remove(os.path.join(spill_path, name))
+            except OSError:
+                pass
+        self._is_session_active = is_session_active
+        self._lock = threading.Lock()
+        self._payloads: Dict[str, bytes] = {}
+        self._raw_sizes: Dict[str, int] = {}
+        self._owners: Dict[str, set] = {}
+        self._sessions: Dict[str, Dict] = {}
+        self.spilled = 0
+        self.restored = 0
+        self.rebuilt = 0
+
+    def _session(self, session_id: str) -> Dict:
+        """Accounting entry of a session, caller holds the lock"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"keys": set(), "index": None, "index_bytes": 0, "state_bytes": 0,
+                       "last_active": time.monotonic(), "spilled": False}
+            self._sessions[session_id] = session
+        return session
+
+    def put(self, session_id: str, text: str) -> str:
+        """Store a body for a session and return its key, equal bodies are stored once"""
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key not in self._payloads and not os.path.exists(self._spill_file(key)):
+                self._payloads[key] = _encode(text)
+            self._raw_sizes[key] = len(text)
+            self._owners.setdefault(key, set()).add(session_id)
+            self._session(session_id)["keys"].add(key)
+        return key
+
+    def get(self, key: str) -> str:
+        """Body of a key, read back from disk if it was spilled"""
+        with self._lock:
+            data = self._payloads.get(key)
+        if data is not None:
+            return _decode(data)
+        try:
+            with open(self._spill_file(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return MISSING_TEXT
+        with self._lock:
+            if key in self._owners:
+                self._payloads[key] = data
+                self.restored += 1
+        return _decode(data)
+
+    def _spill_file(self, key: str) -> str:
+        return os.path.join(self.spill_path, key)
+
+    def index(self, session_id: str, build: Callable[[], object]):
+        """Code index of a session, built again if it was dropped"""
+        with self._lock:
+            index = self._session(session_id)["index"]
+        if index is None:
+            index = build()
+            self.set_index(session_id, index)
+            with self._lock:
+                self.rebuilt += 1
+        return index
+
+    def set_index(self, session_id: str, index):
+        """Keep a session's code index and measure it, call again after changing it"""
+        size = deep_size(index)
+        with self._lock:
+            session = self._session(session_id)
+            session["index"], session["index_bytes"] = index, size
+
+    def touch(self, session_id: str, keys: Iterable[str], state_bytes: int):
+        """Record a script run of a session and the payloads it still refers to"""
+        keys = set(keys)
+        with self._lock:
+            session = self._session(session_id)
+            for key in session["keys"] - keys:
+                self._release(session_id, key)
+            session["keys"] = keys
+            session["state_bytes"] = state_bytes
+            session["last_active"] = time.monotonic()
+            session["spilled"] = False
+        self.enforce_cap()
+
+    def _release(self, session_id: str, key: str):
+        """Drop a session's claim on a payload, caller holds the lock"""
+        owners = self._owners.get(key)
+        if owners is None:
+            return
+        owners.discard(session_id)
+        if not owners:
+            del self._owners[key]
+            self._payloads.pop(key, None)
+            self._raw_sizes.pop(key, None)
+            try:
+                os.remove(self._spill_file(key))
+            except OSError:
+                pass
+
+    def forget(self, session_id: str):
+        """Release everything of a session that is gone"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return
+            for key in session["keys"]:
+                self._release(session_id, key)
+
+    def footprint(self, session_id: str) -> Dict:
+        """Bytes a session holds, shared payloads split between their owners"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return {"payloads": 0, "raw": 0, "index": 0, "state": 0, "total": 0, "spilled": False}
+            payloads = raw = 0
+            for key in session["keys"]:
+                share = len(self._owners.get(key, ())) or 1
+                payloads += len(self._payloads.get(key, b"")) // share
+                raw += self._raw_sizes.get(key, 0) // share
+            footprint = {
+                "payloads": payloads,
+                "raw": raw,
+                "index": session["index_bytes"],
+                "state": session["state_bytes"],
+                "spilled": session["spilled"]
+            }
+        footprint["total"] = footprint["payloads"] + footprint["index"] + footprint["state"]
+        return footprint
+
+    def total(self) -> int:
+        with self._lock:
+            return (sum(len(data) for data in self._payloads.values())
+                    + sum(s["index_bytes"] + s["state_bytes"] for s in self._sessions.values() if not s["spilled"]))
+
+    def enforce_cap(self):
+        """Forget closed sessions, then spill idle ones, longest idle first, until under the cap"""
+        if self._is_session_active is not None:
+            with self._lock:
+                session_ids = list(self._sessions)
+            for session_id in session_ids:
+                try:
+                    active = self._is_session_active(session_id)
+                except Exception:
+                    continue
+                if not active:
+                    self.forget(session_id)
+
+        if self.total() <= self.cap:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = sorted(
+                (s["last_active"], session_id) for session_id, s in self._sessions.items()
+                if not s["spilled"] and now - s["last_active"] >= self.idle
+            )
+        for _, session_id in idle:
+            self._spill(session_id)
+            if self.total() <= self.cap:
+                break
+
+    def _spill(self, session_id: str):
+        """Move an idle session's payloads to disk and drop its code index"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            now = time.monotonic()
+            # Payloads a recently active session also uses stay in memory
+            busy = {sid for sid, s in self._sessions.items() if now - s["last_active"] < self.idle}
+            for key in session["keys"]:
+                data = self._payloads.get(key)
+                if data is None or self._owners.get(key, set()) & busy:
+                    continue
+                try:
+                    with open(self._spill_file(key), "wb") as f:
+                        f.write(data)
+                except OSError:
+                    continue
+                del self._payloads[key]
+            session["index"], session["index_bytes"] = None, 0
+            session["spilled"] = True
+            self.spilled += 1
+
+    def stats(self) -> Dict:
+        total = self.total()
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "spilled_sessions": sum(1 for s in self._sessions.values() if s["spilled"]),
+                "payloads": len(self._payloads),
+                "bytes": total,
+                "cap": self.cap,
+                "spilled": self.spilled,
+                "restored": self.restored,
+                "rebuilt": self.rebuilt
+            }
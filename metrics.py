@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Constants
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics.jsonl")
+MAX_LOG_BYTES = 16 * 1024 * 1024  # The event log is rotated once it grows past this
+WINDOW = 500  # Recent requests the percentiles are computed over
+QUANTILES = [0.5, 0.95, 0.99]
+PROMETHEUS_PREFIX = "ai_tutor"
+
+# Metric name -> (unit, description), all are per request
+METRICS = {
+    "status_check": ("seconds", "Reading the Ollama status before a request"),
+    "queue_wait": ("seconds", "Waiting for a generation slot"),
+    "payload_build": ("seconds", "Packing history and attachments into the request"),
+    "connect": ("seconds", "Start of the request until Ollama sent response headers"),
+    "first_token": ("seconds", "Start of the request until the first token"),
+    "last_token": ("seconds", "Start of the request until the last token"),
+    "render": ("seconds", "Rendering the streamed answer in the browser"),
+    "load_duration": ("seconds", "Model load time reported by Ollama"),
+    "prompt_eval_duration": ("seconds", "Prompt processing time reported by Ollama"),
+    "eval_duration": ("seconds", "Generation time reported by Ollama"),
+    "prompt_eval_count": ("tokens", "Prompt tokens processed by Ollama"),
+    "eval_count": ("tokens", "Tokens generated"),
+    "prompt_reuse": ("ratio", "Estimated share of the prompt served from Ollama's prefix cache"),
+    "tokens_per_second": ("tokens_per_second", "Generation speed, eval_count over eval_duration"),
+    "prompt_tokens_per_second": ("tokens_per_second", "Prompt processing speed")
+}
+OLLAMA_DURATIONS = ["load_duration", "prompt_eval_duration", "eval_duration"]  # Nanoseconds in the final chunk
+
+
+def append_jsonl(path: str, event: Dict, max_bytes: int = MAX_LOG_BYTES):
+    """Append an event to a JSONL log, moving the log to path.1 once it grew past max_bytes
+
+    Failures are swallowed, an event log must never break a chat request.
+    Callers serialize their writes.
+    """
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+            os.replace(path, path + ".1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event) + "\n")
+    except OSError:
+        pass
+
+
+class RequestTrace:
+    """Timing spans and Ollama counters of one chat request"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.outcome = "ok"
+        self.backend: Optional[str] = None
+        self.values: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block, repeated spans of the same name add up"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.values[name] = self.values.get(name, 0.0) + time.perf_counter() - started
+
+    def mark(self, name: str, at: Optional[float] = None):
+        """Record a point in time, as seconds since the request started"""
+        self.values[name] = (at if at is not None else time.perf_counter()) - self.started
+
+    def set_final(self, final: Dict, prompt_tokens: Optional[int] = None):
+        """Take the counters Ollama reports in the last chunk of a stream
+
+        prompt_tokens is the estimated size of the prompt that was sent. Ollama
+        only counts the tokens it had to evaluate, the rest came from its cache.
+        """
+        for key in OLLAMA_DURATIONS:
+            if final.get(key):
+                self.values[key] = final[key] / 1e9
+        for key in ("prompt_eval_count", "eval_count"):
+            if final.get(key) is not None:
+                self.values[key] = final[key]
+        if prompt_tokens and final.get("prompt_eval_count") is not None:
+            self.values["prompt_reuse"] = min(max(1 - final["prompt_eval_count"] / prompt_tokens, 0.0), 1.0)
+        if self.values.get("eval_duration"):
+            self.values["tokens_per_second"] = self.values.get("eval_count", 0) / self.values["eval_duration"]
+        if self.values.get("prompt_eval_duration"):
+            self.values["prompt_tokens_per_second"] = (self.values.get("prompt_eval_count", 0)
+                                                       / self.values["prompt_eval_duration"])
+
+    def event(self) -> Dict:
+        return {
+            "timestamp": self.timestamp,
+            "model": self.model,
+            "backend": self.backend,
+            "outcome": self.outcome,
+            **{name: round(value, 6) for name, value in self.values.items()}
+        }
+
+
+class MetricsRecorder:
+    """Keeps recent request events for percentiles and appends all of them to a JSONL log"""
+
+    def __init__(self, path: Optional[str] = METRICS_PATH, window: int = WINDOW):
+        self.path = path
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._events = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.outcomes: Dict[str, int] = {}
+
+    def start_trace(self, model: str) -> RequestTrace:
+        return RequestTrace(model)
+
+    def record(self, trace: RequestTrace):
+        event = trace.event()
+        with self._lock:
+            self._events.append(event)
+            self.outcomes[event["outcome"]] = self.outcomes.get(event["outcome"], 0) + 1
+            if self.path:
+                append_jsonl(self.path, event)
+
+    def events(self) -> List[Dict]:
+        with self._lock:
+            return list(self._events)
+
+    def percentiles(self) -> Dict[str, Dict]:
+        """Rolling percentiles of every metric over the recent window"""
+        events = self.events()
+        summary = {}
+        for name in METRICS:
+            values = sorted(e[name] for e in events if e.get(name) is not None)
+            if not values:
+                continue
+            summary[name] = {
+                "count": len(values),
+                "sum": sum(values),
+                **{f"p{int(q * 100)}": values[min(int(q * len(values)), len(values) - 1)] for q in QUANTILES}
+            }
+        return summary
+
+    def export_jsonl(self) -> str:
+        """Recent raw events, one JSON object per line"""
+        return "".join(json.dumps(event) + "\n" for event in self.events())
+
+    def export_prometheus(self) -> str:
+        """Recent percentiles as Prometheus summaries plus request counters"""
+        lines = []
+        for name, stats in self.percentiles().items():
+            unit, description = METRICS[name]
+            metric = f"{PROMETHEUS_PREFIX}_{name}" if name.endswith(unit) else f"{PROMETHEUS_PREFIX}_{name}_{unit}"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} summary")
+            for q in QUANTILES:
+                lines.append(f'{metric}{{quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6g}')
+            lines.append(f"{metric}_sum {stats['sum']:.6g}")
+            lines.append(f"{metric}_count {stats['count']}")
+        metric = f"{PROMETHEUS_PREFIX}_requests_total"
+        lines.append(f"# HELP {metric} Chat requests by outcome")
+        lines.append(f"# TYPE {metric} counter")
+        with self._lock:
+            outcomes = dict(self.outcomes)
+        for outcome, count in sorted(outcomes.items()):
+            lines.append(f'{metric}{{outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
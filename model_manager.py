@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from backend_pool import BackendPool
+from ollama_client import OllamaError
+
+# Constants
+DEFAULT_KEEP_ALIVE = 300  # Seconds, Ollama's own default
+MIN_KEEP_ALIVE = 300
+MAX_KEEP_ALIVE = 3600
+KEEP_ALIVE_FACTOR = 3  # Keep a model loaded for this many typical gaps between requests
+GAP_SAMPLES = 50
+PRELOAD_RETRY = 30.0  # Seconds before a model that is still not resident is preloaded again
+LOAD_TIMEOUT = 300.0
+
+FRACTION = re.compile(r"\.(\d+)")
+
+
+def _expires_in(expires_at: Optional[str]) -> Optional[float]:
+    """Seconds until an /api/ps expires_at timestamp, None if unknown"""
+    if not expires_at:
+        return None
+    # Ollama sends nanosecond RFC 3339 timestamps, fromisoformat wants microseconds
+    normalized = FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), expires_at.replace("Z", "+00:00"))
+    try:
+        parsed = datetime.fromisoformat(normalized)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - datetime.now(timezone.utc)).total_seconds()
+
+
+class ModelManager:
+    """Preloads models, sizes keep_alive to traffic and tracks what is resident
+
+    A preload is an /api/generate request without a prompt, which makes the
+    server load the model and keep it for keep_alive seconds.
+    """
+
+    def __init__(self, pool: BackendPool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._loading: Dict[str, float] = {}
+        self._last_preload: Dict[str, float] = {}
+        self._load_times: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._last_use: Dict[str, float] = {}
+        self._gaps: Dict[str, deque] = {}
+        self.preloads = 0
+
+    def record_use(self, model: str):
+        """Note a request for a model, feeding the keep_alive estimate"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_use.get(model)
+            if last is not None:
+                self._gaps.setdefault(model, deque(maxlen=GAP_SAMPLES)).append(now - last)
+            self._last_use[model] = now
+
+    def keep_alive(self, model: str) -> int:
+        """Seconds to keep a model loaded, long enough to span its usual idle gaps"""
+        with self._lock:
+            gaps = sorted(self._gaps.get(model, []))
+        if not gaps:
+            return DEFAULT_KEEP_ALIVE
+        typical = gaps[min(int(0.9 * len(gaps)), len(gaps) - 1)]
+        return int(min(max(typical * KEEP_ALIVE_FACTOR, MIN_KEEP_ALIVE), MAX_KEEP_ALIVE))
+
+    def is_resident(self, model: str) -> bool:
+        return any(model in b.status().get("loaded_models", []) for b in self.pool.backends)
+
+    def preload(self, model: str):
+        """Load a model in the background on the backend requests for it go to"""
+        with self._lock:
+            if model in self._loading:
+                return
+            self._loading[model] = time.monotonic()
+            self._last_preload[model] = time.monotonic()
+        threading.Thread(target=self._load, args=(model,), name="model-preload", daemon=True).start()
+
+    def ensure_loaded(self, model: str):
+        """Preload a model unless it is resident, loading, or was just preloaded"""
+        with self._lock:
+            busy = model in self._loading
+            recent = time.monotonic() - self._last_preload.get(model, float("-inf")) < PRELOAD_RETRY
+        if busy or recent or self.is_resident(model):
+            return
+        self.preload(model)
+
+    def _load(self, model: str):
+        started = time.monotonic()
+        backend = self.pool.pick(model)
+        try:
+            if backend is None:
+                raise OllamaError(f"No healthy Ollama backend serves {model}")
+            backend.client.request_json(
+                "POST", "/api/generate",
+                {"model": model, "keep_alive": self.keep_alive(model), "stream": False},
+                timeout=LOAD_TIMEOUT
+            )
+            with self._lock:
+                self._load_times[model] = time.monotonic() - started
+                self._errors.pop(model, None)
+                self.preloads += 1
+        except OllamaError as e:
+            with self._lock:
+                self._errors[model] = str(e)
+        finally:
+            with self._lock:
+                self._loading.pop(model, None)
+            if backend is not None:
+                # Re-read /api/ps so routing and the sidebar see the model as resident
+                backend.monitor.refresh()
+
+    def state(self, model: str) -> Dict:
+        """Load state of a model for display"""
+        with self._lock:
+            loading = self._loading.get(model)
+            error = self._errors.get(model)
+            load_time = self._load_times.get(model)
+        state = {"model": model, "keep_alive": self.keep_alive(model), "load_time": load_time}
+        if loading is not None:
+            state["state"] = "loading"
+            state["loading_for"] = time.monotonic() - loading
+            return state
+
+        expires = [
+            _expires_in(b.status().get("loaded", {}).get(model, {}).get("expires_at"))
+            for b in self.pool.backends if model in b.status().get("loaded_models", [])
+        ]
+        if expires:
+            state["state"] = "loaded"
+            known = [e for e in expires if e is not None]
+            state["expires_in"] = max(known) if known else None
+        else:
+            state["state"] = "error" if error else "unloaded"
+            state["error"] = error
+        return state
+
+    def resident(self) -> List[Dict]:
+        """Models loaded on any backend, with their memory footprint"""
+        models = {}
+        for backend in self.pool.backends:
+            for name, info in backend.status().get("loaded", {}).items():
+                entry = models.setdefault(name, {"model": name, "size_vram": 0, "backends": 0})
+                entry["size_vram"] += info.get("size_vram", 0)
+                entry["backends"] += 1
+        return list(models.values())
@@ -0,0 +1,227 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from context_builder import CHARS_PER_TOKEN
+from metrics import RequestTrace, append_jsonl
+
+# Constants
+ROUTING_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "routing.jsonl")
+TIERS = ["fast", "balanced", "deep"]
+# Models per tier, e.g. "fast=qwen2.5-coder:3b;deep=qwen2.5-coder:7b,llama3.1:8b".
+# Available chat models that are not listed are put in a tier by their parameter count,
+# embedding models and models of unknown size are never routed to.
+MODEL_TIERS = os.environ.get("MODEL_TIERS", "")
+EMBEDDING_FAMILIES = {"bert", "nomic-bert"}  # Families in /api/tags details that can't chat
+FAST_MAX_PROMPT_TOKENS = 200  # Longer questions, or any with files, skip the fast tier
+DEEP_MIN_ATTACHMENT_TOKENS = 2000
+DEEP_MIN_FILES = 3
+EXPECTED_ANSWER_TOKENS = {"question": 200, "explain": 500, "review": 900}
+LATENCY_BUDGET = 120.0  # Seconds, above this estimate a request steps down a tier
+SPEED_ALPHA = 0.3  # Weight of the newest observation in the learned speeds
+DEFAULT_TOKENS_PER_SECOND = 20.0  # Until a model was observed
+DEFAULT_PROMPT_TOKENS_PER_SECOND = 400.0
+DEFAULT_LOAD_SECONDS = 10.0
+RECENT_DECISIONS = 50
+
+REVIEW_WORDS = re.compile(r"\b(review|analy[sz]e|bugs?|fix|debug|refactor|improve|optimi[sz]e|security|vulnerab\w*)\b",
+                          re.IGNORECASE)
+EXPLAIN_WORDS = re.compile(r"\b(explain|how does|how do|what does|why|walk me through|understand)\b", re.IGNORECASE)
+MODEL_SIZE = re.compile(r"(\d+(?:\.\d+)?)b\b", re.IGNORECASE)
+PARAMETER_SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*([MB])", re.IGNORECASE)
+
+
+def parse_tiers(spec: str) -> Dict[str, List[str]]:
+    """Tier -> models from a MODEL_TIERS string, unknown tier names are ignored"""
+    tiers = {}
+    for part in spec.split(";"):
+        tier, _, models = part.partition("=")
+        tier = tier.strip().lower()
+        if tier in TIERS:
+            tiers[tier] = [m.strip() for m in models.split(",") if m.strip()]
+    return tiers
+
+
+def model_size(model: str, details: Optional[Dict] = None) -> Optional[float]:
+    """Parameter count in billions, from /api/tags details or a model tag like qwen2.5-coder:7b"""
+    match = PARAMETER_SIZE.match((details or {}).get("parameter_size", ""))
+    if match:
+        return float(match.group(1)) / (1000 if match.group(2).upper() == "M" else 1)
+    tag = model.split(":", 1)[1] if ":" in model else model
+    match = MODEL_SIZE.search(tag)
+    return float(match.group(1)) if match else None
+
+
+def is_chat_model(model: str, details: Optional[Dict] = None) -> bool:
+    """False for embedding models, which Ollama lists next to chat models"""
+    details = details or {}
+    families = set(details.get("families") or []) | {details.get("family")}
+    return "embed" not in model.lower() and not families & EMBEDDING_FAMILIES
+
+
+def classify(prompt: str, files: int, attachment_tokens: int) -> Dict:
+    """Kind of request and the tier it needs, from the prompt and what is attached"""
+    prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+    if REVIEW_WORDS.search(prompt):
+        kind = "review"
+    elif EXPLAIN_WORDS.search(prompt):
+        kind = "explain"
+    else:
+        kind = "question"
+
+    if (kind == "review" and files) or files >= DEEP_MIN_FILES or attachment_tokens >= DEEP_MIN_ATTACHMENT_TOKENS:
+        tier = "deep"
+    elif kind == "question" and not files and prompt_tokens <= FAST_MAX_PROMPT_TOKENS:
+        tier = "fast"
+    else:
+        tier = "balanced"
+    return {"kind": kind, "tier": tier, "prompt_tokens": prompt_tokens, "files": files,
+            "attachment_tokens": attachment_tokens}
+
+
+class ModelRouter:
+    """Picks a model per request from tiers of local models, by request size and learned speed
+
+    Short questions go to the fast tier, reviews of attached code to the deep
+    one. Within a tier the model with the lowest estimated latency wins, from
+    the generation and prompt speeds observed on earlier requests and whether
+    the model is loaded. Every decision is logged with its latency outcome.
+    """
+
+    def __init__(self, tiers: Optional[Dict[str, List[str]]] = None, path: Optional[str] = ROUTING_LOG_PATH,
+                 budget: float = LATENCY_BUDGET):
+        self.tiers = parse_tiers(MODEL_TIERS) if tiers is None else tiers
+        self.path = path
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._speeds: Dict[str, Dict[str, float]] = {}
+        self._recent = deque(maxlen=RECENT_DECISIONS)
+        self.routed = 0
+        self.pinned = 0
+
+    def tiers_for(self, available: List[str], models: Optional[Dict[str, Dict]] = None) -> Dict[str, List[str]]:
+        """Available models per tier, configured ones first, the rest by parameter count
+
+        models holds /api/tags entries by name, their details tell embedding
+        models and sizes apart. Models that are neither configured nor known
+        to be sized chat models are left out.
+        """
+        models = models or {}
+        tiers = {tier: [m for m in self.tiers.get(tier, []) if m in available] for tier in TIERS}
+        configured = {m for names in self.tiers.values() for m in names}
+        sizes = {}
+        for model in available:
+            details = models.get(model, {}).get("details")
+            if model not in configured and is_chat_model(model, details):
+                size = model_size(model, details)
+                if size is not None:
+                    sizes[model] = size
+        distinct = sorted(set(sizes.values()))
+        for model, size in sizes.items():
+            if len(distinct) < 2:
+                tier = "balanced"
+            elif size == distinct[0]:
+                tier = "fast"
+            elif size == distinct[-1]:
+                tier = "deep"
+            else:
+                tier = "balanced"
+            tiers[tier].append(model)
+        return tiers
+
+    def estimate(self, model: str, prompt_tokens: int, answer_tokens: int, resident: bool) -> float:
+        """Expected seconds until the whole answer, from the learned speeds of a model"""
+        with self._lock:
+            speeds = dict(self._speeds.get(model, {}))
+        seconds = (prompt_tokens / speeds.get("prompt_tokens_per_second", DEFAULT_PROMPT_TOKENS_PER_SECOND)
+                   + answer_tokens / speeds.get("tokens_per_second", DEFAULT_TOKENS_PER_SECOND))
+        if not resident:
+            seconds += speeds.get("load_duration", DEFAULT_LOAD_SECONDS)
+        return seconds
+
+    def route(self, prompt: str, files: int, attachment_tokens: int, available: List[str],
+              resident: List[str], max_tokens: int, pinned: Optional[str] = None,
+              fallback: Optional[str] = None, models: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Decision for one request: the model, its tier and why it was picked"""
+        decision = classify(prompt, files, attachment_tokens)
+        decision["timestamp"] = time.time()
+        # Everything the model reads, the prompt plus attached code
+        context_tokens = decision["prompt_tokens"] + attachment_tokens
+        answer_tokens = min(max_tokens, EXPECTED_ANSWER_TOKENS[decision["kind"]])
+
+        tiers = self.tiers_for(available, models)
+        if pinned or not any(tiers.values()):
+            decision.update(model=pinned or fallback, reason="pinned" if pinned else "no tiered models",
+                            estimate=None)
+            with self._lock:
+                self.pinned += 1
+            return decision
+
+        wanted = TIERS.index(decision["tier"])
+        # Nearest tier that has a model, looking down before up
+        order = sorted(range(len(TIERS)), key=lambda i: (abs(i - wanted), i > wanted))
+        candidates = []
+        for i in order:
+            if tiers[TIERS[i]]:
+                candidates.append((i, [
+                    (self.estimate(m, context_tokens, answer_tokens, m in resident), m) for m in tiers[TIERS[i]]
+                ]))
+        index, estimates = candidates[0]
+        estimate, model = min(estimates)
+        reason = "tier" if index == wanted else "nearest tier"
+        # A deep model that would take too long gives way to a faster one
+        if estimate > self.budget:
+            faster = [(i, min(e)) for i, e in candidates if i < index and min(e)[0] < estimate]
+            if faster:
+                index, (estimate, model) = max(faster)
+                reason = "over latency budget"
+        decision.update(model=model, routed_tier=TIERS[index], reason=reason, estimate=round(estimate, 3),
+                        resident=model in resident)
+        with self._lock:
+            self.routed += 1
+        return decision
+
+    def observe(self, model: str, values: Dict[str, float], cold: bool = False):
+        """Learn a model's speeds from the Ollama counters of a finished request"""
+        keys = ["tokens_per_second", "prompt_tokens_per_second"]
+        if cold:
+            # Warm requests report a near zero load time, only loads tell what a load costs
+            keys.append("load_duration")
+        with self._lock:
+            speeds = self._speeds.setdefault(model, {})
+            for key in keys:
+                value = values.get(key)
+                if not value:
+                    continue
+                previous = speeds.get(key)
+                speeds[key] = value if previous is None else previous + SPEED_ALPHA * (value - previous)
+
+    def record(self, decision: Dict, trace: RequestTrace):
+        """Log a decision with its latency outcome and learn from the request"""
+        if trace.outcome == "ok":
+            self.observe(trace.model, trace.values, cold=not decision.get("resident", True))
+        event = dict(decision, outcome=trace.outcome, **{
+            key: round(trace.values[key], 6) for key in ("first_token", "last_token", "tokens_per_second")
+            if key in trace.values
+        })
+        with self._lock:
+            self._recent.append(event)
+            if self.path:
+                append_jsonl(self.path, event)
+
+    def recent(self) -> List[Dict]:
+        with self._lock:
+            return list(self._recent)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "routed": self.routed,
+                "pinned": self.pinned,
+                "speeds": {model: dict(speeds) for model, speeds in self._speeds.items()}
+            }
@@ -0,0 +1,199 @@
+import http.client
+import json
+import queue
+import socket
+import time
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+# Constants
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 300.0
+
+# Errors raised by a pooled connection the server already closed on its side
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class OllamaError(Exception):
+    """Raised when the Ollama server cannot be reached or reports an error"""
+
+
+class ChatStream:
+    """Iterator over the content chunks of one streaming /api/chat call"""
+
+    def __init__(self, client: "OllamaClient", connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, started: float):
+        self._client = client
+        self._connection = connection
+        self._response = response
+        self.started = started
+        self.ttft: Optional[float] = None  # Seconds until the first content token
+        self.final: Dict = {}  # Last NDJSON object, carries eval_count and durations
+        self.closed = False
+        self._closing = False  # Set before close() shuts the socket down under a reader
+
+    def __iter__(self) -> Iterator[str]:
+        reusable = False
+        try:
+            while True:
+                try:
+                    line = self._response.readline()
+                except (OSError, ValueError, AttributeError, http.client.HTTPException) as e:
+                    # close() from another thread tears the response down under us
+                    if self._closing:
+                        break
+                    raise OllamaError(f"Stream from {self._client.base_url} broke off: {e}") from e
+                if not line:
+                    if self._closing:
+                        break
+                    # The server went away without the final chunk
+                    raise OllamaError(f"Stream from {self._client.base_url} ended before the answer was complete")
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if "error" in data:
+                    raise OllamaError(data["error"])
+
+                message = data.get("message") or {}
+                content = message.get("content") or data.get("response") or ""
+                if content:
+                    if self.ttft is None:
+                        self.ttft = time.perf_counter() - self.started
+                    yield content
+
+                if data.get("done"):
+                    self.final = data
+                    # Drain the chunked terminator so the connection can be reused
+                    self._response.read()
+                    reusable = True
+                    break
+        finally:
+            self._finish(reusable)
+
+    def close(self):
+        """Abort the stream and tear down its socket, safe to call from any thread"""
+        if self.closed:
+            return
+        self._closing = True
+        sock = self._connection.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._finish(False)
+
+    def _finish(self, reusable: bool):
+        if self.closed:
+            return
+        self.closed = True
+        if reusable and not self._response.will_close:
+            self._client._release(self._connection)
+        else:
+            self._connection.close()
+
+
+class OllamaClient:
+    """Keep-alive connection pool to one Ollama server"""
+
+    def __init__(self, base_url: str = DEFAULT_OLLAMA_URL, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT):
+        parts = urlsplit(base_url)
+        self.base_url = base_url.rstrip("/")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 11434
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self):
+        """Return (connection, reused) taking an idle pooled connection if there is one"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _send(self, method: str, path: str, body: Optional[bytes], timeout: Optional[float]):
+        """Send a request, retrying once on a fresh socket if a pooled one went stale"""
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        while True:
+            connection, reused = self._acquire()
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                return connection, connection.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+    def chat_stream(self, payload: Dict) -> ChatStream:
+        """Start a streaming /api/chat request and return its chunk iterator"""
+        started = time.perf_counter()
+        body = json.dumps(payload).encode("utf-8")
+        try:
+            connection, response = self._send("POST", "/api/chat", body, None)
+        except (OSError, http.client.HTTPException) as e:
+            # E.g. a server that answers with something other than HTTP
+            raise OllamaError(f"Cannot reach Ollama at {self.base_url}: {e}") from e
+
+        if response.status != 200:
+            detail = response.read().decode("utf-8", errors="replace")
+            connection.close()
+            try:
+                detail = json.loads(detail).get("error", detail)
+            except (json.JSONDecodeError, AttributeError):
+                pass
+            raise OllamaError(f"HTTP {response.status}: {detail}")
+
+        return ChatStream(self, connection, response, started)
+
+    def request_json(self, method: str, path: str, payload: Optional[Dict] = None,
+                     timeout: Optional[float] = None) -> Dict:
+        """Make a non-streaming request and return the decoded JSON body"""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        try:
+            connection, response = self._send(method, path, body, timeout)
+            raw = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise OllamaError(f"Cannot reach Ollama at {self.base_url}: {e}") from e
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if response.status != 200:
+            raise OllamaError(f"HTTP {response.status}: {raw.decode('utf-8', errors='replace')}")
+        return json.loads(raw) if raw else {}
+
+    def close(self):
+        """Close all idle pooled connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,102 @@
+import shutil
+import threading
+import time
+from typing import Dict, Optional
+
+from ollama_client import OllamaClient, OllamaError
+
+# Constants
+STATUS_TTL = 30.0  # Seconds a healthy status stays fresh
+ERROR_TTL = 5.0  # Retry sooner while the server is down
+PROBE_TIMEOUT = 3.0
+
+
+def probe_ollama(client: OllamaClient, timeout: float = PROBE_TIMEOUT) -> Dict:
+    """Probe /api/version and /api/tags and return a status dictionary"""
+    status = {
+        "installed": shutil.which("ollama") is not None,
+        "running": False,
+        "available_models": [],
+        "loaded_models": [],
+        "loaded": {},
+        "checked_at": time.time()
+    }
+
+    try:
+        version = client.request_json("GET", "/api/version", timeout=timeout)
+        status["running"] = True
+        # A reachable server counts as installed even if the CLI is not on PATH
+        status["installed"] = True
+        status["version"] = version.get("version", "unknown")
+
+        tags = client.request_json("GET", "/api/tags", timeout=timeout)
+        status["available_models"] = [m["name"] for m in tags.get("models", []) if m.get("name")]
+        status["models"] = {m["name"]: m for m in tags.get("models", []) if m.get("name")}
+
+        # Models resident in memory, older servers have no /api/ps
+        try:
+            running = client.request_json("GET", "/api/ps", timeout=timeout)
+            status["loaded_models"] = [m["name"] for m in running.get("models", []) if m.get("name")]
+            status["loaded"] = {m["name"]: m for m in running.get("models", []) if m.get("name")}
+        except OllamaError:
+            status["loaded_models"] = []
+    except OllamaError as e:
+        if status["installed"]:
+            status["error"] = "Ollama service not running. Start with: `ollama serve`"
+        else:
+            status["error"] = "Ollama not installed. Download from https://ollama.com"
+        status["detail"] = str(e)
+    except Exception as e:
+        status["error"] = f"Unexpected error: {str(e)}"
+
+    return status
+
+
+class HealthMonitor:
+    """Process-wide Ollama status cache refreshed by a background thread"""
+
+    def __init__(self, client: OllamaClient, ttl: float = STATUS_TTL, error_ttl: float = ERROR_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._lock = threading.Lock()
+        self._status: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+        self._thread.start()
+
+    def _current_ttl(self) -> float:
+        if self._status and self._status.get("running"):
+            return self.ttl
+        return self.error_ttl
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._current_ttl())
+            self._wake.clear()
+            self.refresh()
+
+    def refresh(self) -> Dict:
+        """Probe the server now and replace the cached status"""
+        status = probe_ollama(self.client)
+        with self._lock:
+            self._status = status
+            self._checked_at = time.monotonic()
+        return dict(status)
+
+    def get_status(self) -> Dict:
+        """Return the cached status, probing synchronously only on first use"""
+        with self._lock:
+            status = self._status
+            age = time.monotonic() - self._checked_at
+        if status is None:
+            return self.refresh()
+        if age > self._current_ttl():
+            # Serve the stale value and let the background thread catch up
+            self._wake.set()
+        return dict(status)
+
+    def request_refresh(self):
+        """Ask the background thread to refresh early without blocking"""
+        self._wake.set()
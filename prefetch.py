@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from backend_pool import BackendPool
+from ollama_client import OllamaError
+from stream_buffer import StreamBuffer
+
+# Constants
+MAX_ENTRIES = 16
+MAX_RUNNING = 1  # Prefetches bypass the scheduler, so only one generates at a time
+ENTRY_TTL = 900.0  # Seconds an unclaimed prefetched answer is kept
+
+
+class PrefetchEntry(StreamBuffer):
+    """An answer generated ahead of time, readable while it is still streaming"""
+
+    def __init__(self, key: str, session_id: str, model: str):
+        super().__init__()
+        self.key = key
+        self.session_id = session_id
+        self.model = model
+        self.created = time.monotonic()
+        self.done = False
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self._stream = None
+
+    @property
+    def running(self) -> bool:
+        return not (self.done or self.error or self.cancelled)
+
+    def failure(self) -> Optional[str]:
+        return None if self.cancelled else self.error
+
+    def _run(self, pool: BackendPool, request_data: Dict):
+        try:
+            stream = pool.chat_stream(request_data)
+            with self._cond:
+                self._stream = stream
+                cancelled = self.cancelled
+            if cancelled:
+                stream.close()
+                return
+            for chunk in stream:
+                self.append(chunk, stream)
+            with self._cond:
+                self.final = stream.final
+                self.done = bool(stream.final.get("done"))
+                if not self.done and not self.cancelled:
+                    self.error = "Stream ended early"
+                self._cond.notify_all()
+        except Exception as e:
+            # Whatever went wrong, a session following this entry must not wait forever
+            with self._cond:
+                self.error = str(e) if isinstance(e, OllamaError) else f"{type(e).__name__}: {e}"
+                self._cond.notify_all()
+
+    def close(self):
+        """Stream-style teardown for the request that claimed this entry"""
+        if self.running:
+            self.cancel()
+
+    def cancel(self):
+        with self._cond:
+            self.cancelled = True
+            stream = self._stream
+            self._cond.notify_all()
+        if stream is not None:
+            stream.close()
+
+    def __iter__(self) -> Iterator[str]:
+        return self.follow()
+
+
+class Prefetcher:
+    """Generates likely next answers while the backend is idle
+
+    Entries are keyed like the response cache, so a prefetched answer is only
+    served for the exact request it was generated for. Real traffic preempts
+    running prefetches right away.
+    """
+
+    def __init__(self, pool: BackendPool, max_entries: int = MAX_ENTRIES, ttl: float = ENTRY_TTL,
+                 max_running: int = MAX_RUNNING):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.max_running = max_running
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, PrefetchEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.partial_hits = 0  # Claimed while still generating
+        self.wasted = 0
+        self.wasted_tokens = 0
+
+    def _discard(self, entry: PrefetchEntry):
+        """Drop an entry nobody claimed, caller holds the lock"""
+        self._entries.pop(entry.key, None)
+        entry.cancel()
+        self.wasted += 1
+        self.wasted_tokens += len(entry.chunks)
+
+    def start(self, session_id: str, key: str, request_data: Dict) -> bool:
+        """Generate an answer in the background, replacing the session's older prefetch
+
+        Returns False without starting when the key is already prefetched or
+        max_running prefetches are still generating.
+        """
+        with self._lock:
+            if key in self._entries:
+                return False
+            for entry in list(self._entries.values()):
+                # The session's context changed, its older prefetch can no longer match
+                expired = time.monotonic() - entry.created > self.ttl
+                if entry.session_id == session_id or expired:
+                    self._discard(entry)
+            if sum(1 for e in self._entries.values() if e.running) >= self.max_running:
+                return False
+            while len(self._entries) >= self.max_entries:
+                self._discard(next(iter(self._entries.values())))
+            entry = PrefetchEntry(key, session_id, request_data.get("model"))
+            self._entries[key] = entry
+            self.started += 1
+        threading.Thread(target=entry._run, args=(self.pool, request_data), name="prefetch", daemon=True).start()
+        return True
+
+    def claim(self, key: str) -> Optional[PrefetchEntry]:
+        """Take the prefetched answer of a request, if one is usable"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.cancelled or entry.error or time.monotonic() - entry.created > self.ttl:
+                self._discard(entry)
+                return None
+            del self._entries[key]
+            self.hits += 1
+            if entry.running:
+                self.partial_hits += 1
+            return entry
+
+    def preempt(self, except_session: Optional[str] = None) -> int:
+        """Cancel running prefetches to free the backend for a real request"""
+        with self._lock:
+            running = [e for e in self._entries.values() if e.running and e.session_id != except_session]
+            for entry in running:
+                self._discard(entry)
+        return len(running)
+
+    def discard_session(self, session_id: str):
+        """Drop a session's prefetches, e.g. once it sent a different request"""
+        with self._lock:
+            for entry in [e for e in self._entries.values() if e.session_id == session_id]:
+                self._discard(entry)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = sum(1 for e in self._entries.values() if e.running)
+            ready = sum(1 for e in self._entries.values() if e.done)
+        return {
+            "started": self.started,
+            "active": active,
+            "ready": ready,
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "wasted": self.wasted,
+            "wasted_tokens": self.wasted_tokens,
+            "hit_rate": self.hits / self.started if self.started else 0.0,
+            "waste_rate": self.wasted / self.started if self.started else 0.0
+        }
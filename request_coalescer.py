@@ -0,0 +1,207 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from ollama_client import OllamaError
+from stream_buffer import StreamBuffer
+
+# Constants
+PENDING, RUNNING, DONE, FAILED, ABANDONED = "pending", "running", "done", "failed", "abandoned"
+
+
+class SharedGeneration(StreamBuffer):
+    """One generation whose tokens are fanned out to every session that sent the same request
+
+    The first request of a key leads: it queues for a slot and starts the
+    upstream stream, which a background thread reads into a buffer. Other
+    requests subscribe and replay the buffer from the start, so late joiners
+    miss nothing. The upstream is only closed once every subscriber left.
+    """
+
+    def __init__(self, key: str, model: str, on_end: Callable[["SharedGeneration"], None]):
+        super().__init__()
+        self.key = key
+        self.model = model
+        self.created = time.monotonic()
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.subscribers = 0
+        self.joined = 0  # Subscribers other than the leader, over the whole generation
+        self._upstream = None
+        self._on_end = on_end
+        self._on_finish: List[Callable[[], None]] = []
+
+    @property
+    def running(self) -> bool:
+        return self.state in (PENDING, RUNNING)
+
+    def failure(self) -> Optional[str]:
+        return self.error if self.state == FAILED else None
+
+    @property
+    def abandoned(self) -> bool:
+        return self.state == ABANDONED
+
+    def subscribe(self, leader: bool = False) -> "Subscription":
+        with self._cond:
+            self.subscribers += 1
+            if not leader:
+                self.joined += 1
+        return Subscription(self, leader)
+
+    def start(self, upstream: Iterable[str]):
+        """Begin reading the leader's stream for all subscribers"""
+        with self._cond:
+            if self.state != PENDING:
+                return
+            self._upstream = upstream
+            self.state = RUNNING
+            self._cond.notify_all()
+        threading.Thread(target=self._pump, name="shared-generation", daemon=True).start()
+
+    def _pump(self):
+        upstream = self._upstream
+        try:
+            for chunk in upstream:
+                self.append(chunk, upstream)
+            with self._cond:
+                self.final = upstream.final
+                if self.state == RUNNING:
+                    self.state = DONE if upstream.final.get("done") else FAILED
+                    if self.state == FAILED:
+                        self.error = "Stream ended early"
+        except OllamaError as e:
+            with self._cond:
+                if self.state == RUNNING:
+                    self.state, self.error = FAILED, str(e)
+        finally:
+            self._end()
+
+    def abandon(self):
+        """Give up a generation that never started, its subscribers go their own way"""
+        with self._cond:
+            if self.state != PENDING:
+                return
+            self.state = ABANDONED
+        self._end()
+
+    def hand_off(self, callback: Callable[[], None]) -> bool:
+        """Run callback once the upstream ends, False if it already did"""
+        with self._cond:
+            if self.state != RUNNING:
+                return False
+            self._on_finish.append(callback)
+            return True
+
+    def _end(self):
+        with self._cond:
+            if self.running:
+                self.state, self.error = FAILED, self.error or "Generation stopped"
+            callbacks, self._on_finish = self._on_finish, []
+            self._cond.notify_all()
+        self._on_end(self)
+        for callback in callbacks:
+            callback()
+
+    def _leave(self):
+        """A subscriber is done, the last one out stops the upstream"""
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers > 0 or self.state != RUNNING:
+                return
+            self.state, self.error = FAILED, "cancelled"
+            upstream = self._upstream
+            self._cond.notify_all()
+        upstream.close()
+
+    def wait_started(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the leader started or abandoned the generation, False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.state != PENDING, timeout)
+
+
+class Subscription:
+    """A session's view of a shared generation, iterated like a chat stream"""
+
+    def __init__(self, flight: SharedGeneration, leader: bool):
+        self.flight = flight
+        self.leader = leader
+        self.started = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.closed = False
+
+    @property
+    def final(self) -> Dict:
+        return self.flight.final
+
+    @property
+    def backend(self):
+        return self.flight.backend
+
+    @property
+    def connected(self) -> Optional[float]:
+        return self.flight.connected
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self.flight.follow(lambda: self.closed):
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+            yield chunk
+
+    def close(self):
+        """Stream-style teardown, a leader that never started the generation abandons it"""
+        with self.flight._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.flight._cond.notify_all()
+        if self.leader:
+            self.flight.abandon()
+        self.flight._leave()
+
+
+class RequestCoalescer:
+    """Single-flight for identical deterministic requests across sessions
+
+    Requests are keyed like the response cache. A request whose key already
+    has a generation in flight subscribes to it instead of starting another.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, SharedGeneration] = {}
+        self._lock = threading.Lock()
+        self.led = 0
+        self.joined = 0
+        self.saved_tokens = 0  # Chunks fanned out to followers instead of generated again
+
+    def join(self, key: str, model: str) -> Subscription:
+        """Subscribe to the generation of a key, leading a new one if there is none"""
+        with self._lock:
+            flight = self._flights.get(key)
+            # One that is winding down can't take new subscribers
+            leader = flight is None or not flight.running
+            if leader:
+                flight = SharedGeneration(key, model, self._ended)
+                self._flights[key] = flight
+                self.led += 1
+            else:
+                self.joined += 1
+            return flight.subscribe(leader)
+
+    def _ended(self, flight: SharedGeneration):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if flight.state == DONE:
+                self.saved_tokens += len(flight.chunks) * flight.joined
+
+    def stats(self) -> Dict:
+        with self._lock:
+            flights = list(self._flights.values())
+        return {
+            "in_flight": len(flights),
+            "subscribers": sum(f.subscribers for f in flights),
+            "led": self.led,
+            "joined": self.joined,
+            "saved_tokens": self.saved_tokens
+        }
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Generator, Optional
+
+# Constants
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite3")
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_MAX_TEMPERATURE = 0.0  # Only greedy sampling gives the same answer again, anything hotter is not replayed
+REPLAY_CHUNK_CHARS = 24
+REPLAY_DELAY = 0.004  # Seconds between replayed chunks
+
+
+def cache_key(request_data: Dict) -> str:
+    """Hash model, options, system prompt, history and attachments of a request"""
+    keyed = {
+        "model": request_data.get("model"),
+        "messages": request_data.get("messages"),
+        "options": request_data.get("options", {})
+    }
+    canonical = json.dumps(keyed, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def replay(response: str, chunk_chars: int = REPLAY_CHUNK_CHARS,
+           delay: float = REPLAY_DELAY) -> Generator[str, None, None]:
+    """Yield a stored answer in small pieces like a live stream"""
+    for start in range(0, len(response), chunk_chars):
+        yield response[start:start + chunk_chars]
+        if delay:
+            time.sleep(delay)
+
+
+class ResponseCache:
+    """SQLite-backed store of completed answers with size-bounded LRU eviction"""
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL,"
+            " model TEXT, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a stored answer and mark it recently used"""
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: Optional[str] = None):
+        """Store a completed answer, evicting least recently used ones over the limit"""
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, model, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, size, model, now, now)
+            )
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                self._db.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+            self._db.commit()
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        """Hit-rate metrics since process start plus the current store size"""
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
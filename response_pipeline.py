@@ -0,0 +1,225 @@
+import time
+from typing import Dict, Generator
+
+from cli_worker import format_transcript
+from generation_engine import GenerationJob
+from ollama_client import OllamaError
+from response_cache import cache_key, replay
+from scheduler import QueueFull
+
+# Constants
+QUEUE_POLL_INTERVAL = 0.5  # Seconds between queue position updates
+
+
+def generate_ollama_response_api(request: Dict, job: GenerationJob) -> Generator[str, None, None]:
+    """Generate response from Ollama using HTTP API
+
+    Raises OllamaError when the request fails before its first token, so the
+    caller can fall back to the CLI.
+    """
+    trace, handle = job.trace, job.handle
+    parts = []
+    try:
+        request_data = request["request_data"]
+        key = cache_key(request_data)
+        cache = request["cache"]
+        # Claimed before queueing, an answer generated ahead of time, done or still streaming
+        prefetched = request.get("prefetched")
+        subscription = request.get("subscription")
+        following = subscription is not None and not subscription.leader
+        
+        # Stream NDJSON from the least busy backend that has the model
+        if following:
+            # Another session already generates this exact request, follow its stream
+            stream = subscription
+        else:
+            stream = prefetched or request["pool"].chat_stream(request_data)
+            if subscription is not None:
+                subscription.flight.start(stream)
+                stream = subscription
+        # Cancelling shuts the socket down, which makes Ollama stop generating
+        handle.attach(stream.close)
+        ttft = None
+        try:
+            for chunk in stream:
+                if not parts:
+                    ttft = time.perf_counter() - trace.started - trace.values.get("queue_wait", 0.0)
+                    if stream.connected:
+                        # A prefetched or shared stream may have connected before this request started
+                        trace.mark("connect", max(stream.connected, trace.started))
+                    trace.mark("first_token")
+                    trace.backend = stream.backend.url if stream.backend else None
+                parts.append(chunk)
+                handle.count(chunk)
+                yield chunk
+        finally:
+            stream.close()
+        
+        # Ollama reports token counts and durations in the last chunk
+        trace.mark("last_token")
+        trace.set_final(stream.final, job.context_stats.get("used"))
+        job.stats = {
+            "ttft": ttft if prefetched or subscription else stream.ttft,
+            "eval_count": stream.final.get("eval_count"),
+            "prompt_eval_count": stream.final.get("prompt_eval_count"),
+            "prompt_reuse": trace.values.get("prompt_reuse"),
+            "prefetched": prefetched is not None,
+            "coalesced": following
+        }
+        
+        # Only answers that ran to completion are worth replaying, the leader stores shared ones
+        if request["cacheable"] and stream.final.get("done") and parts and not following:
+            cache.put(key, "".join(parts), model=request_data["model"])
+    
+    except OllamaError as e:
+        if handle.cancelled:
+            return
+        trace.outcome = "error"
+        if not parts:
+            raise
+        yield f"\n\n**Error in API call:** {str(e)}"
+    except Exception as e:
+        trace.outcome = "error"
+        yield f"**Error in API method:** {str(e)}"
+
+
+def generate_ollama_response_cli(request: Dict, job: GenerationJob) -> Generator[str, None, None]:
+    """Generate response through the warm ollama run worker"""
+    trace, handle = job.trace, job.handle
+    trace.outcome = "cli"
+    # Same history window and attachments as the API path, flattened into one prompt
+    full_prompt = format_transcript(request["request_data"]["messages"])
+    
+    stream = request["cli_worker"].stream(request["model"], full_prompt)
+    handle.attach(stream.close)
+    try:
+        for chunk in stream:
+            if "first_token" not in trace.values:
+                trace.mark("first_token")
+            handle.count(chunk)
+            yield chunk
+    finally:
+        stream.close()
+    
+    trace.mark("last_token")
+    job.stats = {"ttft": stream.ttft, "cli": True}
+    
+    # Check for errors
+    if stream.returncode != 0 and stream.error:
+        yield f"\n\n**Error in CLI call:** {stream.error}"
+
+
+def generate_response(request: Dict, job: GenerationJob) -> Generator[str, None, None]:
+    """Answer through the API, falling back to the warm CLI worker if it fails before the first token"""
+    try:
+        yield from generate_ollama_response_api(request, job)
+    except OllamaError as api_error:
+        try:
+            yield from generate_ollama_response_cli(request, job)
+        except Exception as cli_error:
+            job.trace.outcome = "error"
+            yield f"**Both methods failed:**\n- API error: {str(api_error)}\n- CLI error: {str(cli_error)}"
+
+
+def stream_ollama_response(request: Dict, job: GenerationJob) -> Generator[str, None, None]:
+    """Unified streaming response handler - tries API first, then CLI"""
+    trace = job.trace
+    job.context_stats = request["context_stats"]
+    
+    # Code that does not parse needs no model to point that out
+    if request.get("static_answer"):
+        trace.outcome = "static"
+        job.stats = {"static": True}
+        yield request["static_answer"]
+        return
+    
+    # Replay a stored answer for a byte-identical request, it needs neither Ollama nor a slot
+    key = cache_key(request["request_data"])
+    cache = request["cache"]
+    if request["cacheable"]:
+        cached = cache.get(key)
+        if cached is not None:
+            job.stats = {"ttft": 0.0, "cached": True}
+            trace.outcome = "cached"
+            trace.mark("first_token")
+            yield from replay(cached)
+            trace.mark("last_token")
+            return
+    else:
+        cache.record_bypass()
+    
+    # First check Ollama status
+    with trace.span("status_check"):
+        status = request["pool"].status()
+    
+    if not status.get("running", False):
+        trace.outcome = "unavailable"
+        yield "**Error:** Ollama is not running. Please start Ollama with `ollama serve` in your terminal."
+        return
+    
+    if request["model"] not in status.get("available_models", []):
+        trace.outcome = "unavailable"
+        yield "**Error:** No models available. Please pull a model with `ollama pull qwen2.5-coder:3b`"
+        return
+    
+    # Real traffic takes the backend back from speculative work of other sessions
+    prefetcher = request["prefetcher"]
+    prefetcher.preempt(except_session=request["session_id"])
+    request["model_manager"].record_use(request["model"])
+    
+    # An answer generated ahead of time for exactly this request is already running, it needs no slot
+    request["prefetched"] = prefetcher.claim(key)
+    if request["prefetched"] is not None:
+        trace.outcome = "prefetched"
+        yield from generate_response(request, job)
+        return
+    # The session moved on, its prefetched answers can no longer match
+    prefetcher.discard_session(request["session_id"])
+    
+    # Identical deterministic requests share one generation, only its leader needs a slot
+    if request["deterministic"]:
+        subscription = request["coalescer"].join(key, request["model"])
+        if not subscription.leader:
+            with trace.span("queue_wait"):
+                while not subscription.flight.wait_started(QUEUE_POLL_INTERVAL):
+                    if job.handle.cancelled:
+                        subscription.close()
+                        return
+            if not subscription.flight.abandoned:
+                trace.outcome = "coalesced"
+                request["subscription"] = subscription
+                yield from generate_response(request, job)
+                return
+            # The leader gave up before generating anything, e.g. it was cancelled in the queue
+            subscription.close()
+        else:
+            request["subscription"] = subscription
+    
+    # Wait for a slot on the model, turning the request away if the queue is too deep
+    scheduler = request["scheduler"]
+    subscription = request.get("subscription")
+    try:
+        ticket = scheduler.submit(request["session_id"], request["model"])
+    except QueueFull as e:
+        if subscription is not None:
+            subscription.close()
+        trace.outcome = "rejected"
+        yield f"**Server busy:** {str(e)}"
+        return
+    
+    try:
+        with trace.span("queue_wait"):
+            while not scheduler.wait(ticket, timeout=QUEUE_POLL_INTERVAL):
+                if job.handle.cancelled:
+                    return
+                job.set_queue(scheduler.position(ticket), scheduler.estimated_wait(ticket))
+        job.set_queue(0, 0.0)
+        
+        yield from generate_response(request, job)
+    finally:
+        if subscription is not None:
+            # Followers go their own way if the shared generation never started
+            subscription.close()
+        # One still streaming to other sessions keeps the slot until it ends
+        if subscription is None or not subscription.flight.hand_off(lambda: scheduler.release(ticket)):
+            scheduler.release(ticket)
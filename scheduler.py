@@ -0,0 +1,173 @@
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# Constants
+# Matches Ollama's own per-model parallelism, so the queue is kept here instead of in the server.
+# The limit is per server, with several servers a model gets this many slots on each.
+MAX_CONCURRENT_PER_MODEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 2))
+MAX_QUEUE_DEPTH = 8  # Waiting requests per model before new ones are turned away
+MAX_BACKGROUND_QUEUE = MAX_QUEUE_DEPTH // 2  # Of those, waiting low-priority ones, e.g. batch reviews
+DEFAULT_SERVICE_TIME = 20.0  # Seconds, until real generations have been timed
+EWMA_ALPHA = 0.2
+WAIT_SAMPLES = 500
+
+
+class QueueFull(Exception):
+    """Raised when admission control turns a request away"""
+
+
+class Ticket:
+    """A request waiting for, or holding, a generation slot"""
+
+    def __init__(self, session_id: str, model: str, priority: int, seq: int):
+        self.session_id = session_id
+        self.model = model
+        self.priority = priority  # Lower runs first
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted: Optional[float] = None
+        self.done = False
+
+    @property
+    def wait_time(self) -> float:
+        return (self.granted or time.monotonic()) - self.enqueued
+
+
+class RequestScheduler:
+    """Per-model concurrency gate with a fair queue across sessions
+
+    Free slots go to the waiting ticket with the best priority, and among
+    equal priorities to the session that was served longest ago, so one
+    busy session cannot starve the others.
+
+    backends tells how many servers can run a model, e.g. BackendPool.serving,
+    and each of them gets max_concurrent slots. Tickets with a priority above
+    0 may only take max_background places of the queue, so background work
+    cannot fill it and turn interactive requests away.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_PER_MODEL, max_queue: int = MAX_QUEUE_DEPTH,
+                 backends: Optional[Callable[[str], int]] = None, max_background: int = MAX_BACKGROUND_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_background = min(max_background, max_queue - 1)
+        self.backends = backends
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: Dict[str, List[Ticket]] = {}
+        self._running: Dict[str, int] = {}
+        self._last_served: Dict[str, float] = {}
+        self._service_time: Dict[str, float] = {}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.admitted = 0
+        self.rejected = 0
+
+    def submit(self, session_id: str, model: str, priority: int = 0) -> Ticket:
+        """Queue a request, raising QueueFull when the model's queue is too deep"""
+        with self._cond:
+            waiting = self._waiting.setdefault(model, [])
+            if len(waiting) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(
+                    f"{len(waiting)} requests are already waiting for {model}. Please try again shortly."
+                )
+            background = sum(1 for t in waiting if t.priority > 0)
+            if priority > 0 and background >= self.max_background:
+                self.rejected += 1
+                raise QueueFull(f"{background} background requests are already waiting for {model}.")
+            ticket = Ticket(session_id, model, priority, next(self._seq))
+            waiting.append(ticket)
+            self.admitted += 1
+            self._dispatch(model)
+            return ticket
+
+    def limit(self, model: str) -> int:
+        """Requests for a model that may run at once"""
+        if self.backends is None:
+            return self.max_concurrent
+        # With every server down, one set of slots lets requests reach the failover and error paths
+        return self.max_concurrent * max(self.backends(model), 1)
+
+    def _order_key(self, ticket: Ticket) -> tuple:
+        return (ticket.priority, self._last_served.get(ticket.session_id, 0.0), ticket.seq)
+
+    def _dispatch(self, model: str):
+        """Grant free slots of a model, caller holds the lock"""
+        waiting = self._waiting.get(model, [])
+        limit = self.limit(model) if waiting else 0
+        while waiting and self._running.get(model, 0) < limit:
+            ticket = min(waiting, key=self._order_key)
+            waiting.remove(ticket)
+            ticket.granted = time.monotonic()
+            self._running[model] = self._running.get(model, 0) + 1
+            self._last_served[ticket.session_id] = ticket.granted
+            self._waits.append(ticket.wait_time)
+            self._cond.notify_all()
+
+    def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        """Block until the ticket holds a slot, returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: ticket.granted is not None, timeout)
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, 0 once the ticket holds a slot"""
+        with self._cond:
+            if ticket.granted is not None:
+                return 0
+            waiting = self._waiting.get(ticket.model, [])
+            ahead = sum(1 for t in waiting if self._order_key(t) < self._order_key(ticket))
+            return ahead + 1
+
+    def estimated_wait(self, ticket: Ticket) -> float:
+        """Seconds until the ticket is likely to get a slot"""
+        position = self.position(ticket)
+        if position == 0:
+            return 0.0
+        service_time = self._service_time.get(ticket.model, DEFAULT_SERVICE_TIME)
+        # Every limit requests ahead take roughly one service time
+        return math.ceil(position / self.limit(ticket.model)) * service_time
+
+    def release(self, ticket: Ticket):
+        """Give the slot back, or withdraw a ticket that is still waiting"""
+        with self._cond:
+            if ticket.done:
+                return
+            ticket.done = True
+            if ticket.granted is None:
+                waiting = self._waiting.get(ticket.model, [])
+                if ticket in waiting:
+                    waiting.remove(ticket)
+                return
+            self._running[ticket.model] -= 1
+            service_time = time.monotonic() - ticket.granted
+            previous = self._service_time.get(ticket.model, service_time)
+            self._service_time[ticket.model] = previous + EWMA_ALPHA * (service_time - previous)
+            self._dispatch(ticket.model)
+
+    def stats(self) -> Dict:
+        """Queue depth, running requests and wait-time percentiles"""
+        with self._cond:
+            waits = sorted(self._waits)
+            depth = {model: len(waiting) for model, waiting in self._waiting.items() if waiting}
+            running = {model: count for model, count in self._running.items() if count}
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(int(p * len(waits)), len(waits) - 1)]
+
+        return {
+            "queue_depth": sum(depth.values()),
+            "queue_by_model": depth,
+            "running": running,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0
+        }
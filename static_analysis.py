@@ -0,0 +1,299 @@
+import ast
+import json
+import multiprocessing
+import os
+import threading
+import warnings
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Constants
+MAX_ENTRIES = 1024  # Cached analysis results, keyed by content hash
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+ANALYSIS_WAIT = 0.5  # Seconds a prompt waits for a worker before analyzing the file itself
+MAX_HINTS_PER_FILE = 12
+BLOCKING_SEVERITY = "error"  # Findings that stop the code from running at all
+
+# File extension -> check, each returns findings as dicts with line, severity, code and message.
+# Checks run in worker processes, so a plugin must be registered when its module is imported.
+ANALYZERS: Dict[str, Callable[[str], List[Dict]]] = {}
+
+
+def register_analyzer(*extensions: str):
+    """Decorator adding a check for files with the given extensions"""
+    def decorator(check: Callable[[str], List[Dict]]):
+        for extension in extensions:
+            ANALYZERS[extension.lower()] = check
+        return check
+    return decorator
+
+
+def finding(line: Optional[int], severity: str, code: str, message: str) -> Dict:
+    return {"line": line, "severity": severity, "code": code, "message": message}
+
+
+def file_extension(name: str) -> str:
+    return os.path.splitext(name)[1].lstrip(".").lower()
+
+
+class _NameCollector(ast.NodeVisitor):
+    """Every name a module reads, for the unused import check"""
+
+    def __init__(self):
+        self.names = set()
+
+    def visit_Name(self, node: ast.Name):
+        self.names.add(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        # Only the root of a dotted name refers to an import
+        root = node
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        if isinstance(root, ast.Name):
+            self.names.add(root.id)
+        self.generic_visit(node)
+
+
+def _exported_names(tree: ast.Module) -> set:
+    """Names listed in a literal __all__"""
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                return {e.value for e in node.value.elts if isinstance(e, ast.Constant)}
+    return set()
+
+
+def _unused_imports(tree: ast.Module) -> List[Dict]:
+    collector = _NameCollector()
+    collector.visit(tree)
+    used = collector.names | _exported_names(tree)
+    # Names in string annotations count as used
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.isidentifier():
+            used.add(node.value)
+
+    findings = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [(alias.asname or alias.name.split(".")[0], alias.name) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module != "__future__":
+            names = [(alias.asname or alias.name, alias.name) for alias in node.names if alias.name != "*"]
+        else:
+            continue
+        for bound, imported in names:
+            if bound not in used:
+                findings.append(finding(node.lineno, "warning", "unused-import",
+                                        f"'{imported}' is imported but never used"))
+    return findings
+
+
+def _is_mutable(node: ast.expr) -> bool:
+    if isinstance(node, (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp)):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("list", "dict", "set")
+
+
+def _body_checks(body: List[ast.stmt]) -> List[Dict]:
+    """Unreachable statements and redefinitions within one block"""
+    findings = []
+    defined: Dict[str, int] = {}
+    for index, node in enumerate(body):
+        if isinstance(node, (ast.Return, ast.Raise, ast.Continue, ast.Break)) and index + 1 < len(body):
+            after = body[index + 1]
+            findings.append(finding(after.lineno, "warning", "unreachable",
+                                    f"Code after '{type(node).__name__.lower()}' never runs"))
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and not node.decorator_list:
+            if node.name in defined:
+                findings.append(finding(node.lineno, "warning", "redefined",
+                                        f"'{node.name}' redefines the one from line {defined[node.name]}"))
+            defined[node.name] = node.lineno
+    return findings
+
+
+@register_analyzer("py")
+def analyze_python(text: str) -> List[Dict]:
+    """Syntax errors plus a few bugs that are certain from the syntax tree alone"""
+    try:
+        with warnings.catch_warnings():
+            # The checks below report these, the compiler would only print them
+            warnings.simplefilter("ignore", SyntaxWarning)
+            tree = ast.parse(text)
+            # Some errors, e.g. return outside a function, only show up when compiling
+            compile(tree, "<upload>", "exec")
+    except SyntaxError as e:
+        return [finding(e.lineno, BLOCKING_SEVERITY, "syntax-error", e.msg)]
+    except (ValueError, RecursionError) as e:
+        return [finding(None, BLOCKING_SEVERITY, "syntax-error", str(e))]
+
+    findings = _unused_imports(tree) + _body_checks(tree.body)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler) and node.type is None:
+            findings.append(finding(node.lineno, "warning", "bare-except",
+                                    "Bare 'except:' also catches KeyboardInterrupt and SystemExit"))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for default in node.args.defaults + [d for d in node.args.kw_defaults if d is not None]:
+                if _is_mutable(default):
+                    findings.append(finding(default.lineno, "warning", "mutable-default",
+                                            f"Mutable default argument in '{node.name}' is shared between calls"))
+        elif isinstance(node, ast.Compare):
+            for op, right in zip(node.ops, node.comparators):
+                # By identity, 1 == True would hide 'x is 1'
+                literal = isinstance(right, ast.Constant) and not any(right.value is v for v in (None, True, False, ...))
+                if isinstance(op, (ast.Is, ast.IsNot)) and literal:
+                    findings.append(finding(node.lineno, "warning", "is-literal",
+                                            "'is' compares identity, use '==' to compare with a literal"))
+                elif isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant) and right.value is None:
+                    findings.append(finding(node.lineno, "style", "none-comparison", "Compare with None using 'is'"))
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For, ast.While, ast.If,
+                             ast.With, ast.Try, ast.ExceptHandler)):
+            findings.extend(_body_checks(node.body))
+    findings.sort(key=lambda f: f["line"] or 0)
+    return findings
+
+
+@register_analyzer("json")
+def analyze_json(text: str) -> List[Dict]:
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        return [finding(e.lineno, BLOCKING_SEVERITY, "syntax-error", e.msg)]
+    return []
+
+
+@register_analyzer("xml")
+def analyze_xml(text: str) -> List[Dict]:
+    try:
+        ElementTree.fromstring(text)
+    except ElementTree.ParseError as e:
+        return [finding(e.position[0], BLOCKING_SEVERITY, "syntax-error", str(e))]
+    return []
+
+
+def analyze(name: str, text: str) -> List[Dict]:
+    """Run the check registered for a file's extension, no findings if there is none"""
+    check = ANALYZERS.get(file_extension(name))
+    if check is None:
+        return []
+    try:
+        return check(text)
+    except Exception as e:
+        # A broken check must not look like broken code
+        return [finding(None, "info", "analysis-failed", str(e))]
+
+
+def is_blocking(findings: List[Dict]) -> bool:
+    return any(f["severity"] == BLOCKING_SEVERITY for f in findings)
+
+
+def format_hints(results: List[Tuple[str, List[Dict]]]) -> str:
+    """Findings as a compact block for the prompt, so the model can build on them"""
+    lines = []
+    for name, findings in results:
+        for f in findings[:MAX_HINTS_PER_FILE]:
+            location = f"{name}:{f['line']}" if f["line"] else name
+            lines.append(f"- {location} {f['severity']} {f['code']}: {f['message']}")
+        if len(findings) > MAX_HINTS_PER_FILE:
+            lines.append(f"- {name}: {len(findings) - MAX_HINTS_PER_FILE} more findings")
+    if not lines:
+        return ""
+    return "\n\n**Static analysis findings (verified by a parser, no need to re-check):**\n" + "\n".join(lines)
+
+
+def format_report(results: List[Tuple[str, List[Dict]]]) -> str:
+    """Answer for code that does not even parse, which needs no model to explain"""
+    lines = ["The code can't run yet, because some files don't parse. Fix these first, then ask again:", ""]
+    for name, findings in results:
+        for f in findings:
+            if f["severity"] == BLOCKING_SEVERITY:
+                where = f"line {f['line']}" if f["line"] else "unknown line"
+                lines.append(f"- **{name}**, {where}: {f['message']}")
+    return "\n".join(lines)
+
+
+class StaticAnalyzer:
+    """Runs the checks on uploads in worker processes and caches findings by content hash"""
+
+    def __init__(self, workers: int = MAX_WORKERS, max_entries: int = MAX_ENTRIES):
+        self.workers = workers
+        self.max_entries = max_entries
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._results: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.analyzed = 0
+        self.hits = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """Worker processes, started on first use, caller holds the lock"""
+        if self._executor is None:
+            # Forking a server process that runs threads can deadlock, spawn starts clean
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    @staticmethod
+    def key(name: str, sha256: str) -> str:
+        # Which check runs depends on the extension, not just the content
+        return f"{sha256}:{file_extension(name)}"
+
+    def submit(self, name: str, sha256: str, text: str):
+        """Start analyzing a file in the background unless its findings are known"""
+        key = self.key(name, sha256)
+        if file_extension(name) not in ANALYZERS:
+            return
+        with self._lock:
+            if key in self._results or key in self._pending:
+                return
+            try:
+                self._pending[key] = self._pool().submit(analyze, name, text)
+            except (BrokenProcessPool, OSError, RuntimeError):
+                self._executor = None
+                self._pending[key] = None  # Analyzed inline when the findings are asked for
+
+    def findings(self, name: str, sha256: str, load: Callable[[], str],
+                 timeout: float = ANALYSIS_WAIT) -> List[Dict]:
+        """Findings of a file, analyzing it inline if a worker has not finished it in time
+
+        Always the complete findings, so a prompt built from them does not
+        depend on how busy the pool was, e.g. for cache and prefetch keys.
+        """
+        key = self.key(name, sha256)
+        if file_extension(name) not in ANALYZERS:
+            return []
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            if key not in self._pending:
+                self._pending[key] = None
+            future = self._pending[key]
+
+        if future is None:
+            findings = analyze(name, load())
+        else:
+            try:
+                findings = future.result(timeout)
+            except (FutureTimeout, BrokenProcessPool, OSError):
+                future.cancel()
+                findings = analyze(name, load())
+
+        with self._lock:
+            self._pending.pop(key, None)
+            self._results[key] = findings
+            self.analyzed += 1
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return findings
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "pending": len(self._pending),
+                "analyzed": self.analyzed,
+                "hits": self.hits
+            }
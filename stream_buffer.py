@@ -0,0 +1,56 @@
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from ollama_client import OllamaError
+
+
+class StreamBuffer:
+    """Chunks of one generation, kept so readers can replay them and follow the rest live
+
+    A background thread reads the upstream stream into the buffer with
+    append. Subclasses say when the generation is over through running, and
+    which error a reader raises at its end through failure.
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.final: Dict = {}
+        self.backend = None
+        self.connected: Optional[float] = None
+        self._cond = threading.Condition()
+
+    @property
+    def running(self) -> bool:
+        raise NotImplementedError
+
+    def failure(self) -> Optional[str]:
+        """Error readers raise once they read every chunk, None if the generation did not fail"""
+        raise NotImplementedError
+
+    def append(self, chunk: str, upstream):
+        """Buffer a chunk of upstream and wake the readers"""
+        with self._cond:
+            if not self.chunks:
+                self.backend, self.connected = upstream.backend, upstream.connected
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def follow(self, stopped: Callable[[], bool] = lambda: False) -> Iterator[str]:
+        """Replay what is buffered, then follow the generation until it ends or stopped() is true
+
+        Whoever makes stopped() true must notify the condition, so a waiting
+        reader sees it.
+        """
+        position = 0
+        while not stopped():
+            with self._cond:
+                self._cond.wait_for(lambda: position < len(self.chunks) or not self.running or stopped())
+                new = self.chunks[position:]
+                position = len(self.chunks)
+                finished = not self.running
+            yield from new
+            if finished and position == len(self.chunks):
+                error = self.failure()
+                if error and not stopped():
+                    raise OllamaError(error)
+                return
@@ -0,0 +1,91 @@
+import time
+from typing import List
+
+# Constants
+FLUSH_INTERVAL = 0.05  # Seconds between re-renders while streaming
+FLUSH_CHARS = 200  # Re-render early once this much text is pending
+CURSOR = "▌"
+
+
+def split_closed_blocks(text: str) -> int:
+    """Return the offset up to which text consists of finished markdown blocks
+
+    A block is finished at a blank line outside a code fence, or right after
+    a closing fence. Everything past the offset may still change.
+    """
+    in_fence = False
+    offset = 0
+    boundary = 0
+    for line in text.splitlines(keepends=True):
+        offset += len(line)
+        if not line.endswith("\n"):
+            break  # The last line is still being written
+        stripped = line.strip()
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            in_fence = not in_fence
+            if not in_fence:
+                boundary = offset
+        elif not in_fence and not stripped:
+            boundary = offset
+    return boundary
+
+
+class StreamRenderer:
+    """Render a streamed answer into a container without re-rendering it all
+
+    Chunks are buffered in a list and flushed on a time or size cadence. Each
+    flush moves finished blocks into their own frozen markdown element, so
+    only the trailing open block is re-rendered.
+    """
+
+    def __init__(self, container, interval: float = FLUSH_INTERVAL, min_chars: int = FLUSH_CHARS):
+        self._container = container
+        self._interval = interval
+        self._min_chars = min_chars
+        self._frozen: List[str] = []
+        self._tail: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+        self._placeholder = container.empty()
+        self.renders = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._frozen) + "".join(self._tail)
+
+    def write(self, chunk: str):
+        """Buffer a chunk and re-render if the cadence allows it"""
+        if not chunk:
+            return
+        self._tail.append(chunk)
+        self._pending_chars += len(chunk)
+        now = time.monotonic()
+        if self._pending_chars >= self._min_chars or now - self._last_flush >= self._interval:
+            self.flush(now)
+
+    def flush(self, now: float = None):
+        tail = "".join(self._tail)
+        boundary = split_closed_blocks(tail)
+        if boundary:
+            # Freeze the finished blocks in the current element, open a new one for the rest
+            closed, tail = tail[:boundary], tail[boundary:]
+            if closed.strip():
+                self._placeholder.markdown(closed)
+                self.renders += 1
+                self._placeholder = self._container.empty()
+            self._frozen.append(closed)
+        self._tail = [tail] if tail else []
+        self._placeholder.markdown(tail + CURSOR)
+        self.renders += 1
+        self._pending_chars = 0
+        self._last_flush = now or time.monotonic()
+
+    def finish(self) -> str:
+        """Render the final tail without cursor and return the whole answer"""
+        tail = "".join(self._tail)
+        if tail.strip():
+            self._placeholder.markdown(tail)
+        else:
+            self._placeholder.empty()
+        self.renders += 1
+        return self.text
@@ -0,0 +1,98 @@
+import os
+import socket
+import sys
+import threading
+from typing import Optional
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from backend_pool import BackendPool  # noqa: E402
+from cli_worker import CliWorker  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+from model_manager import ModelManager  # noqa: E402
+from prefetch import Prefetcher  # noqa: E402
+from request_coalescer import RequestCoalescer  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from scheduler import RequestScheduler  # noqa: E402
+
+MODEL = "qwen2.5-coder:3b"
+
+
+@pytest.fixture
+def fake_server():
+    """Fake Ollama server on a free port, changed per test through its attributes"""
+    server = FakeOllama().start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_fake_server():
+    """Factory for several fake servers, e.g. to test failover"""
+    servers = []
+
+    def make(**kwargs) -> FakeOllama:
+        server = FakeOllama(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def garbage_server():
+    """Server that answers every request with a line that is not HTTP"""
+    listener = socket.create_server(("127.0.0.1", 0))
+    stopped = threading.Event()
+
+    def serve():
+        while not stopped.is_set():
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            with connection:
+                try:
+                    connection.recv(65536)
+                    connection.sendall(b"GARBAGE\r\n\r\n")
+                except OSError:
+                    pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}"
+    stopped.set()
+    listener.close()
+
+
+def chat_payload(content: str = "hi", model: str = MODEL, num_predict: int = 16) -> dict:
+    return {"model": model, "messages": [{"role": "user", "content": content}], "stream": True,
+            "options": {"num_predict": num_predict}}
+
+
+def pipeline_request(tmp_path, pool: BackendPool, cli_worker: Optional[CliWorker] = None,
+                     num_predict: int = 16) -> dict:
+    """Request as the app hands it to stream_ollama_response, with fresh shared resources"""
+    return {
+        "prompt": "hi",
+        "session_id": "s1",
+        "model": MODEL,
+        "request_data": chat_payload(num_predict=num_predict),
+        "context_stats": {},
+        "cacheable": False,
+        "deterministic": False,
+        "pool": pool,
+        "cache": ResponseCache(os.path.join(str(tmp_path), "cache.sqlite3")),
+        "prefetcher": Prefetcher(pool),
+        "coalescer": RequestCoalescer(),
+        "scheduler": RequestScheduler(),
+        "model_manager": ModelManager(pool),
+        "cli_worker": cli_worker or CliWorker()
+    }
@@ -0,0 +1,55 @@
+import pytest
+
+from backend_pool import BackendPool
+from conftest import chat_payload
+from fake_ollama import ANSWER_TOKENS
+from ollama_client import OllamaError
+
+
+def test_routes_to_the_least_busy_backend(make_fake_server):
+    servers = [make_fake_server(), make_fake_server()]
+    pool = BackendPool([s.url for s in servers])
+    pool.backends[0].outstanding = 3
+    assert pool.pick("qwen2.5-coder:3b") is pool.backends[1]
+
+
+def test_fails_over_before_the_first_token(make_fake_server):
+    failing, healthy = make_fake_server(fail_rate=1.0), make_fake_server()
+    pool = BackendPool([failing.url, healthy.url])
+    stream = pool.chat_stream(chat_payload(num_predict=3))
+    assert "".join(stream) == "".join(token + " " for token in ANSWER_TOKENS[:3])
+    assert stream.backend is pool.backends[1]
+    assert pool.failovers == 1
+    assert pool.backends[0].errors == 1
+    assert [b.outstanding for b in pool.backends] == [0, 0]
+
+
+def test_fails_over_when_the_connection_drops_before_the_first_token(make_fake_server):
+    dropping, healthy = make_fake_server(drop_rate=1.0), make_fake_server()
+    pool = BackendPool([dropping.url, healthy.url])
+    # With one token to send, the drop always comes before it
+    stream = pool.chat_stream(chat_payload(num_predict=1))
+    assert "".join(stream)
+    assert stream.backend is pool.backends[1]
+    assert stream.final["done"]
+
+
+def test_unexpected_errors_fail_over_and_release_the_backend(make_fake_server):
+    broken, healthy = make_fake_server(), make_fake_server()
+    pool = BackendPool([broken.url, healthy.url])
+
+    def crash(payload):
+        raise RuntimeError("bad status line")
+
+    pool.backends[0].client.chat_stream = crash
+    stream = pool.chat_stream(chat_payload(num_predict=2))
+    assert "".join(stream)
+    assert stream.backend is pool.backends[1]
+    assert [b.outstanding for b in pool.backends] == [0, 0]
+    assert "bad status line" in pool.backends[0].last_error
+
+
+def test_no_backend_serving_the_model_raises(make_fake_server):
+    pool = BackendPool([make_fake_server().url])
+    with pytest.raises(OllamaError, match="No healthy Ollama backend"):
+        list(pool.chat_stream(chat_payload(model="missing:1b")))
@@ -0,0 +1,71 @@
+import zipfile
+
+from backend_pool import BackendPool
+from batch_review import BatchReview, iter_sources, review_prompt, review_units
+from context_builder import estimate_tokens
+
+
+def huge_function(lines: int = 400) -> str:
+    body = "\n".join(f"    total += value_{i} * factor_{i}  # step {i}" for i in range(lines))
+    return f"def huge():\n    total = 0\n{body}\n    return total\n"
+
+
+def test_oversized_chunk_is_capped_to_the_budget():
+    text = huge_function()
+    units = review_units("big.py", text, budget=500)
+    assert all(estimate_tokens(unit["text"]) <= 500 for unit in units)
+    unit = units[0]
+    assert "cut" in unit
+    prompt = review_prompt(unit)
+    lines = text.splitlines()
+    # Both ends keep their real line numbers around the omission marker
+    assert f"    1  {lines[0]}" in prompt
+    assert f"{unit['end']:5d}  {lines[unit['end'] - 1]}" in prompt
+    assert "lines omitted" in prompt
+
+
+def test_failed_unit_does_not_abort_the_run(fake_server, tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.py").write_text("a = 1\n")
+    (source / "b.py").write_text("b = 2\n")
+    review = BatchReview(BackendPool([fake_server.url]), str(source), state_path=str(tmp_path / "state.jsonl"))
+    original = review._review
+
+    def flaky(key, unit):
+        if unit["file"] == "a.py":
+            raise RuntimeError("unexpected answer")
+        return original(key, unit)
+
+    monkeypatch.setattr(review, "_review", flaky)
+    stats = review.run()
+    assert stats["errors"] == 1
+    assert stats["units_done"] == 1
+    assert "Failed requests:** 1" in open(review.report_path, encoding="utf-8").read()
+
+
+def test_unreadable_file_is_skipped(fake_server, tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "ok.py").write_text("ok = True\n")
+    (source / "gone.py").symlink_to(tmp_path / "missing.py")
+    review = BatchReview(BackendPool([fake_server.url]), str(source), state_path=str(tmp_path / "state.jsonl"))
+    stats = review.run()
+    assert stats["files_done"] == 1
+    assert [skipped["file"] for skipped in review.skipped_files] == ["gone.py"]
+
+
+def test_archive_is_closed_after_listing(tmp_path, monkeypatch):
+    path = tmp_path / "code.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("pkg/mod.py", "x = 1\n")
+    opened = []
+    original = zipfile.ZipFile.__init__
+
+    def track(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        opened.append(self)
+
+    monkeypatch.setattr(zipfile.ZipFile, "__init__", track)
+    assert [name for name, _, _ in iter_sources(str(path))] == ["pkg/mod.py"]
+    assert opened and all(archive.fp is None for archive in opened)
@@ -0,0 +1,71 @@
+from code_index import CodeIndex, retrieve_context, select_context
+from context_builder import build_context, estimate_tokens
+
+SOURCE = '''import json
+
+
+def load_settings(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_arguments(argv):
+    return [arg for arg in argv if arg.startswith("--")]
+'''
+
+
+def make_index() -> CodeIndex:
+    index = CodeIndex()
+    index.add_file("settings.py", SOURCE)
+    return index
+
+
+def test_search_ranks_matching_symbol_first():
+    hits = make_index().search("where are settings loaded")
+    assert hits and hits[0]["symbol"] == "def load_settings"
+
+
+def test_search_without_shared_terms_returns_nothing():
+    assert make_index().search("quaternion rotation matrix") == []
+    assert retrieve_context(make_index(), "quaternion rotation matrix") == []
+
+
+ANALYZE = "Analyze the uploaded code: explain what it does, point out bugs and suggest improvements."
+
+
+def large_source(functions: int = 200) -> str:
+    return "\n\n".join(f"def step_{i}(values):\n    total = sum(values) * {i}\n    return total - {i}\n"
+                       for i in range(functions))
+
+
+def test_generic_question_still_retrieves_code():
+    index = CodeIndex()
+    index.add_file("pipeline.py", large_source())
+    chunks = retrieve_context(index, "what does this do?", min_tokens=500)
+    assert chunks
+    assert sum(estimate_tokens(c["content"]) for c in chunks) >= 500
+    # The opening of the file comes first
+    assert "def step_0" in chunks[0]["content"]
+
+
+def test_large_attachment_with_generic_prompt_puts_code_in_the_messages():
+    source = large_source()
+    index = CodeIndex()
+    index.add_file("pipeline.py", source)
+    files = [{"name": "pipeline.py", "content": source}]
+    excerpts, retrieval = select_context(index, files, "what does this do?")
+    assert retrieval and excerpts
+    messages, _ = build_context(None, [], "what does this do?", [], excerpts=excerpts)
+    assert "def step_0" in messages[-1]["content"]
+
+
+def test_whole_file_prompt_sends_the_file():
+    source = large_source()
+    index = CodeIndex()
+    index.add_file("pipeline.py", source)
+    files = [{"name": "pipeline.py", "content": source}]
+    attachments, retrieval = select_context(index, files, ANALYZE, whole_files=True)
+    assert retrieval is None and attachments == files
+    messages, stats = build_context(None, [], ANALYZE, attachments)
+    assert "--- File: pipeline.py ---" in messages[0]["content"]
+    assert "def step_0" in messages[0]["content"]
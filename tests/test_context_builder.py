@@ -0,0 +1,78 @@
+from context_builder import (HISTORY_STRIDE, VERBATIM_TURNS, build_context, describe_stats, estimate_tokens,
+                             fit_attachments, fit_history, truncate_middle)
+
+
+def turn(seq: int) -> dict:
+    role = "user" if seq % 2 else "assistant"
+    content = f"Message {seq} explains the change.\n```python\n" + "x = 1\n" * 200 + "```\nDone."
+    return {"seq": seq, "role": role, "content": content}
+
+
+def test_history_stays_within_budget():
+    history = [turn(seq) for seq in range(1, 41)]
+    packed, stats = fit_history(history, 1000)
+    assert sum(h["tokens"] for h in stats) <= 1000
+    assert len(packed) < len(history)
+    # The newest messages are always the ones kept
+    assert packed[-1]["content"] == history[-1]["content"]
+
+
+def test_old_turns_are_summarized():
+    history = [turn(seq) for seq in range(1, HISTORY_STRIDE + VERBATIM_TURNS + 3)]
+    packed, stats = fit_history(history, 100000)
+    assert len(packed) == len(history)
+    assert stats[0]["mode"] == "summarized"
+    assert packed[0]["content"].startswith("[Earlier message, summarized] Message 1 explains")
+    assert "x = 1" not in packed[0]["content"]
+    assert [h["mode"] for h in stats[-VERBATIM_TURNS:]] == ["full"] * VERBATIM_TURNS
+
+
+def test_sent_messages_stay_identical_until_the_stride_rolls():
+    history = [turn(seq) for seq in range(1, 4 * HISTORY_STRIDE)]
+    rolls = 0
+    previous, _ = fit_history(history[:1], 100000)
+    for count in range(2, len(history) + 1):
+        packed, _ = fit_history(history[:count], 100000)
+        if packed[:len(previous)] != previous:
+            rolls += 1
+            assert (count - VERBATIM_TURNS) % HISTORY_STRIDE == 0
+        previous = packed
+    assert rolls == (len(history) - VERBATIM_TURNS) // HISTORY_STRIDE
+
+
+def test_truncate_middle_keeps_head_and_tail():
+    text = "\n".join(f"line {i}" for i in range(1000))
+    cut = truncate_middle(text, 200)
+    assert estimate_tokens(cut) <= 200
+    assert cut.startswith("line 0\n") and cut.endswith("line 999")
+    assert "lines omitted to fit the context window" in cut
+    assert truncate_middle("short", 200) == "short"
+
+
+def test_large_file_is_truncated_and_small_one_kept():
+    files = [{"name": "big.py", "content": "y = 2\n" * 5000}, {"name": "small.py", "content": "z = 3\n"}]
+    fitted, stats = fit_attachments(files, 1000)
+    assert [f["name"] for f in fitted] == ["big.py", "small.py"]
+    modes = {s["name"]: s["mode"] for s in stats}
+    assert modes == {"small.py": "full", "big.py": "truncated"}
+    assert sum(s["tokens"] for s in stats) <= 1000
+
+
+def test_build_context_reports_stats():
+    history = [turn(seq) for seq in range(1, 41)]
+    files = [{"name": "big.py", "content": "y = 2\n" * 5000}]
+    messages, stats = build_context("Be brief.", history, "Why?", files, context_length=4096, max_tokens=1024)
+    assert stats["used"] <= stats["budget"] == 3072
+    assert messages[0]["role"] == "system" and "--- File: big.py ---" in messages[0]["content"]
+    assert messages[-1] == {"role": "user", "content": "Why?"}
+    assert stats["history_dropped"] == len(history) - len(stats["history"])
+    summary = describe_stats(stats)
+    assert summary.startswith(f"{stats['used']:,} / 3,072 prompt tokens")
+    assert f"{stats['history_dropped']} dropped" in summary
+    assert "1 file(s) (1 truncated or dropped)" in summary
+
+
+def test_describe_stats_mentions_retrieval():
+    _, stats = build_context(None, [], "Why?", [])
+    stats["retrieval"] = {"chunks": 3, "indexed_chunks": 40, "file_tokens": 12000}
+    assert "3 of 40 file chunks retrieved (files total 12,000 tokens)" in describe_stats(stats)
@@ -0,0 +1,60 @@
+import io
+import json
+
+import conversation_store
+from conversation_store import ConversationStore
+
+
+def fill(store: ConversationStore, conversation_id: str, count: int):
+    for i in range(count):
+        store.append(conversation_id, "user" if i % 2 == 0 else "assistant", f"message {i + 1}")
+
+
+def test_messages_are_numbered_per_conversation(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+    first, second = store.create("m"), store.create()
+    assert store.append(first, "user", "a") == 1
+    assert store.append(second, "user", "b") == 1
+    assert store.append(first, "assistant", "c") == 2
+    assert store.count(first) == 2 and store.count(second) == 1
+    assert store.exists(first) and not store.exists("missing")
+
+
+def test_pages_go_back_from_the_newest(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+    conversation_id = store.create()
+    fill(store, conversation_id, 45)
+    newest = store.page(conversation_id)
+    assert [m["seq"] for m in newest] == list(range(26, 46))
+    older = store.page(conversation_id, before_seq=newest[0]["seq"], limit=30)
+    assert [m["seq"] for m in older] == list(range(1, 26))
+    assert older[0] == {"seq": 1, "role": "user", "content": "message 1"}
+
+
+def test_conversation_survives_a_restart(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    store = ConversationStore(path)
+    conversation_id = store.create()
+    fill(store, conversation_id, 3)
+    reopened = ConversationStore(path)
+    assert reopened.exists(conversation_id)
+    assert [m["content"] for m in reopened.page(conversation_id)] == ["message 1", "message 2", "message 3"]
+
+
+def test_export_streams_every_message_as_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_store, "EXPORT_BATCH", 7)
+    store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+    conversation_id = store.create()
+    fill(store, conversation_id, 20)
+    out = io.StringIO()
+    store.export(conversation_id, out, {"model": "m", "title": "Ünïcode"})
+    exported = json.loads(out.getvalue())
+    assert exported["model"] == "m" and exported["title"] == "Ünïcode"
+    assert [m["content"] for m in exported["messages"]] == [f"message {i}" for i in range(1, 21)]
+
+
+def test_empty_conversation_exports_no_messages(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+    out = io.StringIO()
+    store.export(store.create(), out, {})
+    assert json.loads(out.getvalue()) == {"messages": []}
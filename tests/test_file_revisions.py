@@ -0,0 +1,49 @@
+from file_revisions import diff_hunks, review_notes, review_targets, revision_content, revision_notes_key
+
+
+def source(changed: int = -1) -> str:
+    return "".join(f"value_{i} = {i * 2 if i == changed else i}\n" for i in range(100))
+
+
+def test_diff_keeps_only_changed_hunks():
+    diff, stats = diff_hunks(source(), source(changed=50))
+    assert stats == {"hunks": 1, "added": 1, "removed": 1}
+    assert "-value_50 = 50" in diff and "+value_50 = 100" in diff
+    assert "value_10 =" not in diff
+
+
+def test_revision_carries_the_previous_notes():
+    content = revision_content(source(), source(changed=50), 2, notes="Rename value_50.")
+    assert content.startswith("[Revision 2: 1 changed hunk(s), +1 -1 lines")
+    assert content.endswith("[Notes from the review of the previous revision]\nRename value_50.")
+
+
+def test_whole_file_is_sent_when_cheaper():
+    rewritten = "".join(f"other_{i} = {i}\n" for i in range(100))
+    assert revision_content(source(), rewritten, 2) is None
+    assert revision_content(source(), source(), 2) is None
+
+
+def test_long_review_is_cut_at_a_line():
+    answer = "\n".join(f"Finding {i}: something to fix here" for i in range(200))
+    notes = review_notes(answer, limit=500)
+    assert len(notes) <= 506 and notes.endswith("\n[...]")
+    assert notes.splitlines()[-2].startswith("Finding ")
+    assert review_notes("  short  ") == "short"
+
+
+def test_revision_uses_notes_until_it_has_its_own():
+    notes = {"v1": "notes-1"}
+    revised = {"sha256": "v2", "previous": "v1"}
+    assert revision_notes_key(revised, notes) == "notes-1"
+    assert revision_notes_key({"sha256": "v3", "previous": "v2"}, notes) is None
+    assert revision_notes_key({"sha256": "new"}, notes) is None
+    notes["v2"] = "notes-2"
+    assert revision_notes_key(revised, notes) is None
+
+
+def test_only_reviews_replace_existing_notes():
+    files = [{"sha256": "reviewed"}, {"sha256": "fresh"}]
+    notes = {"reviewed": "notes"}
+    assert review_targets(files, notes, review=False) == [{"sha256": "fresh"}]
+    assert review_targets(files, notes, review=True) == files
@@ -0,0 +1,45 @@
+import io
+import os
+
+import pytest
+
+from file_store import MISSING_TEXT, FileStore, IngestError, read_text
+
+
+def test_disk_cap_evicts_least_recently_used(tmp_path):
+    store = FileStore(str(tmp_path), memory_items=0, max_disk_bytes=250)
+    store.put("a", "a" * 100)
+    store.put("b", "b" * 100)
+    os.utime(tmp_path / "a.txt", (1, 1))
+    os.utime(tmp_path / "b.txt", (2, 2))
+    # Reading a refreshes it, so b is now the oldest
+    assert store.load("a") == "a" * 100
+    store.put("c", "c" * 100)
+    assert store.has("a") and store.has("c")
+    assert not store.has("b")
+    assert store.evicted == 1
+
+
+def test_evicted_file_loads_as_placeholder(tmp_path):
+    store = FileStore(str(tmp_path), memory_items=0, max_disk_bytes=150)
+    store.put("a", "a" * 100)
+    store.put("b", "b" * 100)
+    assert store.load("a") == MISSING_TEXT
+    assert store.load("b") == "b" * 100
+
+
+def test_disk_usage_survives_restart(tmp_path):
+    FileStore(str(tmp_path), max_disk_bytes=150).put("a", "a" * 100)
+    store = FileStore(str(tmp_path), memory_items=0, max_disk_bytes=150)
+    store.put("b", "b" * 100)
+    assert not store.has("a")
+
+
+def test_cp1252_fallback():
+    text, _, encoding = read_text("old.py", io.BytesIO("café = 1\n".encode("cp1252")))
+    assert (text, encoding) == ("café = 1\n", "cp1252")
+
+
+def test_undecodable_bytes_are_rejected():
+    with pytest.raises(IngestError, match="not valid text"):
+        read_text("odd.txt", io.BytesIO(b"x = 1\n\x81\x8d\x8f\n"))
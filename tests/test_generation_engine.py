@@ -0,0 +1,91 @@
+import time
+
+from backend_pool import BackendPool
+from conftest import pipeline_request
+from fake_ollama import ANSWER_TOKENS
+from generation_engine import GenerationEngine
+from generation_registry import GenerationRegistry
+from metrics import MetricsRecorder
+from response_pipeline import stream_ollama_response
+
+
+def answer(tokens: int) -> str:
+    return "".join(token + " " for token in ANSWER_TOKENS[:tokens])
+
+
+def make_engine(tmp_path, ttl: float = 600.0) -> GenerationEngine:
+    # No browser session is connected, but the grace period outlasts every test
+    registry = GenerationRegistry(lambda session_id: False, reconnect_grace=60.0)
+    return GenerationEngine(registry, MetricsRecorder(str(tmp_path / "metrics.jsonl")), ttl=ttl)
+
+
+def submit(engine: GenerationEngine, request: dict, stored: dict):
+    trace = engine.metrics.start_trace(request["model"])
+    return engine.submit("conversation", request["session_id"], request["model"], request["prompt"], trace,
+                         lambda job: stream_ollama_response(request, job),
+                         lambda job: stored.update(text=job.text()))
+
+
+def wait_finished(job, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while job.running and time.monotonic() < deadline:
+        job.read(len(job.parts), timeout=0.1)
+    assert not job.running
+
+
+def test_answer_is_stored_after_the_viewer_detaches(fake_server, tmp_path):
+    fake_server.tokens_per_second = 100
+    engine = make_engine(tmp_path)
+    stored = {}
+    request = pipeline_request(tmp_path, BackendPool([fake_server.url]), num_predict=20)
+    job = submit(engine, request, stored)
+    # The script run that showed the job ends after the first chunk
+    chunks, _ = job.read(0, timeout=2)
+    assert chunks
+    wait_finished(job)
+    assert stored["text"] == answer(20)
+    assert engine.registry.completed == 1
+    assert not request["scheduler"].stats()["running"]
+
+
+def test_job_is_adopted_again_by_conversation(fake_server, tmp_path):
+    fake_server.tokens_per_second = 50
+    engine = make_engine(tmp_path)
+    job = submit(engine, pipeline_request(tmp_path, BackendPool([fake_server.url]), num_predict=20), {})
+    job.read(0, timeout=2)
+    # A reconnected browser gets a new session id but shows the same conversation
+    resumed = engine.get("conversation")
+    assert resumed is job
+    engine.adopt(resumed, "s2")
+    assert engine.registry.get("s2") is job.handle
+    assert engine.registry.get("s1") is None
+    wait_finished(job)
+    replayed, finished = job.read(0)
+    assert "".join(replayed) == answer(20) and finished
+
+
+def test_cancel_releases_the_slot_and_records_metrics(fake_server, tmp_path):
+    fake_server.tokens_per_second = 20
+    engine = make_engine(tmp_path)
+    request = pipeline_request(tmp_path, BackendPool([fake_server.url]), num_predict=100)
+    job = submit(engine, request, {})
+    job.read(0, timeout=2)
+    assert request["scheduler"].stats()["running"]
+    assert engine.cancel("conversation")
+    wait_finished(job)
+    assert not request["scheduler"].stats()["running"]
+    assert job.trace.outcome == "cancelled"
+    engine.release(job)
+    assert engine.metrics.outcomes == {"cancelled": 1}
+    assert engine.get("conversation") is None
+
+
+def test_unclaimed_answer_expires_and_is_recorded(fake_server, tmp_path):
+    engine = make_engine(tmp_path, ttl=0.0)
+    request = pipeline_request(tmp_path, BackendPool([fake_server.url]), num_predict=4)
+    job = submit(engine, request, {})
+    wait_finished(job)
+    assert engine.stats()["unclaimed"] == 1
+    assert engine.get("conversation") is None
+    assert engine.metrics.outcomes == {"ok": 1}
+    assert not request["scheduler"].stats()["running"]
@@ -0,0 +1,70 @@
+import os
+import time
+
+from memory_manager import MISSING_TEXT, SessionMemory
+
+
+def body(seed: int) -> str:
+    # Hashes do not compress, so every body holds its own share of the cap
+    return "".join(str(hash((seed, i))) for i in range(200))
+
+
+def spill_files(memory: SessionMemory) -> list:
+    return sorted(os.listdir(memory.spill_path))
+
+
+def test_payload_shared_with_busy_session_is_not_spilled(tmp_path):
+    memory = SessionMemory(cap=0, idle=0.2, spill_path=str(tmp_path))
+    shared = memory.put("idle", body(0))
+    private = memory.put("idle", body(1))
+    time.sleep(0.3)
+    memory.put("busy", body(0))
+    memory.touch("busy", [shared], state_bytes=0)
+    assert memory.footprint("idle")["spilled"]
+    assert spill_files(memory) == [private]
+    assert memory.stats()["payloads"] == 1
+
+
+def test_get_restores_a_spilled_key(tmp_path):
+    memory = SessionMemory(cap=0, idle=0.0, spill_path=str(tmp_path))
+    key = memory.put("s1", body(0))
+    memory.enforce_cap()
+    assert memory.stats()["payloads"] == 0
+    assert memory.get(key) == body(0)
+    assert memory.stats()["payloads"] == 1
+    assert memory.restored == 1
+
+
+def test_forget_removes_spill_files_without_owners(tmp_path):
+    memory = SessionMemory(cap=0, idle=0.0, spill_path=str(tmp_path))
+    shared = memory.put("s1", body(0))
+    memory.put("s2", body(0))
+    memory.enforce_cap()
+    assert spill_files(memory) == [shared]
+    memory.forget("s1")
+    assert spill_files(memory) == [shared]
+    memory.forget("s2")
+    assert spill_files(memory) == []
+    assert memory.get(shared) == MISSING_TEXT
+
+
+def test_enforce_cap_spills_longest_idle_first(tmp_path):
+    memory = SessionMemory(idle=0.0, spill_path=str(tmp_path))
+    for session_id in ("oldest", "middle", "newest"):
+        memory.put(session_id, body(len(session_id) + ord(session_id[0])))
+        time.sleep(0.01)
+    # Spilling one session is enough to get under the cap
+    memory.cap = memory.total() - 1
+    memory.enforce_cap()
+    assert [memory.footprint(s)["spilled"] for s in ("oldest", "middle", "newest")] == [True, False, False]
+    assert memory.total() <= memory.cap
+    assert memory.stats()["spilled_sessions"] == 1
+
+
+def test_closed_sessions_are_forgotten(tmp_path):
+    memory = SessionMemory(spill_path=str(tmp_path), is_session_active=lambda session_id: session_id == "open")
+    memory.put("open", body(0))
+    memory.put("closed", body(1))
+    memory.enforce_cap()
+    assert memory.stats()["sessions"] == 1
+    assert memory.stats()["payloads"] == 1
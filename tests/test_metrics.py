@@ -0,0 +1,28 @@
+import json
+
+from metrics import MetricsRecorder, append_jsonl
+
+
+def test_log_is_rotated_past_its_size(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    for i in range(3):
+        append_jsonl(path, {"i": i}, max_bytes=10)
+    rotated = [json.loads(line) for line in open(path + ".1", encoding="utf-8")]
+    current = [json.loads(line) for line in open(path, encoding="utf-8")]
+    assert rotated + current == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert len(current) < 3
+
+
+def test_unwritable_log_is_ignored(tmp_path):
+    append_jsonl(str(tmp_path / "missing" / "events.jsonl"), {"i": 0})
+
+
+def test_recorder_counts_outcomes_and_logs(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    recorder = MetricsRecorder(str(path))
+    trace = recorder.start_trace("qwen2.5-coder:3b")
+    trace.mark("first_token")
+    recorder.record(trace)
+    assert recorder.outcomes == {"ok": 1}
+    assert json.loads(path.read_text())["model"] == "qwen2.5-coder:3b"
+    assert recorder.percentiles()["first_token"]["count"] == 1
@@ -0,0 +1,54 @@
+import json
+
+from metrics import RequestTrace
+from model_router import ModelRouter, is_chat_model, model_size
+
+AVAILABLE = ["qwen2.5-coder:3b", "qwen2.5-coder:7b", "nomic-embed-text:latest", "mystery:latest", "codellama:13b"]
+
+
+def test_embedding_and_unsized_models_are_not_tiered():
+    tiers = ModelRouter(tiers={}, path=None).tiers_for(AVAILABLE)
+    assert tiers == {"fast": ["qwen2.5-coder:3b"], "balanced": ["qwen2.5-coder:7b"], "deep": ["codellama:13b"]}
+
+
+def test_tags_details_size_and_family():
+    models = {
+        "mystery:latest": {"details": {"family": "llama", "parameter_size": "70.6B"}},
+        "all-minilm:latest": {"details": {"family": "bert", "parameter_size": "23M"}},
+    }
+    tiers = ModelRouter(tiers={}, path=None).tiers_for(["qwen2.5-coder:3b", "mystery:latest", "all-minilm:latest"],
+                                                        models)
+    assert tiers == {"fast": ["qwen2.5-coder:3b"], "balanced": [], "deep": ["mystery:latest"]}
+    assert model_size("all-minilm:latest", models["all-minilm:latest"]["details"]) == 0.023
+    assert not is_chat_model("all-minilm:latest", models["all-minilm:latest"]["details"])
+
+
+def test_configured_models_are_kept_even_without_a_size():
+    router = ModelRouter(tiers={"deep": ["mystery:latest"]}, path=None)
+    assert router.tiers_for(AVAILABLE)["deep"] == ["mystery:latest", "codellama:13b"]
+
+
+def test_falls_back_to_the_selected_model_when_nothing_is_tiered():
+    router = ModelRouter(tiers={}, path=None)
+    decision = router.route("hi", 0, 0, ["nomic-embed-text:latest", "mystery:latest"], [], 512,
+                            fallback="mystery:latest")
+    assert decision["model"] == "mystery:latest"
+    assert decision["reason"] == "no tiered models"
+
+
+def test_short_question_goes_to_the_fast_tier():
+    decision = ModelRouter(tiers={}, path=None).route("what is a closure?", 0, 0, AVAILABLE, [], 512)
+    assert decision["model"] == "qwen2.5-coder:3b"
+
+
+def test_decisions_are_logged_with_their_outcome(tmp_path):
+    path = tmp_path / "routing.jsonl"
+    router = ModelRouter(tiers={}, path=str(path))
+    decision = router.route("what is a closure?", 0, 0, AVAILABLE, [], 512)
+    trace = RequestTrace(decision["model"])
+    trace.values.update(first_token=0.5, tokens_per_second=30.0)
+    router.record(decision, trace)
+    logged = json.loads(path.read_text())
+    assert logged["model"] == "qwen2.5-coder:3b" and logged["outcome"] == "ok"
+    assert router.recent() == [logged]
+    assert router.stats()["speeds"]["qwen2.5-coder:3b"]["tokens_per_second"] == 30.0
@@ -0,0 +1,104 @@
+import socket
+import threading
+
+import pytest
+
+from conftest import MODEL, chat_payload
+from fake_ollama import ANSWER_TOKENS
+from ollama_client import OllamaClient, OllamaError
+
+
+def test_pooled_connection_is_reused(fake_server):
+    client = OllamaClient(fake_server.url)
+    client.request_json("GET", "/api/version")
+    connection = client._idle.queue[0]
+    assert client.request_json("GET", "/api/version")["version"]
+    assert list(client._idle.queue) == [connection]
+
+
+def test_stream_returns_connection_to_pool(fake_server):
+    client = OllamaClient(fake_server.url)
+    stream = client.chat_stream(chat_payload())
+    list(stream)
+    assert client._idle.qsize() == 1
+
+
+def test_stale_pooled_connection_is_retried(fake_server):
+    client = OllamaClient(fake_server.url)
+    client.request_json("GET", "/api/version")
+    # The connection went dead while it sat in the pool
+    client._idle.queue[0].sock.shutdown(socket.SHUT_RDWR)
+    assert client.request_json("GET", "/api/version")["version"]
+
+
+def test_ndjson_chunks_and_final_counters(fake_server):
+    client = OllamaClient(fake_server.url)
+    stream = client.chat_stream(chat_payload(num_predict=10))
+    text = "".join(stream)
+    assert text == "".join(token + " " for token in ANSWER_TOKENS[:10])
+    assert stream.final["done"] is True
+    assert stream.final["eval_count"] == 10
+
+
+def test_ttft_includes_first_token_latency(fake_server):
+    fake_server.first_token_latency = 0.2
+    client = OllamaClient(fake_server.url)
+    stream = client.chat_stream(chat_payload(num_predict=2))
+    list(stream)
+    assert 0.2 <= stream.ttft < 2.0
+
+
+def test_unknown_model_maps_to_ollama_error(fake_server):
+    client = OllamaClient(fake_server.url)
+    with pytest.raises(OllamaError, match="HTTP 404"):
+        client.chat_stream(chat_payload(model="missing:1b"))
+
+
+def test_server_error_maps_to_ollama_error(fake_server):
+    fake_server.fail_rate = 1.0
+    client = OllamaClient(fake_server.url)
+    with pytest.raises(OllamaError, match="injected failure"):
+        client.chat_stream(chat_payload())
+
+
+def test_dropped_stream_raises_ollama_error(fake_server):
+    fake_server.drop_rate = 1.0
+    client = OllamaClient(fake_server.url)
+    stream = client.chat_stream(chat_payload(num_predict=32))
+    with pytest.raises(OllamaError):
+        list(stream)
+    assert not stream.final
+
+
+def test_unreachable_server_maps_to_ollama_error(fake_server):
+    url = fake_server.url
+    fake_server.shutdown()
+    fake_server.server_close()
+    client = OllamaClient(url)
+    with pytest.raises(OllamaError, match="Cannot reach"):
+        client.request_json("GET", "/api/version", timeout=2)
+
+
+def test_non_http_answer_maps_to_ollama_error(garbage_server):
+    client = OllamaClient(garbage_server)
+    with pytest.raises(OllamaError):
+        client.chat_stream(chat_payload())
+    with pytest.raises(OllamaError):
+        client.request_json("GET", "/api/tags", timeout=2)
+
+
+def test_model_listing(fake_server):
+    client = OllamaClient(fake_server.url)
+    models = [m["name"] for m in client.request_json("GET", "/api/tags")["models"]]
+    assert MODEL in models
+
+
+def test_close_from_another_thread_ends_stream_quietly(fake_server):
+    fake_server.tokens_per_second = 20
+    client = OllamaClient(fake_server.url)
+    stream = client.chat_stream(chat_payload(num_predict=100))
+    chunks = iter(stream)
+    assert next(chunks)
+    threading.Timer(0.1, stream.close).start()
+    assert len(list(chunks)) < 99
+    assert stream.closed
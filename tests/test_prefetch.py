@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from backend_pool import BackendPool
+from code_index import CodeIndex, select_context
+from conftest import chat_payload
+from context_builder import build_context
+from ollama_client import OllamaError
+from prefetch import Prefetcher
+
+ANALYZE = "Analyze the uploaded code: explain what it does, point out bugs and suggest improvements."
+
+
+def test_only_one_prefetch_generates_at_a_time(fake_server):
+    fake_server.tokens_per_second = 5
+    prefetcher = Prefetcher(BackendPool([fake_server.url]))
+    assert prefetcher.start("a", "key-a", chat_payload("first", num_predict=50))
+    assert not prefetcher.start("b", "key-b", chat_payload("second", num_predict=50))
+    assert prefetcher.stats()["active"] == 1
+    # A session replacing its own prefetch is not blocked by it
+    assert prefetcher.start("a", "key-a2", chat_payload("third", num_predict=50))
+    assert prefetcher.stats()["active"] == 1
+    prefetcher.preempt()
+
+
+def test_prefetched_answer_is_claimed_once(fake_server):
+    prefetcher = Prefetcher(BackendPool([fake_server.url]))
+    prefetcher.start("a", "key", chat_payload(num_predict=4))
+    entry = prefetcher.claim("key")
+    assert "".join(entry) and entry.done
+    assert prefetcher.claim("key") is None
+    assert prefetcher.stats()["hits"] == 1
+
+
+def test_prefetched_analysis_request_contains_the_file(fake_server):
+    source = "\n\n".join(f"def step_{i}(values):\n    return sum(values) * {i}\n" for i in range(300))
+    index = CodeIndex()
+    index.add_file("pipeline.py", source)
+    # Built like the Analyze Code prefetch of the app
+    files, _ = select_context(index, [{"name": "pipeline.py", "content": source}], ANALYZE, whole_files=True)
+    messages, _ = build_context(None, [], ANALYZE, files)
+    prefetcher = Prefetcher(BackendPool([fake_server.url]))
+    prefetcher.start("a", "key", dict(chat_payload(num_predict=4), messages=messages))
+    "".join(prefetcher.claim("key"))
+    sent = "".join(m["content"] for m in fake_server.last_chat["messages"])
+    assert "def step_0(values)" in sent
+    assert "def step_299(values)" in sent
+
+
+class BrokenPool:
+    def chat_stream(self, request_data):
+        raise ValueError("bad chunk")
+
+
+def test_unexpected_error_ends_the_entry():
+    prefetcher = Prefetcher(BrokenPool())
+    prefetcher.start("a", "key", chat_payload())
+    entry = prefetcher._entries["key"]
+    thread_done = threading.Event()
+
+    def follow():
+        with pytest.raises(OllamaError, match="bad chunk"):
+            list(entry)
+        thread_done.set()
+
+    threading.Thread(target=follow, daemon=True).start()
+    assert thread_done.wait(2)
+    assert not entry.running
+    assert prefetcher.claim("key") is None
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from backend_pool import BackendPool
+from conftest import MODEL, chat_payload
+from fake_ollama import ANSWER_TOKENS
+from ollama_client import OllamaError
+from request_coalescer import ABANDONED, DONE, FAILED, RequestCoalescer
+from scheduler import RequestScheduler
+
+
+def answer(tokens: int) -> str:
+    return "".join(token + " " for token in ANSWER_TOKENS[:tokens])
+
+
+def test_follower_joining_mid_stream_gets_the_whole_answer(fake_server):
+    fake_server.tokens_per_second = 100
+    coalescer = RequestCoalescer()
+    leader = coalescer.join("key", MODEL)
+    leader.flight.start(BackendPool([fake_server.url]).chat_stream(chat_payload(num_predict=20)))
+    chunks = iter(leader)
+    first = [next(chunks), next(chunks)]
+    follower = coalescer.join("key", MODEL)
+    assert leader.leader and not follower.leader
+    assert "".join(follower) == answer(20)
+    assert "".join(first + list(chunks)) == answer(20)
+    assert follower.flight.state == DONE
+    assert coalescer.stats() == {"in_flight": 0, "subscribers": 0, "led": 1, "joined": 1, "saved_tokens": 20}
+
+
+def test_leader_cancelled_in_the_queue_lets_a_follower_take_over(fake_server):
+    coalescer = RequestCoalescer()
+    leader = coalescer.join("key", MODEL)
+    follower = coalescer.join("key", MODEL)
+    leader.close()
+    assert follower.flight.wait_started(1)
+    assert follower.flight.state == ABANDONED
+    follower.close()
+    # The follower goes its own way and leads a new generation
+    successor = coalescer.join("key", MODEL)
+    assert successor.leader and successor.flight is not follower.flight
+    successor.flight.start(BackendPool([fake_server.url]).chat_stream(chat_payload(num_predict=5)))
+    assert "".join(successor) == answer(5)
+
+
+def test_hand_off_releases_the_slot_once_the_stream_ends(fake_server):
+    fake_server.tokens_per_second = 100
+    scheduler = RequestScheduler(max_concurrent=1)
+    ticket = scheduler.submit("leader", MODEL)
+    coalescer = RequestCoalescer()
+    leader = coalescer.join("key", MODEL)
+    follower = coalescer.join("key", MODEL)
+    leader.flight.start(BackendPool([fake_server.url]).chat_stream(chat_payload(num_predict=20)))
+    released = []
+
+    def release():
+        released.append(ticket)
+        scheduler.release(ticket)
+
+    # The leader's session stops watching, its follower still reads the stream
+    leader.close()
+    assert leader.flight.hand_off(release)
+    assert scheduler.stats()["running"] == {MODEL: 1}
+    assert "".join(follower) == answer(20)
+    follower.close()
+    assert released == [ticket]
+    assert not scheduler.stats()["running"]
+    assert not leader.flight.hand_off(release)
+
+
+def test_last_subscriber_leaving_closes_the_upstream(fake_server):
+    fake_server.tokens_per_second = 20
+    coalescer = RequestCoalescer()
+    leader = coalescer.join("key", MODEL)
+    follower = coalescer.join("key", MODEL)
+    upstream = BackendPool([fake_server.url]).chat_stream(chat_payload(num_predict=100))
+    leader.flight.start(upstream)
+    assert next(iter(follower))
+    leader.close()
+    assert not upstream.closed
+    reader_done = threading.Event()
+
+    def read_rest():
+        list(follower)
+        reader_done.set()
+
+    threading.Thread(target=read_rest, daemon=True).start()
+    follower.close()
+    assert reader_done.wait(2)
+    assert upstream.closed
+    assert follower.flight.state == FAILED
+    assert not follower.flight.running
+
+
+def test_failed_generation_raises_for_every_subscriber(fake_server):
+    fake_server.fail_rate = 1.0
+    coalescer = RequestCoalescer()
+    leader = coalescer.join("key", MODEL)
+    follower = coalescer.join("key", MODEL)
+    leader.flight.start(BackendPool([fake_server.url]).chat_stream(chat_payload()))
+    for subscription in (leader, follower):
+        with pytest.raises(OllamaError, match="injected failure"):
+            list(subscription)
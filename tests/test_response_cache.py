@@ -0,0 +1,55 @@
+from backend_pool import BackendPool
+from conftest import chat_payload, pipeline_request
+from generation_engine import GenerationJob
+from generation_registry import GenerationHandle
+from metrics import RequestTrace
+from response_cache import ResponseCache, cache_key, replay
+from response_pipeline import stream_ollama_response
+
+
+def test_key_covers_model_messages_and_options():
+    payload = chat_payload("Explain this", num_predict=16)
+    assert cache_key(payload) == cache_key(dict(reversed(list(payload.items()))))
+    assert cache_key(payload) != cache_key(chat_payload("Explain that", num_predict=16))
+    assert cache_key(payload) != cache_key(chat_payload("Explain this", num_predict=32))
+    assert cache_key(payload) != cache_key(chat_payload("Explain this", model="other", num_predict=16))
+
+
+def test_stored_answer_survives_a_restart(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(path).put("key", "answer", model="m")
+    cache = ResponseCache(path)
+    assert cache.get("key") == "answer"
+    assert cache.get("other") is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_least_recently_used_answer_is_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_bytes=20)
+    cache.put("a", "x" * 8)
+    cache.put("b", "y" * 8)
+    cache.get("a")
+    cache.put("c", "z" * 8)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 8 and cache.get("c") == "z" * 8
+    cache.put("huge", "w" * 21)
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] <= 20
+
+
+def test_replay_yields_the_whole_answer():
+    assert "".join(replay("abcdefghij" * 10, chunk_chars=7, delay=0)) == "abcdefghij" * 10
+
+
+def test_identical_request_is_replayed_without_ollama(fake_server, tmp_path):
+    pool = BackendPool([fake_server.url])
+    texts = []
+    for _ in range(2):
+        request = pipeline_request(tmp_path, pool)
+        request["cacheable"] = True
+        job = GenerationJob("key", request["session_id"], request["model"], request["prompt"],
+                            GenerationHandle(request["session_id"], request["model"]), RequestTrace(request["model"]))
+        texts.append("".join(stream_ollama_response(request, job)))
+    assert texts[0] == texts[1]
+    assert job.trace.outcome == "cached" and job.stats["cached"]
+    assert fake_server.requests == 1
@@ -0,0 +1,68 @@
+import stat
+import sys
+
+import pytest
+
+from backend_pool import BackendPool
+from cli_worker import CliWorker
+from conftest import pipeline_request
+from generation_engine import GenerationJob
+from generation_registry import GenerationHandle
+from metrics import RequestTrace
+from response_pipeline import stream_ollama_response
+
+# Stands in for `ollama run`, and floods stderr first like a chatty progress display
+FAKE_CLI = f"""#!{sys.executable}
+import sys
+sys.stderr.write("pulling manifest\\n" * 20000)
+sys.stderr.flush()
+prompt = sys.stdin.read()
+sys.stdout.write("answer from the cli")
+"""
+
+
+@pytest.fixture
+def fake_cli(tmp_path):
+    path = tmp_path / "ollama"
+    path.write_text(FAKE_CLI)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    worker = CliWorker(executable=str(path))
+    yield worker
+    worker.shutdown()
+
+
+def run(request: dict) -> tuple:
+    job = GenerationJob("key", request["session_id"], request["model"], request["prompt"],
+                        GenerationHandle(request["session_id"], request["model"]), RequestTrace(request["model"]))
+    return "".join(stream_ollama_response(request, job)), job
+
+
+def test_api_answer(fake_server, tmp_path, fake_cli):
+    request = pipeline_request(tmp_path, BackendPool([fake_server.url]), fake_cli)
+    text, job = run(request)
+    assert text and "cli" not in job.stats
+    assert job.trace.outcome == "ok"
+    assert not request["scheduler"].stats()["running"]
+
+
+def test_falls_back_to_the_cli_when_the_backend_is_down(fake_server, tmp_path, fake_cli):
+    pool = BackendPool([fake_server.url])
+    pool.status(force=True)
+    # The status still says running, the server went away since
+    fake_server.shutdown()
+    fake_server.server_close()
+    pool.backends[0].client.close()
+    request = pipeline_request(tmp_path, pool, fake_cli)
+    text, job = run(request)
+    assert text == "answer from the cli"
+    assert job.stats["cli"] is True
+    assert job.trace.outcome == "cli"
+    assert not request["scheduler"].stats()["running"]
+
+
+def test_reports_both_errors_when_the_cli_fails_too(fake_server, tmp_path):
+    fake_server.fail_rate = 1.0
+    request = pipeline_request(tmp_path, BackendPool([fake_server.url]), CliWorker(executable=str(tmp_path / "missing")))
+    text, job = run(request)
+    assert "Both methods failed" in text and "injected failure" in text
+    assert job.trace.outcome == "error"
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from backend_pool import BackendPool
+from conftest import MODEL, chat_payload
+from ollama_client import OllamaClient
+from scheduler import QueueFull, RequestScheduler
+
+
+def generate(scheduler: RequestScheduler, client: OllamaClient, session_id: str, log: list, lock: threading.Lock):
+    ticket = scheduler.submit(session_id, "qwen2.5-coder:3b")
+    scheduler.wait(ticket)
+    with lock:
+        log.append(("start", session_id))
+    try:
+        list(client.chat_stream(chat_payload(num_predict=4)))
+    finally:
+        with lock:
+            log.append(("end", session_id))
+        scheduler.release(ticket)
+
+
+def test_concurrency_gate_holds_against_slow_backend(fake_server):
+    fake_server.first_token_latency = 0.1
+    client = OllamaClient(fake_server.url)
+    scheduler = RequestScheduler(max_concurrent=2)
+    log, lock = [], threading.Lock()
+    threads = [threading.Thread(target=generate, args=(scheduler, client, f"s{i}", log, lock)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    running = peak = 0
+    for event, _ in log:
+        running += 1 if event == "start" else -1
+        peak = max(peak, running)
+    assert peak == 2
+    assert len(log) == 12
+    stats = scheduler.stats()
+    assert stats["admitted"] == 6 and stats["queue_depth"] == 0 and not stats["running"]
+
+
+def test_free_slot_goes_to_least_recently_served_session():
+    scheduler = RequestScheduler(max_concurrent=1)
+    busy = scheduler.submit("busy", "m")
+    queued_busy = scheduler.submit("busy", "m")
+    other = scheduler.submit("other", "m")
+    assert scheduler.position(other) == 1
+    scheduler.release(busy)
+    assert other.granted is not None and queued_busy.granted is None
+
+
+def test_estimated_wait_follows_service_time():
+    scheduler = RequestScheduler(max_concurrent=1)
+    first = scheduler.submit("a", "m")
+    time.sleep(0.05)
+    scheduler.release(first)
+    holder = scheduler.submit("a", "m")
+    waiting = scheduler.submit("b", "m")
+    assert scheduler.estimated_wait(holder) == 0.0
+    assert 0.0 < scheduler.estimated_wait(waiting) < 1.0
+
+
+def test_deep_queue_is_turned_away_and_withdrawn_tickets_leave_it():
+    scheduler = RequestScheduler(max_concurrent=1, max_queue=2)
+    scheduler.submit("a", "m")
+    waiting = [scheduler.submit("b", "m"), scheduler.submit("c", "m")]
+    with pytest.raises(QueueFull):
+        scheduler.submit("d", "m")
+    scheduler.release(waiting[0])
+    scheduler.submit("d", "m")
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_background_work_leaves_room_for_interactive_requests():
+    scheduler = RequestScheduler(max_concurrent=1, max_queue=4, max_background=2)
+    holder = scheduler.submit("batch", "m", priority=1)
+    batch = [scheduler.submit("batch", "m", priority=1) for _ in range(2)]
+    with pytest.raises(QueueFull):
+        scheduler.submit("batch", "m", priority=1)
+    chat = [scheduler.submit(f"s{i}", "m") for i in range(2)]
+    assert [scheduler.position(t) for t in chat] == [1, 2]
+    scheduler.release(holder)
+    assert chat[0].granted is not None and batch[0].granted is None
+    # With the batch tickets under their cap, the next one is admitted again
+    scheduler.release(batch[0])
+    scheduler.submit("batch", "m", priority=1)
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_slots_scale_with_healthy_backends(make_fake_server):
+    servers = [make_fake_server(), make_fake_server()]
+    pool = BackendPool([s.url for s in servers])
+    scheduler = RequestScheduler(max_concurrent=2, backends=pool.serving)
+    tickets = [scheduler.submit(f"s{i}", MODEL) for i in range(5)]
+    assert [t.granted is not None for t in tickets] == [True] * 4 + [False]
+    assert scheduler.limit("missing:1b") == 2
+
+    # One server goes down, the slots shrink back to one server's worth
+    servers[1].shutdown()
+    servers[1].server_close()
+    pool.backends[1].client.close()
+    pool.backends[1].monitor.refresh()
+    for ticket in tickets[:3]:
+        scheduler.release(ticket)
+    assert scheduler.limit(MODEL) == 2
+    assert tickets[4].granted is not None
+    assert scheduler.stats()["running"] == {MODEL: 2}
@@ -0,0 +1,23 @@
+from concurrent.futures import Future
+
+from static_analysis import StaticAnalyzer, is_blocking
+
+BROKEN = "def broken(:\n    pass\n"
+
+
+def test_findings_are_complete_while_a_worker_is_busy():
+    analyzer = StaticAnalyzer()
+    # A worker that never answers, e.g. one stuck behind a large upload
+    analyzer._pending[analyzer.key("app.py", "abc")] = Future()
+    findings = analyzer.findings("app.py", "abc", lambda: BROKEN, timeout=0.01)
+    assert is_blocking(findings)
+    assert analyzer.findings("app.py", "abc", lambda: "") is findings
+
+
+def test_file_without_a_check_has_no_findings():
+    assert StaticAnalyzer().findings("notes.txt", "abc", lambda: BROKEN) == []
+
+
+def test_unused_import_is_reported():
+    findings = StaticAnalyzer().findings("mod.py", "def", lambda: "import os\nx = 1\n")
+    assert [f["code"] for f in findings] == ["unused-import"]
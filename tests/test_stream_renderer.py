@@ -0,0 +1,65 @@
+from stream_renderer import CURSOR, StreamRenderer, split_closed_blocks
+
+
+class Element:
+    """Stands in for a Streamlit placeholder, keeping what it shows"""
+
+    def __init__(self):
+        self.shown = ""
+
+    def markdown(self, text: str):
+        self.shown = text
+
+    def empty(self):
+        self.shown = ""
+
+
+class Container:
+    def __init__(self):
+        self.elements = []
+
+    def empty(self) -> Element:
+        self.elements.append(Element())
+        return self.elements[-1]
+
+
+def test_blank_line_closes_a_paragraph():
+    text = "First paragraph.\n\nSecond para"
+    assert split_closed_blocks(text) == len("First paragraph.\n\n")
+
+
+def test_open_code_fence_is_not_closed_by_blank_lines():
+    text = "Intro\n\n```python\nx = 1\n\ny = 2\n"
+    assert split_closed_blocks(text) == len("Intro\n\n")
+    closed = text + "```\n"
+    assert split_closed_blocks(closed) == len(closed)
+    assert split_closed_blocks(closed + "More text") == len(closed)
+
+
+def test_tilde_fence_and_unfinished_line():
+    assert split_closed_blocks("~~~\ncode\n~~~\n") == len("~~~\ncode\n~~~\n")
+    assert split_closed_blocks("no newline yet") == 0
+    # A fence whose line is still being written does not count yet
+    assert split_closed_blocks("text\n\n```") == len("text\n\n")
+
+
+def test_renderer_freezes_closed_blocks():
+    container = Container()
+    renderer = StreamRenderer(container, interval=0, min_chars=0)
+    for chunk in ["Para one.\n", "\n```py\n", "x = 1\n", "```\n", "Tail"]:
+        renderer.write(chunk)
+    assert renderer.text == "Para one.\n\n```py\nx = 1\n```\nTail"
+    assert [e.shown for e in container.elements[:-1]] == ["Para one.\n\n", "```py\nx = 1\n```\n"]
+    assert container.elements[-1].shown == "Tail" + CURSOR
+    assert renderer.finish() == renderer.text
+    assert container.elements[-1].shown == "Tail"
+
+
+def test_renderer_waits_for_its_cadence():
+    container = Container()
+    renderer = StreamRenderer(container, interval=60, min_chars=10)
+    renderer.write("abc")
+    assert renderer.renders == 0
+    renderer.write("defghijk")
+    assert renderer.renders == 1
+    assert container.elements[-1].shown == "abcdefghijk" + CURSOR